@@ -0,0 +1,213 @@
+"""Admin global search across users, students, faculty, parents and parent_mapping.
+
+Each collection is queried on its own index, all at once with asyncio.gather,
+so the response takes as long as the slowest query rather than the sum. A
+source that exceeds its timeout is reported in `timed_out` instead of
+holding up the others. Hits for the same person (a user and their student /
+faculty / parent profile, a parent and their mappings) are merged into one
+result, and results are ranked by how exactly they matched.
+
+Users, faculty, parents and parent mappings carry `search_terms`, like
+students do (see student_search.py): prefixes of every word of the name
+("kum" finds "Ravi Kumar"), of the email, and of the phone digits, plus
+"~<digits>" suffix terms so the last digits of a number find it too. A
+multikey index on it serves every kind of query. contact_search_terms builds
+them and is called wherever these documents are written.
+"""
+import asyncio
+import re
+
+from pymongo import UpdateOne
+from pymongo.errors import ExecutionTimeout
+
+from student_search import MAX_PREFIX, email_terms, name_terms, query_terms, search_students
+
+SOURCE_TIMEOUT_SECONDS = 0.5
+PER_SOURCE_LIMIT = 20
+MIN_PHONE_DIGITS = 4
+BACKFILL_BATCH_SIZE = 1000
+
+# source -> type shown to the admin, identity keys, and the display fields
+SOURCES = {
+    "users": {"type": "user", "id": "user_id", "fields": ["user_id", "name", "email", "phone", "role", "is_active"]},
+    "students": {"type": "student", "id": "student_id", "fields": []},
+    "faculty": {"type": "faculty", "id": "faculty_id", "fields": ["faculty_id", "user_id", "name", "email", "phone", "subject"]},
+    "parents": {"type": "parent", "id": "parent_id", "fields": ["parent_id", "user_id", "name", "email", "phone"]},
+    "parent_mapping": {
+        "type": "parent",
+        "id": "parent_id",
+        "fields": ["mapping_id", "parent_id", "student_id", "unique_student_id", "parent_name", "parent_email", "parent_phone", "relationship"]
+    },
+}
+
+# Collection -> (name, email, phone) field names
+CONTACT_FIELDS = {
+    "users": ("name", "email", "phone"),
+    "faculty": ("name", "email", "phone"),
+    "parents": ("name", "email", "phone"),
+    "parent_mapping": ("parent_name", "parent_email", "parent_phone"),
+}
+
+
+async def ensure_admin_search_indexes(db):
+    """
+    Migration step: index search_terms and compute it for existing documents.
+    Search goes only through search_terms, apart from the student ID lookup
+    on parent_mapping, so no per-field name/email/phone indexes are built.
+    """
+    for collection in CONTACT_FIELDS:
+        await db[collection].create_index("search_terms", name="search_terms")
+        await backfill_contact_terms(db, collection)
+    await db.parent_mapping.create_index("unique_student_id")
+
+
+def classify(q: str) -> str:
+    """email, phone or name"""
+    q = q.strip()
+    if "@" in q:
+        return "email"
+    digits = re.sub(r"[\s\-()+]", "", q)
+    if len(digits) >= MIN_PHONE_DIGITS and digits.isdigit():
+        return "phone"
+    return "name"
+
+
+def phone_terms(phone) -> set:
+    """
+    Prefixes of the number as stored and of its last ten digits (so "98765"
+    finds "+91 98765 43210"), and "~"-marked suffixes (so "3210" does too)
+    """
+    digits = re.sub(r"\D", "", str(phone or ""))
+    if len(digits) < MIN_PHONE_DIGITS:
+        return set()
+    terms = set()
+    for number in {digits, digits[-10:]}:
+        terms |= {number[:n] for n in range(MIN_PHONE_DIGITS, min(len(number), MAX_PREFIX) + 1)}
+    terms |= {"~" + digits[-n:] for n in range(MIN_PHONE_DIGITS, min(len(digits), MAX_PREFIX) + 1)}
+    return terms
+
+
+def contact_search_terms(collection: str, doc: dict) -> list:
+    """search_terms for a users / faculty / parents / parent_mapping document"""
+    name, email, phone = CONTACT_FIELDS[collection]
+    return sorted(name_terms(doc.get(name)) | email_terms(doc.get(email)) | phone_terms(doc.get(phone)))
+
+
+def _prefix(text: str):
+    return re.compile("^" + re.escape(text))
+
+
+def terms_condition(q: str, kind: str) -> dict:
+    """search_terms condition: every word for names and emails, prefix or suffix for phone digits"""
+    if kind == "phone":
+        digits = re.sub(r"\D", "", q)[:MAX_PREFIX]
+        return {"$in": [digits, "~" + digits]}
+    return {"$all": query_terms(q)}
+
+
+def source_query(collection: str, q: str, kind: str) -> dict:
+    condition = {"search_terms": terms_condition(q, kind)}
+    if collection == "parent_mapping" and kind == "name":
+        # Parents often search by their child's student ID
+        return {"$or": [condition, {"unique_student_id": _prefix(q.strip().upper())}]}
+    return condition
+
+
+async def backfill_contact_terms(db, collection: str):
+    """Compute search_terms for the existing documents of `collection`, in batches"""
+    fields = CONTACT_FIELDS[collection]
+    operations = []
+    async for doc in db[collection].find({}, {"_id": 1, **{field: 1 for field in fields}}):
+        operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"search_terms": contact_search_terms(collection, doc)}}))
+        if len(operations) >= BACKFILL_BATCH_SIZE:
+            await db[collection].bulk_write(operations, ordered=False)
+            operations = []
+    if operations:
+        await db[collection].bulk_write(operations, ordered=False)
+
+
+def match_score(value, q: str) -> int:
+    """0 exact, 1 prefix, 2 anything else (case-insensitive)"""
+    value, q = str(value or "").lower(), q.strip().lower()
+    if value == q:
+        return 0
+    return 1 if value.startswith(q) else 2
+
+
+async def _query_source(db, collection: str, q: str, kind: str):
+    if collection == "students":
+        return await search_students(db, q, PER_SOURCE_LIMIT)
+    projection = {"_id": 0, **{field: 1 for field in SOURCES[collection]["fields"]}}
+    cursor = db[collection].find(source_query(collection, q, kind), projection)
+    # Stop the server-side work too, not only the wait for it
+    cursor = cursor.limit(PER_SOURCE_LIMIT).max_time_ms(int(SOURCE_TIMEOUT_SECONDS * 1000))
+    return await cursor.to_list(PER_SOURCE_LIMIT)
+
+
+async def gather_with_timeouts(calls: dict, timeout: float):
+    """
+    Run {name: coroutine} concurrently. Returns (results, timed_out, failed):
+    results maps name -> value for the calls that finished in time.
+    """
+    names = list(calls)
+    outcomes = await asyncio.gather(
+        *(asyncio.wait_for(calls[name], timeout) for name in names), return_exceptions=True
+    )
+    results, timed_out, failed = {}, [], []
+    for name, outcome in zip(names, outcomes):
+        if isinstance(outcome, (asyncio.TimeoutError, ExecutionTimeout)):
+            timed_out.append(name)
+        elif isinstance(outcome, Exception):
+            failed.append(name)
+        else:
+            results[name] = outcome
+    return results, timed_out, failed
+
+
+def _identity_keys(collection: str, row: dict) -> list:
+    keys = [(SOURCES[collection]["type"], row.get(SOURCES[collection]["id"]))]
+    if row.get("user_id"):
+        keys.append(("user", row["user_id"]))
+    return [key for key in keys if key[1]]
+
+
+def _display(collection: str, row: dict) -> dict:
+    if collection == "parent_mapping":
+        return {"name": row.get("parent_name"), "email": row.get("parent_email"), "phone": row.get("parent_phone")}
+    return {"name": row.get("name"), "email": row.get("email"), "phone": row.get("phone")}
+
+
+def merge_results(source_rows: dict, q: str, kind: str, limit: int) -> list:
+    """One entry per person, best match first; profile types win over bare user accounts"""
+    entries, by_key = [], {}
+    for collection in SOURCES:
+        for row in source_rows.get(collection) or []:
+            keys = _identity_keys(collection, row)
+            display = _display(collection, row)
+            fields = [display[kind]] if kind != "name" else [display["name"], row.get("unique_student_id"), row.get("admission_number")]
+            score = min(match_score(value, q) for value in fields if value is not None) if any(fields) else 2
+            entry = next((by_key[key] for key in keys if key in by_key), None)
+            if entry is None:
+                entry = {"type": SOURCES[collection]["type"], **display, "score": score, "matched_in": [], "records": {}}
+                entries.append(entry)
+            elif entry["type"] == "user" and SOURCES[collection]["type"] != "user":
+                entry.update(type=SOURCES[collection]["type"], **{k: v for k, v in display.items() if v})
+            entry["score"] = min(entry["score"], score)
+            if collection not in entry["matched_in"]:
+                entry["matched_in"].append(collection)
+            entry["records"].setdefault(collection, []).append(row)
+            for key in keys:
+                by_key.setdefault(key, entry)
+    entries.sort(key=lambda e: (e["score"], e["type"] == "user", (e.get("name") or "").lower()))
+    return entries[:limit]
+
+
+async def global_search(db, q: str, limit: int = 20) -> dict:
+    kind = classify(q)
+    # Students have no phone; their name, ID and email prefixes go through search_terms
+    sources = [name for name in SOURCES if name != "students" or kind != "phone"]
+    rows, timed_out, failed = await gather_with_timeouts(
+        {name: _query_source(db, name, q, kind) for name in sources}, SOURCE_TIMEOUT_SECONDS
+    )
+    items = merge_results(rows, q, kind, limit)
+    return {"query": q, "kind": kind, "items": items, "count": len(items), "timed_out": timed_out, "failed": failed}
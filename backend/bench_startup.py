@@ -0,0 +1,133 @@
+"""Measure worker cold start: per-module import time and time to first /health.
+
+Each run appends a record to startup_bench.jsonl (one JSON object per line)
+and prints the change against the previous record, so regressions show up
+as dependencies or startup work are added.
+
+Usage: python bench_startup.py [--runs 3] [--top 15] [--history startup_bench.jsonl]
+"""
+import argparse
+import json
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent
+
+
+def measure_imports(module: str = "server"):
+    """Run `python -X importtime -c 'import server'` and return {module: cumulative_ms}"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        _, cumulative_us, name = line.split("|")
+        if not cumulative_us.strip().isdigit():
+            continue  # header line
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((depth, name.strip(), int(cumulative_us) / 1000))
+
+    # importtime prints children before their parent: walk back from the
+    # top-level module and keep its direct imports, skipping interpreter startup
+    cumulative = {}
+    for depth, name, ms in reversed(entries):
+        if depth == 0:
+            if name != module:
+                break
+            cumulative["<total>"] = ms
+        elif depth == 1 and "<total>" in cumulative:
+            cumulative[name] = ms
+    return cumulative
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_first_health(timeout: float = 60.0):
+    """Spawn uvicorn and return milliseconds until /health first answers 200"""
+    port = _free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError("uvicorn exited before serving /health")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as resp:
+                    if resp.status == 200:
+                        return (time.perf_counter() - started) * 1000
+            except OSError:
+                time.sleep(0.02)
+        raise RuntimeError(f"/health did not answer within {timeout}s")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def _git_rev():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--history", default=str(ROOT_DIR / "startup_bench.jsonl"))
+    args = parser.parse_args()
+
+    import_runs = [measure_imports() for _ in range(args.runs)]
+    modules = {name: statistics.median(run.get(name, 0) for run in import_runs) for name in import_runs[0]}
+    health_ms = statistics.median(measure_first_health() for _ in range(args.runs))
+
+    record = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_rev": _git_rev(),
+        "python": sys.version.split()[0],
+        "import_total_ms": round(modules.pop("<total>", 0), 1),
+        "first_health_ms": round(health_ms, 1),
+        "modules_ms": {name: round(ms, 1) for name, ms in sorted(modules.items(), key=lambda kv: -kv[1])[:args.top]}
+    }
+
+    history = Path(args.history)
+    previous = None
+    if history.exists():
+        lines = [line for line in history.read_text().splitlines() if line.strip()]
+        previous = json.loads(lines[-1]) if lines else None
+    with history.open("a") as f:
+        f.write(json.dumps(record) + "\n")
+
+    def delta(key):
+        if not previous or key not in previous:
+            return ""
+        return f" ({record[key] - previous[key]:+.1f} ms vs {previous.get('git_rev')})"
+
+    print(f"import server:   {record['import_total_ms']:8.1f} ms{delta('import_total_ms')}")
+    print(f"first /health:   {record['first_health_ms']:8.1f} ms{delta('first_health_ms')}")
+    print("slowest direct imports:")
+    for name, ms in record["modules_ms"].items():
+        print(f"  {name:<30} {ms:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Benchmark the /api/students page query before and after embedding fee summaries.
+
+Seeds a scratch database with N students and their fee_tracking rows, then
+times one directory page (and one "PARTIAL, largest pending first" page)
+three ways:
+
+    per_student  one find_one on fee_tracking per listed student (the original endpoint)
+    lookup       students page + $lookup of fee_tracking (the aggregation join)
+    embedded     one find on students using the embedded summary (current endpoint)
+
+per_student is the "before" and embedded the "after": each run prints the
+speedup and appends its timings to students_bench.jsonl, so the numbers of a
+deployment are kept next to the revision they were measured on. The scratch
+database (<MONGO_DB_NAME>_bench by default) is dropped afterwards unless
+--keep is given.
+
+Usage: python bench_students.py [--students 50000] [--limit 100] [--runs 20] [--db NAME] [--keep] [--history students_bench.jsonl]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from bench_startup import _git_rev
+from fee_summary import SUMMARY_FIELDS, ensure_fee_summary_indexes, summary_of
+from query_filters import ensure_list_indexes
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+STATUSES = ("PENDING", "PARTIAL", "PAID")
+SUMMARY_PROJECTION = {"_id": 0, **{field: 1 for field in SUMMARY_FIELDS}}
+
+
+async def seed(db, count: int):
+    await db.students.create_index("student_id", unique=True)
+    await db.fee_tracking.create_index("student_id")
+    await ensure_list_indexes(db)
+    await ensure_fee_summary_indexes(db)
+    for start in range(0, count, 5000):
+        students, trackings = [], []
+        for i in range(start, min(start + 5000, count)):
+            total = 5000.0 * (i % 10 + 1)
+            paid = [0.0, total / 2, total][i % 3]
+            tracking = {
+                "tracking_id": f"track_{i:07d}", "student_id": f"stu_{i:07d}", "class_name": str(i % 10 + 1), "section": "ABC"[i % 3],
+                "total_fee_amount": total, "paid_amount": paid, "pending_amount": total - paid, "payment_status": STATUSES[i % 3]
+            }
+            trackings.append(tracking)
+            students.append({
+                "student_id": tracking["student_id"], "name": f"Student {i:07d}", "class_name": tracking["class_name"],
+                "section": tracking["section"], "academic_year": "2026-2027", **summary_of(tracking)
+            })
+        await db.students.insert_many(students)
+        await db.fee_tracking.insert_many(trackings)
+
+
+async def per_student(db, query: dict, sort, limit: int):
+    students = await db.students.find(query, {"_id": 0}).sort(sort).limit(limit).to_list(limit)
+    for student in students:
+        student.update(await db.fee_tracking.find_one({"student_id": student["student_id"]}, SUMMARY_PROJECTION) or {})
+    return students
+
+
+async def lookup(db, query: dict, sort, limit: int):
+    pipeline = [
+        {"$match": query}, {"$sort": dict(sort)}, {"$limit": limit},
+        {"$lookup": {
+            "from": "fee_tracking", "localField": "student_id", "foreignField": "student_id",
+            "pipeline": [{"$project": SUMMARY_PROJECTION}, {"$limit": 1}], "as": "fee"
+        }},
+        {"$replaceRoot": {"newRoot": {"$mergeObjects": ["$$ROOT", {"$ifNull": [{"$first": "$fee"}, {}]}]}}},
+        {"$project": {"_id": 0, "fee": 0}}
+    ]
+    return await db.students.aggregate(pipeline).to_list(limit)
+
+
+async def embedded(db, query: dict, sort, limit: int):
+    return await db.students.find(query, {"_id": 0}).sort(sort).limit(limit).to_list(limit)
+
+
+async def fee_ordered_lookup(db, query: dict, sort, limit: int):
+    """Payment filters before embedding: drive from fee_tracking, then join students"""
+    pipeline = [
+        {"$match": query}, {"$sort": dict(sort)}, {"$limit": limit},
+        {"$lookup": {"from": "students", "localField": "student_id", "foreignField": "student_id", "as": "student"}},
+        {"$unwind": "$student"}
+    ]
+    return await db.fee_tracking.aggregate(pipeline).to_list(limit)
+
+
+async def timed(fn, runs: int, *args):
+    await fn(*args)  # warm up
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        await fn(*args)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), max(samples)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=50000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--db", default=(os.getenv("MONGO_DB_NAME") or "smart_school_db") + "_bench")
+    parser.add_argument("--keep", action="store_true")
+    parser.add_argument("--history", default=str(ROOT_DIR / "students_bench.jsonl"))
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(os.getenv("MONGODB_URI") or os.environ["MONGO_URL"])
+    db = client[args.db]
+    try:
+        if await db.students.estimated_document_count() != args.students:
+            await client.drop_database(args.db)
+            await seed(db, args.students)
+
+        page = ({"class_name": "7"}, [("name", 1), ("student_id", 1)])
+        owing = ({"payment_status": "PARTIAL"}, [("pending_amount", -1), ("student_id", -1)])
+        cases = [
+            ("class 7 by name", "per_student", per_student, page),
+            ("class 7 by name", "lookup", lookup, page),
+            ("class 7 by name", "embedded", embedded, page),
+            ("PARTIAL by -pending", "lookup", fee_ordered_lookup, owing),
+            ("PARTIAL by -pending", "embedded", embedded, owing),
+        ]
+        print(f"{args.students} students, page of {args.limit}, median/max of {args.runs} runs")
+        results = {}
+        for label, variant, fn, (query, sort) in cases:
+            median, worst = await timed(fn, args.runs, db, query, sort, args.limit)
+            results.setdefault(label, {})[variant] = {"median_ms": round(median, 2), "max_ms": round(worst, 2)}
+            print(f"  {label:<22} {variant:<12} {median:8.2f} ms  (max {worst:.2f})")
+        for label, variants in results.items():
+            before = variants.get("per_student") or variants["lookup"]
+            print(f"  {label:<22} embedded is {before['median_ms'] / max(variants['embedded']['median_ms'], 0.01):.1f}x faster")
+        record = {
+            "timestamp": datetime.now(timezone.utc).isoformat(), "git_rev": _git_rev(),
+            "students": args.students, "limit": args.limit, "runs": args.runs, "results": results
+        }
+        with Path(args.history).open("a") as f:
+            f.write(json.dumps(record) + "\n")
+    finally:
+        if not args.keep:
+            await client.drop_database(args.db)
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
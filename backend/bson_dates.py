@@ -0,0 +1,116 @@
+"""Rewrite ISO-string timestamps as BSON dates.
+
+Timestamps used to be stored as ISO strings (get_current_timestamp returned
+isoformat()), which made range queries string comparisons and ruled out TTL
+indexes and $dateTrunc bucketing. New writes store datetimes; this migration
+converts existing documents, TIMESTAMP_FIELDS per collection.
+
+Documents are walked in _id order in batches and only those still holding a
+string in one of the fields are rewritten, so the step is idempotent: if it
+is interrupted, the next run picks up the documents that are left. Index
+entries are rewritten together with each document, so the type change needs
+no index drop; the timestamp-keyed indexes are then ensured, since older
+deployments created some of them only through init_db.py.
+"""
+import logging
+
+from pymongo import UpdateOne
+
+from utils import parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+_FEE_TRACKING_FIELDS = ["created_at", "updated_at", "last_payment_date", "payment_history.date"]
+
+TIMESTAMP_FIELDS = {
+    "users": ["created_at"],
+    "students": ["created_at", "admission_date", "updated_at", "fee_updated_at", "graduated_at"],
+    "faculty": ["created_at", "joining_date"],
+    "parents": ["created_at"],
+    "parent_mapping": ["created_at"],
+    "attendance": ["date", "created_at"],
+    "marks": ["created_at", "updated_at"],
+    "fees": ["created_at"],
+    "fee_structures": ["created_at", "updated_at"],
+    "fee_tracking": _FEE_TRACKING_FIELDS,
+    "fee_tracking_archive": _FEE_TRACKING_FIELDS + ["archived_at"],
+    "fee_installments": ["created_at"],
+    "payments": ["payment_date", "created_at"],
+    "payment_events": ["received_at", "claimed_at", "processed_at"],
+    "jobs": ["created_at", "updated_at", "started_at", "finished_at"],
+    "classes": ["created_at"],
+    "sections": ["created_at"],
+    "announcements": ["created_at"],
+    "notifications": ["created_at"],
+    "timetable": ["created_at"],
+    "schema_migrations": ["applied_at"],
+}
+
+
+def _string_filter(fields) -> dict:
+    return {"$or": [{field: {"$type": "string"}} for field in fields]}
+
+
+def converted_fields(doc: dict, fields) -> dict:
+    """$set for the string timestamps in `doc`; values that do not parse are left alone"""
+    update = {}
+    for field in fields:
+        if "." in field:
+            array, key = field.split(".", 1)
+            entries = doc.get(array)
+            if isinstance(entries, list) and any(isinstance((e or {}).get(key), str) for e in entries if isinstance(e, dict)):
+                update[array] = [
+                    {**entry, key: _parse_or_keep(entry.get(key))} if isinstance(entry, dict) else entry
+                    for entry in entries
+                ]
+        elif isinstance(doc.get(field), str):
+            parsed = _parse_or_keep(doc[field])
+            if parsed is not doc[field]:
+                update[field] = parsed
+    return update
+
+
+def _parse_or_keep(value):
+    if not isinstance(value, str):
+        return value
+    try:
+        return parse_timestamp(value)
+    except ValueError:
+        return value
+
+
+async def convert_collection(db, name: str, fields) -> int:
+    collection = db[name]
+    projection = {field.split(".")[0]: 1 for field in fields}
+    last_id, converted = None, 0
+    while True:
+        query = _string_filter(fields)
+        if last_id is not None:
+            query = {"$and": [{"_id": {"$gt": last_id}}, query]}
+        docs = await collection.find(query, projection).sort("_id", 1).limit(BATCH_SIZE).to_list(BATCH_SIZE)
+        if not docs:
+            return converted
+        operations = []
+        for doc in docs:
+            update = converted_fields(doc, fields)
+            if update:
+                operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": update}))
+        if operations:
+            await collection.bulk_write(operations, ordered=False)
+            converted += len(operations)
+        last_id = docs[-1]["_id"]
+
+
+async def convert_timestamps(db):
+    """Migration step: every collection in TIMESTAMP_FIELDS, then the timestamp-keyed indexes"""
+    for name, fields in TIMESTAMP_FIELDS.items():
+        converted = await convert_collection(db, name, fields)
+        if converted:
+            logger.info(f"Converted timestamps to dates in {converted} {name} documents")
+    await db.attendance.create_index([("student_id", 1), ("date", 1)])
+    await db.announcements.create_index([("target_roles", 1), ("created_at", -1)])
+    await db.jobs.create_index([("kind", 1), ("created_at", -1)])
+    await db.payment_events.create_index([("status", 1), ("received_at", 1)])
+    await db.payments.create_index([("student_id", 1), ("payment_date", -1), ("payment_id", -1)], name="student_payment_history")
@@ -0,0 +1,106 @@
+"""Cascade deletes for students and faculty.
+
+All per-collection deletes for a batch of records are issued at once. On a
+replica set they run inside one transaction, so a crash never leaves half a
+student behind. A session cannot carry concurrent operations, so inside the
+transaction they are sent one after another. On a standalone server, where
+transactions are unavailable, they run concurrently with asyncio.gather.
+
+Attendance grows with every school day, so it is not deleted inline; it is
+purged afterwards in batches by a background job (see jobs.py).
+"""
+import asyncio
+
+from counters import release_students_roll_numbers
+from jobs import report_progress
+
+PURGE_BATCH_SIZE = 5000
+
+_transactions_supported = None
+
+
+async def supports_transactions(db) -> bool:
+    """True when connected to a replica set or sharded cluster (checked once per process)"""
+    global _transactions_supported
+    if _transactions_supported is None:
+        hello = await db.command("hello")
+        _transactions_supported = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+    return _transactions_supported
+
+
+async def _apply(db, operations):
+    """Run `operation(session)` for each operation, transactionally when possible"""
+    if await supports_transactions(db):
+        async with await db.client.start_session() as session:
+            async with session.start_transaction():
+                for operation in operations:
+                    await operation(session)
+    else:
+        await asyncio.gather(*(operation(None) for operation in operations))
+
+
+async def delete_students(db, student_ids):
+    """
+    Delete students with their user accounts, fee tracking and installments,
+    payments, marks, notifications and parent links, and give their roll
+    numbers back to their sections. Returns (results, deleted_ids);
+    attendance for `deleted_ids` is left for purge_attendance.
+    """
+    student_ids = list(dict.fromkeys(student_ids))
+    students = await db.students.find(
+        {"student_id": {"$in": student_ids}},
+        {"_id": 0, "student_id": 1, "unique_student_id": 1, "user_id": 1, "academic_year": 1, "class_name": 1, "section": 1, "roll_number": 1}
+    ).to_list(len(student_ids))
+    found = [s["student_id"] for s in students]
+    if found:
+        user_ids = [s["user_id"] for s in students if s.get("user_id")]
+        unique_ids = [s["unique_student_id"] for s in students if s.get("unique_student_id") not in (None, "PENDING")]
+        by_student = {"student_id": {"$in": found}}
+        await _apply(db, [
+            lambda session: db.students.delete_many(by_student, session=session),
+            lambda session: db.fee_tracking.delete_many(by_student, session=session),
+            lambda session: db.fee_installments.delete_many(by_student, session=session),
+            lambda session: db.payments.delete_many(by_student, session=session),
+            lambda session: db.marks.delete_many(by_student, session=session),
+            lambda session: db.parent_mapping.delete_many(
+                {"$or": [by_student, {"unique_student_id": {"$in": unique_ids}}]}, session=session
+            ),
+            lambda session: db.notifications.delete_many({"user_id": {"$in": user_ids}}, session=session),
+            lambda session: db.users.delete_many({"user_id": {"$in": user_ids}}, session=session),
+        ])
+        await release_students_roll_numbers(db, students)
+    results = [{"student_id": sid, "status": "deleted" if sid in found else "not_found"} for sid in student_ids]
+    return results, found
+
+
+async def delete_faculty_members(db, faculty_ids):
+    """Delete faculty records with their user accounts and notifications; returns per-ID results"""
+    faculty_ids = list(dict.fromkeys(faculty_ids))
+    faculty = await db.faculty.find(
+        {"faculty_id": {"$in": faculty_ids}}, {"_id": 0, "faculty_id": 1, "user_id": 1}
+    ).to_list(len(faculty_ids))
+    found = [f["faculty_id"] for f in faculty]
+    if found:
+        user_ids = [f["user_id"] for f in faculty if f.get("user_id")]
+        await _apply(db, [
+            lambda session: db.faculty.delete_many({"faculty_id": {"$in": found}}, session=session),
+            lambda session: db.notifications.delete_many({"user_id": {"$in": user_ids}}, session=session),
+            lambda session: db.users.delete_many({"user_id": {"$in": user_ids}}, session=session),
+        ])
+    return [{"faculty_id": fid, "status": "deleted" if fid in found else "not_found"} for fid in faculty_ids]
+
+
+async def purge_attendance(db, job):
+    """Job handler: delete attendance for params.student_ids in batches, reporting progress"""
+    by_student = {"student_id": {"$in": job["params"]["student_ids"]}}
+    done = (job.get("progress") or {}).get("done") or 0
+    total = done + await db.attendance.count_documents(by_student)
+    await report_progress(db, job["job_id"], done=done, total=total)
+    while True:
+        batch = await db.attendance.find(by_student, {"_id": 1}).limit(PURGE_BATCH_SIZE).to_list(PURGE_BATCH_SIZE)
+        if not batch:
+            break
+        result = await db.attendance.delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}})
+        done += result.deleted_count
+        await report_progress(db, job["job_id"], done=done)
+    return {"attendance_deleted": done}
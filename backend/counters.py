@@ -0,0 +1,138 @@
+"""Atomic per-section roll-number allocation.
+
+One document per (academic_year, class, section) in `counters` lists the roll
+numbers in use in `taken`. A reservation takes the lowest free numbers in
+1..capacity with a single pipeline find_one_and_update, so concurrent
+registrations never see the same number, a full section is detected in the
+same operation, and numbers given back are handed out again: capacity is
+the size of the section, not how many numbers were ever issued.
+
+Numbers are given back with release_roll_numbers when a student leaves the
+section (deleted, moved) or the write that would have used them fails.
+seed_roll_counters rebuilds every counter from the roster.
+
+The roster's unique index is (academic_year, class_name, section,
+roll_number), the same key as the counters, so each year numbers from 1
+without colliding with students still recorded under another year.
+"""
+from pymongo import ReturnDocument, UpdateOne
+
+SECTION_CAPACITY = 20
+
+
+class SectionFullError(Exception):
+    pass
+
+
+def roll_counter_id(academic_year: str, class_name: str, section: str) -> str:
+    return f"roll:{academic_year}:{class_name}:{section}"
+
+
+def _full(class_name, section, capacity):
+    return SectionFullError(f"Section {section} of class {class_name} is full (max {capacity} students)")
+
+
+def _reserve_pipeline(academic_year, class_name, section, count, capacity, partial):
+    free = {"$filter": {
+        "input": {"$literal": list(range(1, capacity + 1))},
+        "as": "n",
+        "cond": {"$not": [{"$in": ["$$n", "$taken"]}]}
+    }}
+    picked = {"$slice": [free, count]}
+    if not partial:
+        # All or nothing: leave the counter untouched when fewer than `count` are free
+        picked = {"$cond": [{"$gte": [{"$size": free}, count]}, picked, []]}
+    return [
+        {"$set": {
+            "taken": {"$ifNull": ["$taken", []]},
+            "academic_year": academic_year, "class_name": class_name, "section": section
+        }},
+        {"$set": {"reserved": picked}},
+        {"$set": {"taken": {"$concatArrays": ["$taken", "$reserved"]}}}
+    ]
+
+
+async def _reserve(db, academic_year, class_name, section, count, capacity, partial):
+    counter = await db.counters.find_one_and_update(
+        {"_id": roll_counter_id(academic_year, class_name, section)},
+        _reserve_pipeline(academic_year, class_name, section, count, capacity, partial),
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return list(counter["reserved"])
+
+
+async def reserve_roll_numbers(db, academic_year: str, class_name: str, section: str, count: int = 1, capacity: int = SECTION_CAPACITY):
+    """
+    Reserve `count` free roll numbers (lowest first) and return them as a list.
+    Raises SectionFullError when fewer than `count` numbers are free.
+    """
+    if count < 1 or count > capacity:
+        raise _full(class_name, section, capacity)
+    reserved = await _reserve(db, academic_year, class_name, section, count, capacity, partial=False)
+    if len(reserved) < count:
+        raise _full(class_name, section, capacity)
+    return reserved
+
+
+async def reserve_available_roll_numbers(db, academic_year: str, class_name: str, section: str, count: int, capacity: int = SECTION_CAPACITY):
+    """Reserve up to `count` roll numbers, fewer if the section is nearly full; empty when full"""
+    if count < 1:
+        return []
+    return await _reserve(db, academic_year, class_name, section, min(count, capacity), capacity, partial=True)
+
+
+def _as_int(roll_number):
+    return int(roll_number) if str(roll_number or "").isdigit() else None
+
+
+async def release_roll_numbers(db, academic_year: str, class_name: str, section: str, roll_numbers):
+    """Give numbers back to the section, e.g. after a failed insert"""
+    numbers = [n for n in (_as_int(r) for r in roll_numbers) if n is not None]
+    if numbers:
+        await db.counters.update_one(
+            {"_id": roll_counter_id(academic_year, class_name, section)}, {"$pull": {"taken": {"$in": numbers}}}
+        )
+
+
+async def release_students_roll_numbers(db, students):
+    """Give back the roll numbers of students leaving their section; one update per section"""
+    by_section = {}
+    for student in students:
+        if student.get("class_name") and student.get("section") and _as_int(student.get("roll_number")) is not None:
+            key = (student.get("academic_year"), student["class_name"], student["section"])
+            by_section.setdefault(key, []).append(student["roll_number"])
+    for (academic_year, class_name, section), roll_numbers in by_section.items():
+        await release_roll_numbers(db, academic_year, class_name, section, roll_numbers)
+
+
+async def seed_roll_counters(db):
+    """Rebuild every section's `taken` list from the roll numbers actually assigned"""
+    pipeline = [
+        {"$match": {"unique_student_id": {"$ne": "PENDING"}, "roll_number": {"$type": "string"}, "class_name": {"$ne": None}}},
+        {"$group": {
+            "_id": {"academic_year": "$academic_year", "class_name": "$class_name", "section": "$section"},
+            "taken": {"$addToSet": {"$convert": {"input": "$roll_number", "to": "int", "onError": None, "onNull": None}}}
+        }}
+    ]
+    operations, seen = [], []
+    async for group in db.students.aggregate(pipeline, allowDiskUse=True):
+        key = group["_id"]
+        counter_id = roll_counter_id(key.get("academic_year"), key["class_name"], key["section"])
+        seen.append(counter_id)
+        operations.append(UpdateOne(
+            {"_id": counter_id},
+            {
+                "$set": {"taken": sorted(n for n in group["taken"] if n is not None)},
+                "$unset": {"seq": ""},
+                "$setOnInsert": {"academic_year": key.get("academic_year"), "class_name": key["class_name"], "section": key["section"]}
+            },
+            upsert=True
+        ))
+    if operations:
+        await db.counters.bulk_write(operations, ordered=False)
+    # Sections nobody is in any more
+    await db.counters.update_many(
+        {"_id": {"$regex": "^roll:", "$nin": seen}}, {"$set": {"taken": []}, "$unset": {"seq": ""}}
+    )
+
@@ -17,7 +17,7 @@ async def create_admin():
             'name': 'School Administrator',
             'role': 'ADMIN',
             'is_active': True,
-            'created_at': datetime.now(timezone.utc).isoformat()
+            'created_at': datetime.now(timezone.utc)
         }
         await db.users.insert_one(admin_doc)
         print('Admin user created: admin@sadhana.edu / admin123')
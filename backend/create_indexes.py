@@ -1,19 +1,19 @@
 """Run this script to create indexes for classes/sections/fee_structures.
 Usage: python create_indexes.py
 """
-from motor.motor_asyncio import AsyncIOMotorClient
 from pathlib import Path
 from dotenv import load_dotenv
-import os
+from database import LazyDatabase, db_name_warning, mongo_settings
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+db = LazyDatabase()
 
 async def create_indexes():
+    warning = db_name_warning(mongo_settings())
+    if warning:
+        print(f'Warning: {warning}')
     print('Creating indexes...')
     # unique class name
     await db.classes.create_index('name', unique=True)
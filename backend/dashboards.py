@@ -0,0 +1,266 @@
+"""Aggregate dashboard payloads.
+
+Each dashboard is a handful of independent parts (fees, attendance, marks,
+timetable, ...). Parts are fetched for all the students involved at once,
+with one query per part rather than one per student, and the parts run
+concurrently under their own timeout. A part that times out or fails comes
+back as None and is named in `timed_out` / `failed`, so the rest of the page
+still renders.
+
+The student dashboard also tags every part with its own ETag. A client that
+sends the tags it holds in If-None-Match gets those parts back as
+{"etag", "unchanged": true} without their data, and a 304 when nothing
+changed at all.
+"""
+import hashlib
+import json
+from datetime import datetime, timezone
+
+from admin_search import gather_with_timeouts
+from fee_summary import SUMMARY_FIELDS
+from utils import academic_year_of, calculate_percentage
+
+PART_TIMEOUT_SECONDS = 1.0
+RECENT_MARKS = 5
+MAX_CHILDREN = 20
+RECENT_ANNOUNCEMENTS = 5
+
+CHILD_PROJECTION = {
+    "_id": 0, "student_id": 1, "unique_student_id": 1, "name": 1, "class_name": 1, "section": 1,
+    "roll_number": 1, "academic_year": 1, "student_photo_url": 1, **{field: 1 for field in SUMMARY_FIELDS}
+}
+
+PROFILE_FIELDS = (
+    "student_id", "unique_student_id", "name", "email", "class_name", "section",
+    "roll_number", "admission_number", "academic_year", "student_photo_url"
+)
+STUDENT_PROJECTION = {"_id": 0, **{field: 1 for field in PROFILE_FIELDS + SUMMARY_FIELDS}}
+
+
+async def ensure_dashboard_indexes(db):
+    await db.marks.create_index([("student_id", 1), ("created_at", -1)])
+    await db.timetable.create_index([("class_name", 1), ("section", 1), ("day", 1)])
+
+
+def _max_time_ms() -> int:
+    return int(PART_TIMEOUT_SECONDS * 1000)
+
+
+def today_name(now: datetime = None) -> str:
+    return (now or datetime.now(timezone.utc)).strftime("%A")
+
+
+async def fee_part(students: list) -> dict:
+    """Fee summaries are embedded on the student documents already (see fee_summary.py)"""
+    return {s["student_id"]: {field: s.get(field) for field in SUMMARY_FIELDS} for s in students}
+
+
+async def attendance_part(db, student_ids: list) -> dict:
+    """student_id -> {total_days, present_days, percentage}"""
+    pipeline = [
+        {"$match": {"student_id": {"$in": student_ids}}},
+        {"$group": {
+            "_id": "$student_id",
+            "total_days": {"$sum": 1},
+            "present_days": {"$sum": {"$cond": [{"$eq": ["$status", "PRESENT"]}, 1, 0]}}
+        }}
+    ]
+    result = {sid: {"total_days": 0, "present_days": 0, "percentage": 0} for sid in student_ids}
+    async for row in db.attendance.aggregate(pipeline, maxTimeMS=_max_time_ms()):
+        result[row["_id"]] = {
+            "total_days": row["total_days"],
+            "present_days": row["present_days"],
+            "percentage": calculate_percentage(row["present_days"], row["total_days"])
+        }
+    return result
+
+
+async def recent_marks_part(db, student_ids: list, limit: int = RECENT_MARKS) -> dict:
+    """student_id -> latest `limit` marks, newest first"""
+    pipeline = [
+        {"$match": {"student_id": {"$in": student_ids}}},
+        {"$sort": {"student_id": 1, "created_at": -1}},
+        {"$project": {"_id": 0, "student_id": 1, "subject": 1, "exam_name": 1, "exam_date": 1,
+                      "marks_obtained": 1, "total_marks": 1, "grade": 1}},
+        {"$group": {"_id": "$student_id", "marks": {"$push": "$$ROOT"}}},
+        {"$project": {"marks": {"$slice": ["$marks", limit]}}}
+    ]
+    result = {sid: [] for sid in student_ids}
+    async for row in db.marks.aggregate(pipeline, maxTimeMS=_max_time_ms()):
+        result[row["_id"]] = [{k: v for k, v in mark.items() if k != "student_id"} for mark in row["marks"]]
+    return result
+
+
+async def timetable_part(db, students: list, day: str) -> dict:
+    """student_id -> the periods of `day` for the student's class and section"""
+    classes = {(s.get("class_name"), s.get("section")) for s in students if s.get("class_name")}
+    periods = {}
+    if classes:
+        query = {"$or": [{"class_name": c, "section": sec} for c, sec in classes]}
+        async for entry in db.timetable.find(query, {"_id": 0, "class_name": 1, "section": 1, "day": 1, "periods": 1}).max_time_ms(_max_time_ms()):
+            if str(entry.get("day", "")).strip().lower()[:3] == day.lower()[:3]:
+                periods[(entry["class_name"], entry["section"])] = entry.get("periods") or []
+    return {s["student_id"]: periods.get((s.get("class_name"), s.get("section")), []) for s in students}
+
+
+async def parent_dashboard(db, student_ids: list, now: datetime = None) -> dict:
+    """Every child of a parent with their fees, attendance, recent marks and today's timetable"""
+    students = await db.students.find({"student_id": {"$in": student_ids}}, CHILD_PROJECTION).sort("name", 1).to_list(MAX_CHILDREN)
+    ids = [s["student_id"] for s in students]
+    day = today_name(now)
+    parts, timed_out, failed = await gather_with_timeouts({
+        "fees": fee_part(students),
+        "attendance": attendance_part(db, ids),
+        "recent_marks": recent_marks_part(db, ids),
+        "timetable_today": timetable_part(db, students, day),
+    }, PART_TIMEOUT_SECONDS)
+
+    children = []
+    for student in students:
+        child = {field: student.get(field) for field in CHILD_PROJECTION if field != "_id" and field not in SUMMARY_FIELDS}
+        for name in ("fees", "attendance", "recent_marks", "timetable_today"):
+            child[name] = parts[name].get(student["student_id"]) if name in parts else None
+        children.append(child)
+    return {
+        "day": day,
+        "children": children,
+        "count": len(children),
+        "partial": bool(timed_out or failed),
+        "timed_out": timed_out,
+        "failed": failed,
+    }
+
+
+def part_etag(name: str, data) -> str:
+    """Strong ETag for one part's data: "<name>.<digest>" """
+    encoded = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str).encode()
+    return f'"{name}.{hashlib.sha1(encoded).hexdigest()[:16]}"'
+
+
+def parse_if_none_match(header: str) -> set:
+    if not header:
+        return set()
+    return {tag.strip().removeprefix("W/") for tag in header.split(",") if tag.strip()}
+
+
+async def announcements_part(db, role: str) -> list:
+    cursor = db.announcements.find(
+        {"target_roles": role}, {"_id": 0, "announcement_id": 1, "title": 1, "content": 1, "priority": 1, "created_at": 1}
+    ).sort("created_at", -1).limit(RECENT_ANNOUNCEMENTS).max_time_ms(_max_time_ms())
+    return await cursor.to_list(RECENT_ANNOUNCEMENTS)
+
+
+async def _single(part, student_id: str):
+    return (await part)[student_id]
+
+
+async def student_dashboard(db, student: dict, known: set = frozenset(), now: datetime = None):
+    """
+    (payload, etag) for a student's home page: profile, fees, attendance, recent
+    marks, today's timetable and announcements. Parts whose ETag is in `known`
+    are sent without data.
+    """
+    student_id = student["student_id"]
+    day = today_name(now)
+    data, timed_out, failed = await gather_with_timeouts({
+        "fees": _single(fee_part([student]), student_id),
+        "attendance": _single(attendance_part(db, [student_id]), student_id),
+        "recent_marks": _single(recent_marks_part(db, [student_id]), student_id),
+        "timetable_today": _single(timetable_part(db, [student], day), student_id),
+        "announcements": announcements_part(db, "STUDENT"),
+    }, PART_TIMEOUT_SECONDS)
+    data = {"profile": {field: student.get(field) for field in PROFILE_FIELDS}, **data}
+
+    parts = {}
+    for name in ("profile", "fees", "attendance", "recent_marks", "timetable_today", "announcements"):
+        if name not in data:
+            parts[name] = None
+            continue
+        etag = part_etag(name, data[name])
+        parts[name] = {"etag": etag, "unchanged": True} if etag in known else {"etag": etag, "data": data[name]}
+    # Incomplete payloads get no ETag of their own, so they are never cached as a whole
+    etag = None if timed_out or failed else part_etag(f"dashboard-{day}", [p["etag"] for p in parts.values()])
+    payload = {"day": day, "parts": parts, "partial": bool(timed_out or failed), "timed_out": timed_out, "failed": failed}
+    return payload, etag
+
+
+ROSTER_PROJECTION = {"_id": 0, "student_id": 1, "unique_student_id": 1, "name": 1, "roll_number": 1, "student_photo_url": 1}
+
+
+def _roll_order(student: dict):
+    """Roll numbers are stored as strings; "10" sorts after "9" """
+    roll = str(student.get("roll_number") or "")
+    return (0, int(roll), "") if roll.isdigit() else (1, 0, roll)
+
+
+async def attendance_on(db, student_ids: list, day: datetime) -> dict:
+    """student_id -> status on `day`, one $in query on the (student_id, date) index"""
+    cursor = db.attendance.find(
+        {"student_id": {"$in": student_ids}, "date": day}, {"_id": 0, "student_id": 1, "status": 1}
+    ).max_time_ms(_max_time_ms())
+    return {row["student_id"]: row["status"] async for row in cursor}
+
+
+async def pending_marks(db, student_ids: list, academic_year: str) -> list:
+    """
+    Exams of `academic_year` with marks for some of the class but not all, with
+    the students still missing. Exam names repeat every year, so marks of other
+    years neither complete nor open an exam.
+    """
+    pipeline = [
+        {"$match": {"student_id": {"$in": student_ids}, "academic_year": academic_year}},
+        {"$group": {
+            "_id": {"subject": "$subject", "exam_name": "$exam_name"},
+            "marked": {"$addToSet": "$student_id"},
+            "exam_date": {"$max": "$exam_date"}
+        }}
+    ]
+    exams = []
+    async for row in db.marks.aggregate(pipeline, maxTimeMS=_max_time_ms()):
+        marked = set(row["marked"])
+        missing = [sid for sid in student_ids if sid not in marked]
+        if missing:
+            exams.append({**row["_id"], "exam_date": row["exam_date"], "missing_count": len(missing), "missing_student_ids": missing})
+    exams.sort(key=lambda e: (str(e.get("exam_date") or ""), e["subject"], e["exam_name"]), reverse=True)
+    return exams
+
+
+async def faculty_home(db, faculty: dict, day: datetime) -> dict:
+    """Roster of the faculty's assigned class with each student's attendance on `day` and the exams of that academic year missing marks"""
+    assigned_class, assigned_section = faculty.get("assigned_class"), faculty.get("assigned_section")
+    home = {
+        "faculty_id": faculty.get("faculty_id"), "subject": faculty.get("subject"),
+        "assigned_class": assigned_class, "assigned_section": assigned_section,
+        "date": day.strftime("%Y-%m-%d"), "academic_year": academic_year_of(day)
+    }
+    if not assigned_class or not assigned_section:
+        return {**home, "roster": [], "count": 0, "attendance": None, "pending_marks": [],
+                "partial": False, "timed_out": [], "failed": [], "message": "No class assigned to this teacher"}
+
+    query = {"class_name": assigned_class, "section": assigned_section, "unique_student_id": {"$ne": "PENDING"}}
+    roster = sorted(await db.students.find(query, ROSTER_PROJECTION).to_list(100), key=_roll_order)
+    ids = [s["student_id"] for s in roster]
+    parts, timed_out, failed = await gather_with_timeouts(
+        {"attendance": attendance_on(db, ids, day), "pending_marks": pending_marks(db, ids, home["academic_year"])}, PART_TIMEOUT_SECONDS
+    )
+
+    statuses = parts.get("attendance")
+    for student in roster:
+        student["attendance_status"] = statuses.get(student["student_id"]) if statuses is not None else None
+    attendance = None
+    if statuses is not None:
+        attendance = {
+            "marked": len(statuses),
+            "present": sum(1 for status in statuses.values() if status == "PRESENT"),
+            "not_marked": len(roster) - len(statuses),
+        }
+    return {
+        **home,
+        "roster": roster,
+        "count": len(roster),
+        "attendance": attendance,
+        "pending_marks": parts.get("pending_marks"),
+        "partial": bool(timed_out or failed),
+        "timed_out": timed_out,
+        "failed": failed,
+    }
@@ -0,0 +1,226 @@
+"""Settings-driven, lazily constructed MongoDB client.
+
+Nothing here touches the network or resolves DNS at import time, so the app
+module can be imported (and preloaded by gunicorn before forking) cheaply.
+The Motor client is built on first use inside each worker process.
+
+Settings (environment variables):
+    MONGODB_URI / MONGO_URL           connection string (MONGODB_URI wins)
+    MONGO_DB_NAME                     database name (default smart_school_db), used by the API, the
+                                      worker and the init_db.py / create_indexes.py scripts. Deliberately
+                                      not DB_NAME: that one names the test suite's database, and
+                                      .env.example has long set it to something else
+    MONGO_MAX_POOL_SIZE               connections per worker (default 100)
+    MONGO_MIN_POOL_SIZE               warm connections kept open (default 0)
+    MONGO_MAX_IDLE_TIME_MS            close connections idle this long (default: never)
+    MONGO_COMPRESSORS                 wire compression preference (default zstd,snappy,zlib)
+    MONGO_READ_PREFERENCE             e.g. primary, primaryPreferred, secondaryPreferred
+    MONGO_SERVER_SELECTION_TIMEOUT_MS default 5000
+"""
+import importlib.util
+import os
+import threading
+import time
+from collections import deque
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+
+DEFAULT_DB_NAME = "smart_school_db"
+
+# Compressor name -> module that has to be importable for the driver to use it
+_COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+
+_client = None
+_database = None
+
+
+def _int_env(name: str, default=None):
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _available_compressors(preference: str):
+    """Drop compressors whose library is not installed instead of letting the driver warn"""
+    names = [name.strip() for name in preference.split(",") if name.strip()]
+    return [name for name in names if importlib.util.find_spec(_COMPRESSOR_MODULES.get(name, name)) is not None]
+
+
+def mongo_settings() -> dict:
+    mongo_uri = os.getenv("MONGODB_URI") or os.getenv("MONGO_URL")
+    if not mongo_uri:
+        raise RuntimeError("MONGODB_URI is not set")
+    return {
+        "uri": mongo_uri,
+        "db_name": os.getenv("MONGO_DB_NAME") or DEFAULT_DB_NAME,
+        "max_pool_size": _int_env("MONGO_MAX_POOL_SIZE", 100),
+        "min_pool_size": _int_env("MONGO_MIN_POOL_SIZE", 0),
+        "max_idle_time_ms": _int_env("MONGO_MAX_IDLE_TIME_MS"),
+        "compressors": _available_compressors(os.getenv("MONGO_COMPRESSORS", "zstd,snappy,zlib")),
+        "read_preference": os.getenv("MONGO_READ_PREFERENCE", "primary"),
+        "server_selection_timeout_ms": _int_env("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)
+    }
+
+
+def db_name_warning(settings: dict):
+    """
+    init_db.py and create_indexes.py used to read DB_NAME. A message for
+    deployments where it still names another database than the one they use
+    now (None otherwise).
+    """
+    legacy = os.getenv("DB_NAME")
+    if not legacy or legacy == settings["db_name"] or os.getenv("MONGO_DB_NAME"):
+        return None
+    return (f"DB_NAME={legacy} is no longer read by this script; it uses MONGO_DB_NAME "
+            f"(unset, so {settings['db_name']}). Set MONGO_DB_NAME={legacy} to keep using that database.")
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    Connection pool listener recording how long operations wait to check out a
+    connection. Check-out start/finish are reported on the same driver thread,
+    so the start time is kept in a thread local.
+    """
+
+    BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+    def __init__(self, window: int = 2048):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._recent = deque(maxlen=window)
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._recent.clear()
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.wait_ms_total = 0.0
+            self.wait_ms_max = 0.0
+            self.buckets = [0] * (len(self.BUCKETS_MS) + 1)
+            self.connections_open = 0
+            self.checked_out = 0
+            self.pool_clears = 0
+
+    def _waited_ms(self):
+        started = getattr(self._local, "started", None)
+        self._local.started = None
+        return (time.perf_counter() - started) * 1000 if started is not None else None
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        waited = self._waited_ms()
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            if waited is not None:
+                self._recent.append(waited)
+                self.wait_ms_total += waited
+                self.wait_ms_max = max(self.wait_ms_max, waited)
+                bucket = next((i for i, bound in enumerate(self.BUCKETS_MS) if waited <= bound), len(self.BUCKETS_MS))
+                self.buckets[bucket] += 1
+
+    def connection_check_out_failed(self, event):
+        self._waited_ms()
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out = max(0, self.checked_out - 1)
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_open += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_open = max(0, self.connections_open - 1)
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            recent = sorted(self._recent)
+
+            def percentile(p):
+                return round(recent[min(len(recent) - 1, int(len(recent) * p))], 3) if recent else 0.0
+
+            labels = [f"<={bound}ms" for bound in self.BUCKETS_MS] + [f">{self.BUCKETS_MS[-1]}ms"]
+            return {
+                "pid": os.getpid(),
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "connections_open": self.connections_open,
+                "connections_in_use": self.checked_out,
+                "pool_clears": self.pool_clears,
+                "wait_ms": {
+                    "avg": round(self.wait_ms_total / self.checkouts, 3) if self.checkouts else 0.0,
+                    "max": round(self.wait_ms_max, 3),
+                    "p50": percentile(0.50),
+                    "p95": percentile(0.95),
+                    "p99": percentile(0.99)
+                },
+                "wait_histogram": dict(zip(labels, self.buckets))
+            }
+
+
+pool_metrics = PoolMetrics()
+
+
+def create_client(settings: dict = None) -> AsyncIOMotorClient:
+    settings = settings or mongo_settings()
+    options = {
+        "maxPoolSize": settings["max_pool_size"],
+        "minPoolSize": settings["min_pool_size"],
+        "readPreference": settings["read_preference"],
+        "serverSelectionTimeoutMS": settings["server_selection_timeout_ms"],
+        # Timestamps are stored as BSON dates; read them back as aware UTC datetimes
+        "tz_aware": True,
+        "event_listeners": [pool_metrics]
+    }
+    if settings["max_idle_time_ms"] is not None:
+        options["maxIdleTimeMS"] = settings["max_idle_time_ms"]
+    if settings["compressors"]:
+        options["compressors"] = ",".join(settings["compressors"])
+    return AsyncIOMotorClient(settings["uri"], **options)
+
+
+def get_client() -> AsyncIOMotorClient:
+    get_database()
+    return _client
+
+
+def get_database():
+    global _client, _database
+    if _database is None:
+        settings = mongo_settings()
+        _client = create_client(settings)
+        _database = _client[settings["db_name"]]
+    return _database
+
+
+class LazyDatabase:
+    """Stands in for a Motor database and builds the client on first attribute access"""
+
+    def __getattr__(self, name):
+        return getattr(get_database(), name)
+
+    def __getitem__(self, name):
+        return get_database()[name]
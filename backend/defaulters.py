@@ -0,0 +1,152 @@
+"""Fee defaulter queries: fee_tracking rows with an unpaid, overdue balance.
+
+A defaulter is a row with pending_amount > 0 and an overdue_since date (set
+by the installment sweep). Both sort orders are served by partial indexes
+that only hold such rows, and pages are fetched by keyset (the last row's
+sort key), never by skip.
+"""
+import base64
+import json
+from datetime import datetime, timedelta, timezone
+
+DEFAULTER_FILTER = {"pending_amount": {"$gt": 0}, "overdue_since": {"$type": "date"}}
+
+AGING_BUCKETS = [("0-30", 0, 30), ("31-60", 31, 60), ("61-90", 61, 90), ("90+", 91, None)]
+
+SORTS = {
+    # sort name -> (field, direction)
+    "amount": ("pending_amount", -1),
+    "age": ("overdue_since", 1),
+}
+
+
+async def ensure_defaulter_indexes(db):
+    await db.fee_tracking.create_index(
+        [("pending_amount", -1), ("tracking_id", -1)],
+        partialFilterExpression=DEFAULTER_FILTER,
+        name="defaulters_by_amount"
+    )
+    await db.fee_tracking.create_index(
+        [("overdue_since", 1), ("tracking_id", 1)],
+        partialFilterExpression=DEFAULTER_FILTER,
+        name="defaulters_by_age"
+    )
+
+
+def _naive(value: datetime) -> datetime:
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+
+def aging_bucket(days_overdue: int) -> str:
+    for label, low, high in AGING_BUCKETS:
+        if high is None or days_overdue <= high:
+            return label
+    return AGING_BUCKETS[-1][0]
+
+
+def bucket_range(label: str, now: datetime) -> dict:
+    """overdue_since condition for an aging bucket"""
+    for name, low, high in AGING_BUCKETS:
+        if name == label:
+            condition = {"$lte": now - timedelta(days=low)}
+            if high is not None:
+                condition["$gt"] = now - timedelta(days=high + 1)
+            return condition
+    raise ValueError(f"Unknown aging bucket {label!r}; use one of {', '.join(b[0] for b in AGING_BUCKETS)}")
+
+
+def encode_cursor(row: dict, sort: str) -> str:
+    field = SORTS[sort][0]
+    value = row[field].isoformat() if isinstance(row[field], datetime) else row[field]
+    return base64.urlsafe_b64encode(json.dumps([value, row["tracking_id"]]).encode()).decode()
+
+
+def _after_cursor(cursor: str, sort: str) -> dict:
+    try:
+        value, tracking_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    field, direction = SORTS[sort]
+    if field == "overdue_since":
+        value = _naive(datetime.fromisoformat(value))
+    op = "$lt" if direction < 0 else "$gt"
+    return {"$or": [{field: {op: value}}, {field: value, "tracking_id": {op: tracking_id}}]}
+
+
+def defaulter_query(class_name: str = None, section: str = None, bucket: str = None, min_amount: float = None, now: datetime = None) -> dict:
+    now = now or datetime.now(timezone.utc)
+    query = dict(DEFAULTER_FILTER)
+    if class_name:
+        query["class_name"] = class_name
+    if section:
+        query["section"] = section
+    if bucket:
+        query["overdue_since"] = {"$type": "date", **bucket_range(bucket, now)}
+    if min_amount:
+        query["pending_amount"] = {"$gt": 0, "$gte": min_amount}
+    return query
+
+
+def defaulter_pipeline(query: dict, sort: str, cursor: str = None, limit: int = None) -> list:
+    """Indexed match/sort (plus keyset and limit), then the student's name from `students`"""
+    field, direction = SORTS[sort]
+    match = {"$and": [query, _after_cursor(cursor, sort)]} if cursor else query
+    pipeline = [{"$match": match}, {"$sort": {field: direction, "tracking_id": direction}}]
+    if limit:
+        pipeline.append({"$limit": limit})
+    pipeline += [
+        {"$lookup": {
+            "from": "students",
+            "localField": "student_id",
+            "foreignField": "student_id",
+            "pipeline": [{"$project": {"_id": 0, "name": 1, "roll_number": 1}}],
+            "as": "student"
+        }},
+        {"$project": {
+            "_id": 0,
+            "tracking_id": 1,
+            "student_id": 1,
+            "unique_student_id": 1,
+            "name": {"$first": "$student.name"},
+            "roll_number": {"$first": "$student.roll_number"},
+            "class_name": 1,
+            "section": 1,
+            "academic_year": 1,
+            "total_fee_amount": 1,
+            "paid_amount": 1,
+            "pending_amount": 1,
+            "overdue_since": 1
+        }}
+    ]
+    return pipeline
+
+
+async def iter_defaulters(db, query: dict, sort: str, cursor: str = None, limit: int = None, now: datetime = None):
+    """Defaulter rows with days_overdue and aging bucket, straight off the aggregation cursor"""
+    now = _naive(now or datetime.now(timezone.utc))
+    async for row in db.fee_tracking.aggregate(defaulter_pipeline(query, sort, cursor, limit)):
+        days = max(0, (now - _naive(row["overdue_since"])).days)
+        row["days_overdue"] = days
+        row["aging_bucket"] = aging_bucket(days)
+        yield row
+
+
+async def aging_summary(db, query: dict, now: datetime = None) -> dict:
+    """Count and amount owed per aging bucket, computed in the database"""
+    now = now or datetime.now(timezone.utc)
+    branches = [
+        {"case": {"$gt": ["$overdue_since", now - timedelta(days=high + 1)]}, "then": label}
+        for label, _, high in AGING_BUCKETS if high is not None
+    ]
+    pipeline = [
+        {"$match": query},
+        {"$group": {
+            "_id": {"$switch": {"branches": branches, "default": AGING_BUCKETS[-1][0]}},
+            "students": {"$sum": 1},
+            "amount": {"$sum": "$pending_amount"}
+        }}
+    ]
+    summary = {label: {"students": 0, "amount": 0.0} for label, _, _ in AGING_BUCKETS}
+    async for group in db.fee_tracking.aggregate(pipeline):
+        summary[group["_id"]] = {"students": group["students"], "amount": float(group["amount"])}
+    return summary
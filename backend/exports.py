@@ -0,0 +1,181 @@
+"""Streaming CSV / NDJSON responses straight from Motor cursors.
+
+Rows are encoded as they come off the cursor and flushed in small chunks, so
+memory stays flat however many rows an export has. DATASETS describes the
+admin exports (students, fees, attendance, payments) served by
+GET /api/admin/exports/{dataset}.
+"""
+import csv
+import io
+import json
+from datetime import datetime, timedelta, timezone
+
+from fastapi.responses import StreamingResponse
+
+from utils import day_start
+
+FLUSH_EVERY = 500
+EXPORT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+def _json_default(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+def _cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, default=_json_default)
+    if isinstance(value, str) and value[:1] in ("=", "+", "-", "@"):
+        # Keep spreadsheet apps from evaluating the cell as a formula
+        return "'" + value
+    return value
+
+
+async def csv_chunks(rows, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    pending = 1
+    async for row in rows:
+        writer.writerow([_cell(row.get(column)) for column in columns])
+        pending += 1
+        if pending >= FLUSH_EVERY:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            pending = 0
+    if pending:
+        yield buffer.getvalue()
+
+
+async def ndjson_chunks(rows, columns):
+    lines = []
+    async for row in rows:
+        lines.append(json.dumps({column: row.get(column) for column in columns}, default=_json_default))
+        if len(lines) >= FLUSH_EVERY:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def streaming_export(rows, columns, fmt: str, filename: str) -> StreamingResponse:
+    """`rows` is an async iterator of dicts (e.g. a Motor cursor); `fmt` is csv or ndjson"""
+    chunks = csv_chunks(rows, columns) if fmt == "csv" else ndjson_chunks(rows, columns)
+    return StreamingResponse(
+        chunks,
+        media_type=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'}
+    )
+
+
+# dataset -> collection, exportable columns (default order), date field, and
+# whether class/section/academic_year are stored on the rows themselves
+DATASETS = {
+    "students": {
+        "collection": "students",
+        "columns": ["student_id", "unique_student_id", "name", "email", "class_name", "section", "roll_number",
+                    "academic_year", "admission_number", "admission_date", "date_of_birth", "gender", "blood_group",
+                    "address", "is_active", "created_at"],
+        "date_field": "admission_date",
+        "has_class": True,
+    },
+    "fees": {
+        "collection": "fee_tracking",
+        "columns": ["tracking_id", "student_id", "unique_student_id", "class_name", "section", "academic_year",
+                    "total_fee_amount", "paid_amount", "pending_amount", "payment_status", "last_payment_date",
+                    "overdue_since", "updated_at"],
+        "date_field": "updated_at",
+        "has_class": True,
+    },
+    "attendance": {
+        "collection": "attendance",
+        "columns": ["attendance_id", "student_id", "date", "status", "marked_by", "remarks", "created_at"],
+        "date_field": "date",
+        "has_class": False,
+    },
+    "payments": {
+        "collection": "payments",
+        "columns": ["payment_id", "fee_id", "student_id", "unique_student_id", "amount", "payment_method", "status",
+                    "razorpay_order_id", "razorpay_payment_id", "payment_date", "created_at"],
+        "date_field": "payment_date",
+        "has_class": False,
+    },
+}
+
+
+def export_columns(dataset: str, columns: str = None):
+    """Requested columns (comma separated) in the requested order; ValueError for unknown names"""
+    allowed = DATASETS[dataset]["columns"]
+    if not columns:
+        return list(allowed)
+    requested = [c.strip() for c in columns.split(",") if c.strip()]
+    unknown = [c for c in requested if c not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown columns for {dataset}: {', '.join(unknown)}. Allowed: {', '.join(allowed)}")
+    return requested
+
+
+async def export_query(db, dataset: str, class_name: str = None, section: str = None, academic_year: str = None,
+                       date_from: str = None, date_to: str = None) -> dict:
+    """
+    Mongo filter for an export. date_from/date_to are inclusive YYYY-MM-DD days (UTC).
+    Attendance and payments do not store class or year: class/section are
+    resolved to student ids, and academic_year to its April-March date range.
+    The ids are those of the class's current roster, so records a student
+    made before moving class (or a rollover) follow the student: they are
+    exported under the class the student is in now, not the one they were
+    in when the record was written.
+    """
+    spec = DATASETS[dataset]
+    query = {}
+    date_range = {}
+    if date_from:
+        date_range["$gte"] = day_start(date_from)
+    if date_to:
+        date_range["$lt"] = day_start(date_to) + timedelta(days=1)
+
+    if spec["has_class"]:
+        if class_name:
+            query["class_name"] = class_name
+        if section:
+            query["section"] = section
+        if academic_year:
+            query["academic_year"] = academic_year
+    else:
+        if class_name or section:
+            roster = {k: v for k, v in (("class_name", class_name), ("section", section)) if v}
+            student_ids = await db.students.distinct("student_id", roster)
+            query["student_id"] = {"$in": student_ids}
+        if academic_year:
+            start = int(academic_year.split("-")[0])
+            year_start = datetime(start, 4, 1, tzinfo=timezone.utc)
+            year_end = datetime(start + 1, 4, 1, tzinfo=timezone.utc)
+            date_range["$gte"] = max(date_range.get("$gte", year_start), year_start)
+            date_range["$lt"] = min(date_range.get("$lt", year_end), year_end)
+    if date_range:
+        query[spec["date_field"]] = date_range
+    return query
+
+
+async def ensure_export_indexes(db):
+    """(date field, _id) per dataset, so date-range exports read an index range in sort order"""
+    for spec in DATASETS.values():
+        await db[spec["collection"]].create_index([(spec["date_field"], 1), ("_id", 1)])
+
+
+def export_sort(dataset: str, query: dict) -> list:
+    """(date field, _id) when the query has a date range, else insertion order (_id)"""
+    date_field = DATASETS[dataset]["date_field"]
+    return [(date_field, 1), ("_id", 1)] if date_field in query else [("_id", 1)]
+
+
+def export_cursor(db, dataset: str, query: dict, columns):
+    """Cursor sorted by an index (see export_sort), so no sort is held in memory"""
+    projection = {"_id": 0, **{column: 1 for column in columns}}
+    cursor = db[DATASETS[dataset]["collection"]].find(query, projection, batch_size=FLUSH_EVERY)
+    return cursor.sort(export_sort(dataset, query))
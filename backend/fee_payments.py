@@ -0,0 +1,370 @@
+"""Atomic application of verified payments to fee_tracking.
+
+Both payment verification endpoints go through `apply_verified_payment` so a
+Razorpay payment id is counted exactly once, no matter how many times (or how
+concurrently) it is verified. A payment is first claimed in `payments` as
+PROCESSING, then credited by `credit_payment` under a lease on the claim.
+fee_tracking keeps the keys of claims it was credited with until they are
+SUCCESS (applied_payment_ids), so a claim left PROCESSING by a crash is
+credited again, at most once, by the next verify call or by
+reconcile_processing_payments in the payment events worker.
+
+`payments` is the payment history. fee_tracking keeps running totals and
+only the last RECENT_PAYMENTS entries in payment_history, so the row stays
+the same size however many installments are paid; the full history is read
+a page at a time with payment_history_page.
+"""
+import base64
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from fee_summary import sync_fee_summaries
+from installments import sync_installments
+from utils import generate_id, get_current_timestamp, parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+RECENT_PAYMENTS = 5
+STALE_CLAIM_AGE = timedelta(minutes=5)
+CREDIT_LEASE = STALE_CLAIM_AGE
+
+
+async def archive_duplicate_payments(db) -> int:
+    """
+    Move all but one payments doc per razorpay_payment_id into
+    payment_duplicates, so the unique index can be built. The one kept is a
+    SUCCESS doc if there is one, else the oldest. Legacy duplicates usually
+    mean fee_tracking was credited twice, so each archived doc records which
+    payment it duplicates for an admin to review; nothing is deleted outright.
+    """
+    pipeline = [
+        {"$match": {"razorpay_payment_id": {"$type": "string"}}},
+        {"$sort": {"razorpay_payment_id": 1, "created_at": 1, "_id": 1}},
+        {"$group": {"_id": "$razorpay_payment_id", "docs": {"$push": {"_id": "$_id", "status": "$status"}}}},
+        {"$match": {"docs.1": {"$exists": True}}}
+    ]
+    archived = 0
+    async for group in db.payments.aggregate(pipeline, allowDiskUse=True):
+        docs = group["docs"]
+        keep = next((d for d in docs if d.get("status") == "SUCCESS"), docs[0])
+        extra = [d["_id"] for d in docs if d["_id"] != keep["_id"]]
+        duplicates = await db.payments.find({"_id": {"$in": extra}}).to_list(len(extra))
+        timestamp = get_current_timestamp()
+        await db.payment_duplicates.insert_many([
+            {**doc, "duplicate_of": keep["_id"], "archived_at": timestamp, "needs_review": True} for doc in duplicates
+        ])
+        await db.payments.delete_many({"_id": {"$in": extra}})
+        archived += len(extra)
+    if archived:
+        logger.warning(f"Archived {archived} duplicate payments to payment_duplicates; check their fee records for double credits")
+    return archived
+
+
+async def ensure_payment_indexes(db):
+    """Unique razorpay_payment_id is what makes verification idempotent"""
+    await archive_duplicate_payments(db)
+    await db.payments.create_index(
+        "razorpay_payment_id",
+        unique=True,
+        partialFilterExpression={"razorpay_payment_id": {"$type": "string"}},
+        name="uniq_razorpay_payment_id"
+    )
+
+
+async def ensure_payment_claim_index(db):
+    await db.payments.create_index([("status", 1), ("created_at", 1)])
+    # Claims are credited to, and their rows read back by, tracking_id
+    await db.fee_tracking.create_index("tracking_id")
+
+
+async def ensure_payment_history_index(db):
+    await db.payments.create_index([("student_id", 1), ("payment_date", -1), ("payment_id", -1)], name="student_payment_history")
+
+
+async def trim_payment_history(db):
+    """
+    Migration step: copy history entries that have no payments document into
+    `payments`, then cut every fee_tracking payment_history to the last RECENT_PAYMENTS.
+    """
+    oversized = {f"payment_history.{RECENT_PAYMENTS}": {"$exists": True}}
+    async for row in db.fee_tracking.find(oversized, {"_id": 0, "tracking_id": 1, "student_id": 1, "unique_student_id": 1, "payment_history": 1}):
+        history = row.get("payment_history") or []
+        razorpay_ids = [entry.get("razorpay_payment_id") for entry in history if entry.get("razorpay_payment_id")]
+        recorded = set(await db.payments.distinct("razorpay_payment_id", {"razorpay_payment_id": {"$in": razorpay_ids}}))
+        missing = [entry for entry in history if not entry.get("razorpay_payment_id") or entry["razorpay_payment_id"] not in recorded]
+        if missing:
+            await db.payments.insert_many([{
+                "payment_id": generate_id("pay_"),
+                "fee_id": row.get("tracking_id"),
+                "student_id": row.get("student_id"),
+                "unique_student_id": row.get("unique_student_id"),
+                "amount": entry.get("amount", 0),
+                "payment_method": entry.get("method"),
+                "razorpay_order_id": entry.get("razorpay_order_id"),
+                "razorpay_payment_id": entry.get("razorpay_payment_id"),
+                "status": "SUCCESS",
+                "source": "payment_history",
+                "payment_date": entry.get("date"),
+                "created_at": entry.get("date")
+            } for entry in missing])
+    await db.fee_tracking.update_many(oversized, [{"$set": {"payment_history": {"$slice": ["$payment_history", -RECENT_PAYMENTS]}}}])
+
+
+def _encode_history_cursor(payment: dict) -> str:
+    payment_date = payment.get("payment_date")
+    return base64.urlsafe_b64encode(json.dumps([payment_date.isoformat() if payment_date else None, payment["payment_id"]]).encode()).decode()
+
+
+def _after_history_cursor(payment_date, payment_id: str) -> list:
+    """
+    Payments after (payment_date, payment_id) in newest-first order. Payments
+    without a date (some rows copied by trim_payment_history) sort after all
+    dated ones, and `$lt` never matches them, so they get their own branch.
+    """
+    if payment_date is None:
+        return [{"payment_date": None, "payment_id": {"$lt": payment_id}}]
+    return [
+        {"payment_date": {"$lt": payment_date}},
+        {"payment_date": payment_date, "payment_id": {"$lt": payment_id}},
+        {"payment_date": None}
+    ]
+
+
+async def payment_history_page(db, student_id: str, limit: int = 20, cursor: str = None):
+    """
+    Successful payments, newest first; returns (payments, next_cursor). Served
+    by the (student_id, payment_date, payment_id) index.
+    """
+    query = {"student_id": student_id, "status": "SUCCESS"}
+    if cursor:
+        try:
+            payment_date, payment_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            payment_date = parse_timestamp(payment_date)
+        except (ValueError, TypeError):
+            raise ValueError("Invalid cursor")
+        query["$or"] = _after_history_cursor(payment_date, payment_id)
+    payments = await db.payments.find(query, {"_id": 0}).sort([("payment_date", -1), ("payment_id", -1)]).limit(limit + 1).to_list(limit + 1)
+    next_cursor = _encode_history_cursor(payments[limit - 1]) if len(payments) > limit else None
+    return payments[:limit], next_cursor
+
+
+def payment_update_pipeline(amount: float, history_entry: dict, timestamp, applied_id: str = None) -> list:
+    """
+    Update pipeline that adds `amount` to paid_amount and derives
+    pending_amount/payment_status from the new total in the same write.
+    `applied_id` is recorded in applied_payment_ids (see credit_payment).
+    """
+    stage = {
+        "paid_amount": {"$add": [{"$ifNull": ["$paid_amount", 0]}, amount]},
+        "payment_history": {"$slice": [
+            {"$concatArrays": [{"$ifNull": ["$payment_history", []]}, [{"$literal": history_entry}]]},
+            -RECENT_PAYMENTS
+        ]},
+        "last_payment_date": timestamp,
+        "updated_at": timestamp
+    }
+    if applied_id:
+        stage["applied_payment_ids"] = {"$concatArrays": [{"$ifNull": ["$applied_payment_ids", []]}, [{"$literal": applied_id}]]}
+    return [{"$set": stage}, *balance_stages()]
+
+
+def balance_stages() -> list:
+    """Pipeline stages deriving pending_amount and payment_status from total_fee_amount and paid_amount"""
+    return [
+        {"$set": {
+            "pending_amount": {"$max": [0, {"$subtract": [{"$ifNull": ["$total_fee_amount", 0]}, {"$ifNull": ["$paid_amount", 0]}]}]}
+        }},
+        {"$set": {
+            "payment_status": {"$switch": {
+                "branches": [
+                    {"case": {"$lte": ["$pending_amount", 0]}, "then": "PAID"},
+                    {"case": {"$gt": [{"$ifNull": ["$paid_amount", 0]}, 0]}, "then": "PARTIAL"}
+                ],
+                "default": "PENDING"
+            }}
+        }}
+    ]
+
+
+def fee_total_update_pipeline(total_fee: float, timestamp: str) -> list:
+    """Update pipeline that replaces total_fee_amount and re-derives the balance; paid_amount is untouched"""
+    return [
+        {"$set": {"total_fee_amount": total_fee, "updated_at": timestamp}},
+        *balance_stages()
+    ]
+
+
+def claim_filter(claim: dict) -> dict:
+    """The fee_tracking filter a payments claim is credited to"""
+    if claim.get("tracking_filter"):
+        return claim["tracking_filter"]
+    if claim.get("fee_id"):
+        return {"tracking_id": claim["fee_id"]}
+    return {"unique_student_id": claim.get("unique_student_id")}
+
+
+def applied_key(claim: dict) -> str:
+    return claim.get("razorpay_payment_id") or claim["payment_id"]
+
+
+def credit_filter(claim: dict) -> dict:
+    """Matches the claim's fee_tracking row only while the claim has not been credited to it"""
+    return {**claim_filter(claim), "applied_payment_ids": {"$ne": applied_key(claim)}}
+
+
+def credit_pipeline(claim: dict, timestamp) -> list:
+    history_entry = {
+        "date": timestamp,
+        "amount": claim["amount"],
+        "method": "online",
+        "razorpay_payment_id": claim.get("razorpay_payment_id"),
+        "razorpay_order_id": claim.get("razorpay_order_id")
+    }
+    return payment_update_pipeline(claim["amount"], history_entry, timestamp, applied_id=applied_key(claim))
+
+
+async def lease_claims(db, payment_ids: list):
+    """
+    Take the credit lease on those of `payment_ids` that are still PROCESSING
+    and not leased by a live caller. Returns (token, leased claims); only the
+    holder of a claim's lease credits it. A lease left by a crash expires
+    after CREDIT_LEASE, so the claim is picked up again by the next caller.
+    """
+    now = get_current_timestamp()
+    token = generate_id("lease_")
+    await db.payments.update_many(
+        {"payment_id": {"$in": payment_ids}, "status": "PROCESSING", "credit_lease_until": {"$not": {"$gte": now}}},
+        {"$set": {"credit_lease": token, "credit_lease_until": now + CREDIT_LEASE}}
+    )
+    claims = await db.payments.find({"payment_id": {"$in": payment_ids}, "credit_lease": token}, {"_id": 0}).to_list(None)
+    return token, claims
+
+
+async def applied_rows(db, claims: list) -> dict:
+    """payment_id -> the fee_tracking row that holds the claim's applied key, read through the claims' own (indexed) filters"""
+    filters = [claim_filter(claim) for claim in claims]
+    projection = {"_id": 0, "tracking_id": 1, "student_id": 1, "unique_student_id": 1, "applied_payment_ids": 1,
+                  **{field: 1 for f in filters for field in f}}
+    unique = list({tuple(sorted(f.items())): f for f in filters}.values())
+    rows = await db.fee_tracking.find({"$or": unique}, projection).to_list(None)
+    found = {}
+    for claim, query in zip(claims, filters):
+        for row in rows:
+            if applied_key(claim) in (row.get("applied_payment_ids") or []) and all(row.get(k) == v for k, v in query.items()):
+                found[claim["payment_id"]] = row
+                break
+    return found
+
+
+async def finish_credits(db, token: str, claims: list, rows: dict):
+    """
+    Follow-up of crediting `claims` (all applied to rows[payment_id]): sync
+    installments and summaries, mark the claims SUCCESS under the lease
+    `token`, then drop their keys from applied_payment_ids. A key is only
+    needed while its claim is PROCESSING, so the array stays as short as the
+    number of payments in flight. A crash between the last two writes leaves
+    one key behind, which is harmless.
+    """
+    tracking_ids = list({rows[claim["payment_id"]]["tracking_id"] for claim in claims})
+    # Both syncs are idempotent; run them again in case an earlier attempt stopped before them
+    await sync_installments(db, tracking_ids)
+    await sync_fee_summaries(db, tracking_ids=tracking_ids)
+    await db.payments.bulk_write([
+        UpdateOne(
+            {"payment_id": claim["payment_id"], "status": "PROCESSING", "credit_lease": token},
+            {"$set": {
+                "status": "SUCCESS",
+                "fee_id": claim.get("fee_id") or rows[claim["payment_id"]].get("tracking_id"),
+                "student_id": claim.get("student_id") or rows[claim["payment_id"]].get("student_id"),
+                "unique_student_id": rows[claim["payment_id"]].get("unique_student_id")
+            }, "$unset": {"credit_lease": "", "credit_lease_until": ""}}
+        )
+        for claim in claims
+    ], ordered=False)
+    finished = set(await db.payments.distinct("payment_id", {"payment_id": {"$in": [c["payment_id"] for c in claims]}, "status": "SUCCESS"}))
+    keys = {}
+    for claim in claims:
+        if claim["payment_id"] in finished:
+            keys.setdefault(rows[claim["payment_id"]]["tracking_id"], []).append(applied_key(claim))
+    if keys:
+        await db.fee_tracking.bulk_write([
+            UpdateOne({"tracking_id": tracking_id}, {"$pull": {"applied_payment_ids": {"$in": applied}}})
+            for tracking_id, applied in keys.items()
+        ], ordered=False)
+
+
+async def credit_payment(db, claim: dict):
+    """
+    Credit a PROCESSING claim to its fee_tracking row and mark it SUCCESS.
+
+    The claim's lease makes this caller the only one crediting it, and the row
+    records the keys of the claims it has been credited with but that are not
+    SUCCESS yet (applied_payment_ids), so after a crash the next holder still
+    credits at most once. Returns (fee_tracking, credited); fee_tracking is
+    None when no row matches.
+    """
+    token, leased = await lease_claims(db, [claim["payment_id"]])
+    if not leased:
+        # Already SUCCESS, or being credited by another caller right now
+        return await db.fee_tracking.find_one(claim_filter(claim), {"_id": 0}), False
+    claim = leased[0]
+    fee_tracking = await db.fee_tracking.find_one_and_update(
+        credit_filter(claim),
+        credit_pipeline(claim, get_current_timestamp()),
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    credited = fee_tracking is not None
+    if not credited:
+        fee_tracking = await db.fee_tracking.find_one({**claim_filter(claim), "applied_payment_ids": applied_key(claim)}, {"_id": 0})
+        if not fee_tracking:
+            await db.payments.update_one({"payment_id": claim["payment_id"], "credit_lease": token},
+                                         {"$unset": {"credit_lease": "", "credit_lease_until": ""}})
+            return None, False
+    await finish_credits(db, token, [claim], {claim["payment_id"]: fee_tracking})
+    fee_tracking["applied_payment_ids"] = [key for key in fee_tracking.get("applied_payment_ids") or [] if key != applied_key(claim)]
+    return fee_tracking, credited
+
+
+async def apply_verified_payment(db, tracking_filter: dict, payment_doc: dict):
+    """
+    Record a verified payment and apply it to the matching fee_tracking row.
+
+    The payments insert claims the razorpay_payment_id. A duplicate that is
+    already SUCCESS leaves fee_tracking alone; one still PROCESSING (an
+    earlier attempt that died, or one running right now) is credited through
+    the same idempotent credit_payment, so the payment is never lost.
+
+    Returns (fee_tracking, applied). fee_tracking is None when no row matches.
+    """
+    claim = {**payment_doc, "status": "PROCESSING", "tracking_filter": tracking_filter}
+    try:
+        await db.payments.insert_one(claim)
+        claimed_here = True
+    except DuplicateKeyError:
+        claim = await db.payments.find_one({"razorpay_payment_id": payment_doc.get("razorpay_payment_id")}, {"_id": 0})
+        if not claim or claim.get("status") != "PROCESSING":
+            return await db.fee_tracking.find_one(tracking_filter, {"_id": 0}), False
+        claimed_here = False
+
+    fee_tracking, credited = await credit_payment(db, claim)
+    if not fee_tracking and claimed_here:
+        # Release the claim so the payment can be retried against the right record
+        await db.payments.delete_one({"payment_id": claim["payment_id"], "status": "PROCESSING"})
+    return fee_tracking, credited
+
+
+async def reconcile_processing_payments(db, older_than: timedelta = STALE_CLAIM_AGE) -> int:
+    """Credit PROCESSING claims left behind by a crash; returns how many were credited"""
+    stale_before = datetime.now(timezone.utc) - older_than
+    credited = 0
+    async for claim in db.payments.find({"status": "PROCESSING", "created_at": {"$lt": stale_before}}, {"_id": 0}):
+        fee_tracking, applied = await credit_payment(db, claim)
+        if fee_tracking is None:
+            logger.warning(f"Payment claim {claim['payment_id']} matches no fee record; left PROCESSING")
+        credited += applied
+    return credited
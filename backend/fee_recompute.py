@@ -0,0 +1,70 @@
+"""Propagate fee structure changes to existing fee_tracking rows.
+
+Creating, editing or deleting a fee structure queues a "fee_recompute" job
+for its class. The job walks the class's fee_tracking rows in tracking_id
+order, resolves each row's total the same way registration does (the
+section's structure, else the class-wide one) and rewrites the rows whose
+total changed with one bulk_write per chunk. paid_amount is never touched;
+pending_amount and payment_status are re-derived from it in the same write,
+and the rows' installments are re-split.
+Rows whose section no longer has any fee structure are left as they are.
+"""
+from pymongo import UpdateOne
+
+from fee_payments import fee_total_update_pipeline
+from fee_summary import sync_fee_summaries
+from installments import sync_installments
+from jobs import report_progress
+from utils import fee_structure_total, get_current_timestamp
+
+CHUNK_SIZE = 500
+
+
+async def ensure_fee_recompute_indexes(db):
+    await db.fee_tracking.create_index([("class_name", 1), ("tracking_id", 1)])
+
+
+async def recompute_fee_tracking(db, job):
+    """Job handler; params: class_id and optionally academic_year (default: every live row of the class)"""
+    class_id = job["params"]["class_id"]
+    query = {"class_name": class_id}
+    if job["params"].get("academic_year"):
+        query["academic_year"] = job["params"]["academic_year"]
+
+    totals = {fee.get("section"): fee_structure_total(fee) async for fee in db.fee_structures.find({"class_id": class_id}, {"_id": 0})}
+    checkpoint = job.get("checkpoint") or {}
+    last_tracking_id = checkpoint.get("last_tracking_id")
+    counts = checkpoint.get("counts") or {"updated": 0, "unchanged": 0, "no_fee_structure": 0}
+    done = (job.get("progress") or {}).get("done") or 0
+    remaining = await db.fee_tracking.count_documents({**query, **({"tracking_id": {"$gt": last_tracking_id}} if last_tracking_id else {})})
+    await report_progress(db, job["job_id"], done=done, total=done + remaining)
+
+    while True:
+        chunk_query = {**query, "tracking_id": {"$gt": last_tracking_id}} if last_tracking_id else query
+        rows = await db.fee_tracking.find(
+            chunk_query, {"_id": 0, "tracking_id": 1, "section": 1, "total_fee_amount": 1}
+        ).sort("tracking_id", 1).limit(CHUNK_SIZE).to_list(CHUNK_SIZE)
+        if not rows:
+            break
+
+        timestamp = get_current_timestamp()
+        operations, changed = [], []
+        for row in rows:
+            total_fee = totals.get(row.get("section"), totals.get(None))
+            if total_fee is None:
+                counts["no_fee_structure"] += 1
+            elif row.get("total_fee_amount") == total_fee:
+                counts["unchanged"] += 1
+            else:
+                operations.append(UpdateOne({"tracking_id": row["tracking_id"]}, fee_total_update_pipeline(total_fee, timestamp)))
+                changed.append(row["tracking_id"])
+        if operations:
+            result = await db.fee_tracking.bulk_write(operations, ordered=False)
+            counts["updated"] += result.modified_count
+            await sync_installments(db, changed)
+            await sync_fee_summaries(db, tracking_ids=changed)
+
+        done += len(rows)
+        last_tracking_id = rows[-1]["tracking_id"]
+        await report_progress(db, job["job_id"], done=done, checkpoint={"last_tracking_id": last_tracking_id, "counts": counts})
+    return {"class_id": class_id, **counts}
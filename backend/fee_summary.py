@@ -0,0 +1,127 @@
+"""Fee summary embedded on student documents.
+
+Every student carries payment_status, total_fee_amount, paid_amount and
+pending_amount copied from their fee_tracking row, so the student directory
+reads (and filters and sorts on) `students` alone. fee_tracking stays the
+source of truth: every path that writes it calls sync_fee_summaries
+afterwards. Each copy records the row's updated_at in fee_updated_at and only
+replaces an older copy, so concurrent syncs cannot go backwards. The
+"fee_summary_reconcile" job re-derives every student's summary to repair any
+drift (e.g. a crash between the two writes, or a stamp newer than the row it
+came from). Its writes are guarded by the stamp it read rather than by age,
+so they also replace a stale copy that claims to be newer.
+"""
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from jobs import report_progress
+from utils import get_current_timestamp
+
+SUMMARY_FIELDS = ("payment_status", "total_fee_amount", "paid_amount", "pending_amount")
+SUMMARY_DEFAULTS = {"payment_status": "PENDING", "total_fee_amount": 0.0, "paid_amount": 0.0, "pending_amount": 0.0}
+RECONCILE_BATCH_SIZE = 1000
+
+
+async def ensure_fee_summary_indexes(db):
+    await db.students.create_index([("class_name", 1), ("section", 1), ("payment_status", 1), ("pending_amount", -1)])
+    await db.students.create_index([("payment_status", 1), ("pending_amount", -1)])
+
+
+def summary_of(tracking: dict = None) -> dict:
+    if not tracking:
+        return dict(SUMMARY_DEFAULTS)
+    return {field: tracking.get(field, SUMMARY_DEFAULTS[field]) for field in SUMMARY_FIELDS}
+
+
+async def _latest_rows(db, student_ids) -> dict:
+    """student_id -> the student's most recently updated fee_tracking row"""
+    rows = {}
+    projection = {"_id": 0, "student_id": 1, "updated_at": 1, **{field: 1 for field in SUMMARY_FIELDS}}
+    async for row in db.fee_tracking.find({"student_id": {"$in": list(student_ids)}}, projection):
+        current = rows.get(row["student_id"])
+        if current is None or current.get("updated_at") is None or (row.get("updated_at") and row["updated_at"] >= current["updated_at"]):
+            rows[row["student_id"]] = row
+    return rows
+
+
+def summary_update(student_id: str, row: dict = None, timestamp: datetime = None) -> UpdateOne:
+    """Write `row`'s summary unless the student already holds a newer one"""
+    version = (row or {}).get("updated_at") or timestamp or get_current_timestamp()
+    return UpdateOne(
+        {"student_id": student_id, "$or": [{"fee_updated_at": {"$lte": version}}, {"fee_updated_at": {"$exists": False}}]},
+        {"$set": {**summary_of(row), "fee_updated_at": version}}
+    )
+
+
+async def sync_fee_summaries(db, student_ids=None, tracking_ids=None):
+    """Copy the current fee_tracking figures onto the given students (or the students owning `tracking_ids`)"""
+    student_ids = set(student_ids or [])
+    if tracking_ids:
+        student_ids |= set(await db.fee_tracking.distinct("student_id", {"tracking_id": {"$in": list(tracking_ids)}}))
+    student_ids.discard(None)
+    if not student_ids:
+        return
+    rows = await _latest_rows(db, student_ids)
+    timestamp = get_current_timestamp()
+    await db.students.bulk_write([summary_update(sid, rows.get(sid), timestamp) for sid in student_ids], ordered=False)
+
+
+def repair_update(student: dict, row: dict = None, timestamp: datetime = None) -> UpdateOne:
+    """
+    Overwrite the summary `student` was read with. Matching the stamp that was
+    read (not an older one) lets the repair replace a copy stamped newer than
+    its row, while a sync that lands in between still wins.
+    """
+    version = (row or {}).get("updated_at") or timestamp or get_current_timestamp()
+    return UpdateOne(
+        {"student_id": student["student_id"], "fee_updated_at": student.get("fee_updated_at")},
+        {"$set": {**summary_of(row), "fee_updated_at": version}}
+    )
+
+
+async def _reconcile_batch(db, students) -> int:
+    """Fix the students in `students` whose embedded summary differs from fee_tracking; returns how many were changed"""
+    rows = await _latest_rows(db, [s["student_id"] for s in students])
+    timestamp = get_current_timestamp()
+    operations = [
+        repair_update(student, rows.get(student["student_id"]), timestamp)
+        for student in students
+        if any(student.get(field) != value for field, value in summary_of(rows.get(student["student_id"])).items())
+    ]
+    if not operations:
+        return 0
+    result = await db.students.bulk_write(operations, ordered=False)
+    return result.modified_count
+
+
+async def _student_batches(db, after: str = None):
+    """Students with their embedded summary, RECONCILE_BATCH_SIZE at a time in student_id order"""
+    projection = {"_id": 0, "student_id": 1, "fee_updated_at": 1, **{field: 1 for field in SUMMARY_FIELDS}}
+    while True:
+        query = {"student_id": {"$gt": after}} if after else {"student_id": {"$type": "string"}}
+        students = await db.students.find(query, projection).sort("student_id", 1).limit(RECONCILE_BATCH_SIZE).to_list(RECONCILE_BATCH_SIZE)
+        if not students:
+            return
+        yield students
+        after = students[-1]["student_id"]
+
+
+async def reconcile_fee_summaries(db, job):
+    """Job handler: repair drifted summaries for every student, resuming from the checkpoint"""
+    checkpoint = job.get("checkpoint") or {}
+    fixed = checkpoint.get("fixed") or 0
+    done = (job.get("progress") or {}).get("done") or 0
+    await report_progress(db, job["job_id"], done=done, total=await db.students.estimated_document_count())
+
+    async for students in _student_batches(db, checkpoint.get("last_student_id")):
+        fixed += await _reconcile_batch(db, students)
+        done += len(students)
+        await report_progress(db, job["job_id"], done=done, checkpoint={"last_student_id": students[-1]["student_id"], "fixed": fixed})
+    return {"checked": done, "fixed": fixed}
+
+
+async def backfill_fee_summaries(db):
+    """Migration step: embed summaries on all existing students"""
+    async for students in _student_batches(db):
+        await _reconcile_batch(db, students)
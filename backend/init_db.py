@@ -1,8 +1,7 @@
 import asyncio
-from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 from pathlib import Path
-import os
+from database import db_name_warning, mongo_settings, get_client, get_database
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -11,12 +10,15 @@ async def init_database():
     """Initialize MongoDB database with collections and indexes"""
     
     # Connect to MongoDB
-    mongo_url = os.environ['MONGO_URL']
-    client = AsyncIOMotorClient(mongo_url)
-    db = client[os.environ['DB_NAME']]
+    settings = mongo_settings()
+    client = get_client()
+    db = get_database()
     
-    print(f"Connecting to MongoDB at: {mongo_url}")
-    print(f"Using database: {os.environ['DB_NAME']}")
+    print(f"Connecting to MongoDB at: {settings['uri']}")
+    print(f"Using database: {settings['db_name']}")
+    warning = db_name_warning(settings)
+    if warning:
+        print(f"⚠️  {warning}")
     
     try:
         # Test connection
@@ -80,6 +82,12 @@ async def init_database():
         await db.payments.create_index("payment_id", unique=True)
         await db.payments.create_index("razorpay_order_id", unique=True)
         await db.payments.create_index("student_id")
+        await db.payments.create_index(
+            "razorpay_payment_id",
+            unique=True,
+            partialFilterExpression={"razorpay_payment_id": {"$type": "string"}},
+            name="uniq_razorpay_payment_id"
+        )
         print("✅ Payments collection indexes created")
         
         # Announcements collection indexes
@@ -123,7 +131,7 @@ async def init_database():
             print("ℹ️  Admin user already exists")
         
         print("\n🎉 Database initialization completed successfully!")
-        print(f"📊 Database '{os.environ['DB_NAME']}' is ready for use.")
+        print(f"📊 Database '{settings['db_name']}' is ready for use.")
         
     except Exception as e:
         print(f"❌ Error initializing database: {e}")
@@ -0,0 +1,201 @@
+"""Installment plans for fee_tracking rows and the overdue sweep.
+
+Each fee_tracking row is split into installments by its fee structure's
+frequency (yearly: 1, quarterly: 4, monthly: 12), due on the 10th of the
+month through the April-March academic year. Due dates are BSON dates.
+
+Installments that are not fully paid carry `outstanding: True`; the sweep
+and the overdue queries only ever read the partial index on those, never
+the paid history. Payments are allocated to installments in due-date order
+by sync_installments(), which is called wherever paid_amount or
+total_fee_amount changes.
+"""
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime, timedelta, timezone
+
+from pymongo import UpdateOne
+
+from leases import acquire_lease
+from utils import generate_id, get_current_timestamp
+
+logger = logging.getLogger(__name__)
+
+INSTALLMENT_COUNTS = {"yearly": 1, "quarterly": 4, "monthly": 12}
+DUE_DAY = 10
+# Installments whose scheduled date has already passed when the plan is created
+GRACE_DAYS = 15
+SWEEP_INTERVAL_SECONDS = int(os.getenv("OVERDUE_SWEEP_INTERVAL_SECONDS", "3600"))
+SWEEP_LEASE = "overdue_sweep"
+
+
+async def ensure_installment_indexes(db):
+    await db.fee_installments.create_index([("tracking_id", 1), ("sequence", 1)], unique=True)
+    await db.fee_installments.create_index("student_id")
+    await db.fee_installments.create_index(
+        [("due_date", 1)],
+        partialFilterExpression={"outstanding": True},
+        name="outstanding_due_date"
+    )
+
+
+async def backfill_installments(db, chunk_size: int = 500):
+    """Plans for fee_tracking rows created before installments existed"""
+    last_tracking_id = ""
+    while True:
+        rows = await db.fee_tracking.find(
+            {"tracking_id": {"$gt": last_tracking_id}}, {"_id": 0}
+        ).sort("tracking_id", 1).limit(chunk_size).to_list(chunk_size)
+        if not rows:
+            break
+        last_tracking_id = rows[-1]["tracking_id"]
+        planned = set(await db.fee_installments.distinct("tracking_id", {"tracking_id": {"$in": [r["tracking_id"] for r in rows]}}))
+        await schedule_installments(db, [r for r in rows if r["tracking_id"] not in planned and r.get("academic_year")])
+
+
+def _split(total: float, count: int):
+    share = round(total / count, 2)
+    return [share] * (count - 1) + [round(total - share * (count - 1), 2)]
+
+
+def due_dates(academic_year: str, frequency: str, created_at: datetime):
+    start_year = int(academic_year.split("-")[0])
+    step = 12 // INSTALLMENT_COUNTS.get(frequency, 1)
+    dates = []
+    for i in range(INSTALLMENT_COUNTS.get(frequency, 1)):
+        month = 4 + i * step
+        scheduled = datetime(start_year + (month - 1) // 12, (month - 1) % 12 + 1, DUE_DAY, tzinfo=timezone.utc)
+        dates.append(max(scheduled, created_at + timedelta(days=GRACE_DAYS)))
+    return dates
+
+
+def build_installments(tracking: dict, frequency: str, now: datetime = None) -> list:
+    now = now or datetime.now(timezone.utc)
+    dates = due_dates(tracking["academic_year"], frequency, now)
+    timestamp = get_current_timestamp()
+    return [{
+        "installment_id": generate_id("inst_"),
+        "tracking_id": tracking["tracking_id"],
+        "student_id": tracking.get("student_id"),
+        "unique_student_id": tracking.get("unique_student_id"),
+        "class_name": tracking.get("class_name"),
+        "section": tracking.get("section"),
+        "academic_year": tracking["academic_year"],
+        "sequence": sequence,
+        "frequency": frequency,
+        "amount": amount,
+        "paid_amount": 0.0,
+        "due_date": due_date,
+        "status": "PENDING",
+        "outstanding": amount > 0,
+        "created_at": timestamp
+    } for sequence, (amount, due_date) in enumerate(zip(_split(tracking.get("total_fee_amount") or 0.0, len(dates)), dates), start=1)]
+
+
+async def schedule_installments(db, trackings):
+    """
+    Create the installment plan for new fee_tracking rows, using each row's
+    fee structure frequency (section structure, else class-wide). Idempotent.
+    """
+    trackings = [t for t in trackings if t]
+    if not trackings:
+        return
+    frequencies = {}
+    async for fee in db.fee_structures.find(
+        {"class_id": {"$in": list({t.get("class_name") for t in trackings})}}, {"_id": 0, "class_id": 1, "section": 1, "frequency": 1}
+    ):
+        frequencies[(fee.get("class_id"), fee.get("section"))] = fee.get("frequency") or "yearly"
+    operations = []
+    for tracking in trackings:
+        frequency = frequencies.get((tracking.get("class_name"), tracking.get("section")),
+                                    frequencies.get((tracking.get("class_name"), None), "yearly"))
+        for installment in build_installments(tracking, frequency):
+            operations.append(UpdateOne(
+                {"tracking_id": installment["tracking_id"], "sequence": installment["sequence"]},
+                {"$setOnInsert": installment},
+                upsert=True
+            ))
+    await db.fee_installments.bulk_write(operations, ordered=False)
+    await sync_installments(db, [t["tracking_id"] for t in trackings])
+
+
+async def sync_installments(db, tracking_ids, now: datetime = None):
+    """
+    Re-split each row's total across its installments and allocate its
+    paid_amount to them in due-date order; keeps fee_tracking.overdue_since
+    in step. Call after paid_amount or total_fee_amount changes.
+    """
+    tracking_ids = list(set(tracking_ids))
+    if not tracking_ids:
+        return
+    now = now or datetime.now(timezone.utc)
+    trackings = {t["tracking_id"]: t async for t in db.fee_tracking.find(
+        {"tracking_id": {"$in": tracking_ids}}, {"_id": 0, "tracking_id": 1, "total_fee_amount": 1, "paid_amount": 1, "overdue_since": 1}
+    )}
+    plans = {}
+    async for installment in db.fee_installments.find({"tracking_id": {"$in": tracking_ids}}).sort([("tracking_id", 1), ("sequence", 1)]):
+        plans.setdefault(installment["tracking_id"], []).append(installment)
+
+    installment_ops, tracking_ops = [], []
+    for tracking_id, plan in plans.items():
+        tracking = trackings.get(tracking_id)
+        if not tracking:
+            continue
+        remaining = tracking.get("paid_amount") or 0.0
+        overdue_since = None
+        for installment, amount in zip(plan, _split(tracking.get("total_fee_amount") or 0.0, len(plan))):
+            paid = round(min(amount, remaining), 2)
+            remaining = round(remaining - paid, 2)
+            if paid >= amount:
+                status = "PAID"
+            elif installment["due_date"] < now:
+                status = "OVERDUE"
+                overdue_since = overdue_since or installment["due_date"]
+            else:
+                status = "PENDING"
+            fields = {"amount": amount, "paid_amount": paid, "status": status, "outstanding": status != "PAID"}
+            if any(installment.get(k) != v for k, v in fields.items()):
+                installment_ops.append(UpdateOne({"_id": installment["_id"]}, {"$set": fields}))
+        if tracking.get("overdue_since") != overdue_since:
+            tracking_ops.append(UpdateOne({"tracking_id": tracking_id}, {"$set": {"overdue_since": overdue_since}}))
+    if installment_ops:
+        await db.fee_installments.bulk_write(installment_ops, ordered=False)
+    if tracking_ops:
+        await db.fee_tracking.bulk_write(tracking_ops, ordered=False)
+
+
+async def sweep_overdue(db, now: datetime = None) -> int:
+    """Flip unpaid installments past their due date to OVERDUE; reads only the outstanding partial index"""
+    now = now or datetime.now(timezone.utc)
+    due = {"outstanding": True, "status": "PENDING", "due_date": {"$lt": now}}
+    newly_overdue = await db.fee_installments.distinct("tracking_id", due)
+    if not newly_overdue:
+        return 0
+    result = await db.fee_installments.update_many(due, {"$set": {"status": "OVERDUE"}})
+    # Earliest unpaid due date per affected row, also from the partial index
+    pipeline = [
+        {"$match": {"outstanding": True, "tracking_id": {"$in": newly_overdue}, "status": "OVERDUE"}},
+        {"$group": {"_id": "$tracking_id", "overdue_since": {"$min": "$due_date"}}}
+    ]
+    tracking_ops = [
+        UpdateOne({"tracking_id": group["_id"]}, {"$set": {"overdue_since": group["overdue_since"]}})
+        async for group in db.fee_installments.aggregate(pipeline)
+    ]
+    if tracking_ops:
+        await db.fee_tracking.bulk_write(tracking_ops, ordered=False)
+    logger.info(f"Overdue sweep: {result.modified_count} installments now overdue")
+    return result.modified_count
+
+
+async def run_overdue_sweeper(db, interval: int = SWEEP_INTERVAL_SECONDS):
+    """Runs in every worker; the lease lets only one of them sweep per interval"""
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    while True:
+        try:
+            if await acquire_lease(db, SWEEP_LEASE, owner, interval):
+                await sweep_overdue(db)
+        except Exception as e:
+            logger.error(f"Overdue sweep failed: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,52 @@
+"""Single-use invites for accounts created without a password.
+
+Bulk imports may leave the password column empty. Such accounts get an
+invite token instead: only its SHA-256 digest is stored on the user, the
+token itself goes to the admin (import report) and to the user by email.
+Accepting the invite sets the password and activates the account in one
+conditional update, so a token works once and only before it expires.
+Knowing the email address alone is never enough to take over the account.
+"""
+import hashlib
+import secrets
+from datetime import timedelta
+
+from pymongo import ReturnDocument
+
+from utils import get_current_timestamp
+
+INVITE_TTL = timedelta(days=14)
+
+
+async def ensure_invite_indexes(db):
+    await db.users.create_index(
+        "invite_token_hash", unique=True, partialFilterExpression={"invite_token_hash": {"$type": "string"}}
+    )
+
+
+def invite_digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def new_invite(now=None):
+    """(token, fields to store on the user)"""
+    token = secrets.token_urlsafe(32)
+    now = now or get_current_timestamp()
+    return token, {"invite_token_hash": invite_digest(token), "invite_expires_at": now + INVITE_TTL}
+
+
+async def accept_invite(db, token: str, password_hash: str):
+    """Set the password of the invited account; returns the user, or None for an unknown, used or expired token"""
+    return await db.users.find_one_and_update(
+        {"invite_token_hash": invite_digest(token), "invite_expires_at": {"$gt": get_current_timestamp()}, "password": None},
+        {"$set": {"password": password_hash, "is_active": True}, "$unset": {"invite_token_hash": "", "invite_expires_at": ""}},
+        projection={"_id": 0, "password": 0},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def reissue_invite(db, user_id: str):
+    """New token for an account that still has no password; None if it has one (or does not exist)"""
+    token, fields = new_invite()
+    result = await db.users.update_one({"user_id": user_id, "password": None}, {"$set": fields})
+    return token if result.matched_count else None
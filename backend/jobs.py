@@ -0,0 +1,94 @@
+"""Background jobs with progress reporting.
+
+A job is a document in `jobs` that records its kind, parameters, status
+(QUEUED -> RUNNING -> DONE/FAILED), progress counters and an optional
+checkpoint. Handlers are plain coroutines `handler(db, job)` that call
+report_progress() as they go and return a result dict. Admins poll
+GET /api/admin/jobs/{job_id}.
+"""
+import logging
+import traceback
+from datetime import datetime, timedelta, timezone
+
+from utils import generate_id, get_current_timestamp
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = "QUEUED", "RUNNING", "DONE", "FAILED"
+
+# A RUNNING job that has not reported progress for this long is assumed dead and may be resumed
+STALE_AFTER_SECONDS = 600
+
+
+async def ensure_job_indexes(db):
+    await db.jobs.create_index("job_id", unique=True)
+    await db.jobs.create_index([("kind", 1), ("created_at", -1)])
+
+
+async def create_job(db, kind: str, params: dict, created_by: str = None) -> dict:
+    timestamp = get_current_timestamp()
+    job = {
+        "job_id": generate_id("job_"),
+        "kind": kind,
+        "params": params,
+        "status": QUEUED,
+        "progress": {"done": 0, "total": None},
+        "checkpoint": None,
+        "result": None,
+        "error": None,
+        "created_by": created_by,
+        "created_at": timestamp,
+        "updated_at": timestamp
+    }
+    await db.jobs.insert_one(job)
+    job.pop("_id", None)
+    return job
+
+
+async def get_job(db, job_id: str):
+    return await db.jobs.find_one({"job_id": job_id}, {"_id": 0})
+
+
+async def report_progress(db, job_id: str, done: int = None, total: int = None, checkpoint=None):
+    """Record progress; pass a checkpoint for work that can resume from it"""
+    fields = {"updated_at": get_current_timestamp()}
+    if done is not None:
+        fields["progress.done"] = done
+    if total is not None:
+        fields["progress.total"] = total
+    if checkpoint is not None:
+        fields["checkpoint"] = checkpoint
+    await db.jobs.update_one({"job_id": job_id}, {"$set": fields})
+
+
+async def run_job(db, job_id: str, handler):
+    """
+    Run `handler(db, job)` and record the outcome; meant to be scheduled as a
+    background task. Failed or stale jobs are picked up again with their
+    last checkpoint.
+    """
+    stale_before = datetime.now(timezone.utc) - timedelta(seconds=STALE_AFTER_SECONDS)
+    job = await db.jobs.find_one_and_update(
+        {"job_id": job_id, "$or": [
+            {"status": {"$in": [QUEUED, FAILED]}},
+            {"status": RUNNING, "updated_at": {"$lt": stale_before}}
+        ]},
+        {"$set": {"status": RUNNING, "error": None, "started_at": get_current_timestamp(), "updated_at": get_current_timestamp()}},
+        projection={"_id": 0}
+    )
+    if not job:
+        logger.info("Job %s is already running or finished", job_id)
+        return
+    try:
+        result = await handler(db, job)
+    except Exception as e:
+        logger.error("Job %s (%s) failed: %s", job_id, job["kind"], traceback.format_exc())
+        await db.jobs.update_one(
+            {"job_id": job_id},
+            {"$set": {"status": FAILED, "error": str(e), "updated_at": get_current_timestamp()}}
+        )
+        return
+    await db.jobs.update_one(
+        {"job_id": job_id},
+        {"$set": {"status": DONE, "result": result, "finished_at": get_current_timestamp(), "updated_at": get_current_timestamp()}}
+    )
@@ -0,0 +1,27 @@
+"""Mongo-backed leases so only one worker runs a given piece of work at a time."""
+from datetime import datetime, timedelta, timezone
+
+from pymongo.errors import DuplicateKeyError
+
+
+async def acquire_lease(db, name: str, owner: str, ttl_seconds: int) -> bool:
+    """
+    Take (or renew) the lease `name` for `owner`. Returns False while another
+    owner holds an unexpired lease. An expired lease can be taken over, so a
+    crashed holder never blocks the others for longer than `ttl_seconds`.
+    """
+    now = datetime.now(timezone.utc)
+    try:
+        await db.locks.find_one_and_update(
+            {"_id": name, "$or": [{"expires_at": {"$lt": now}}, {"owner": owner}]},
+            {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=ttl_seconds), "acquired_at": now}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        # The filter missed an existing, live lease and the upsert collided with it
+        return False
+
+
+async def release_lease(db, name: str, owner: str):
+    await db.locks.delete_one({"_id": name, "owner": owner})
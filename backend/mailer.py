@@ -68,3 +68,26 @@ def notify_user_on_rejection(email: str):
     subject = 'Your registration was rejected'
     body = 'Your registration was rejected by the admin. If you believe this is a mistake, contact the school admin.'
     send_email(email, subject, body)
+
+
+def notify_each(notify, emails):
+    """Send one notification per address; meant to run as a background task"""
+    for email in emails:
+        notify(email)
+
+
+def notify_user_of_invite(email: str, token: str):
+    subject = 'Activate your school account'
+    body = (
+        'An account has been created for you by the school admin.\n\n'
+        f'Your activation code is: {token}\n\n'
+        'Use it on the account activation page to choose your password. '
+        'The code works only once and expires after two weeks; ask the admin for a new one if it has expired.'
+    )
+    send_email(email, subject, body)
+
+
+def notify_invites(invites):
+    """Send one invite per (email, token) pair; meant to run as a background task"""
+    for email, token in invites:
+        notify_user_of_invite(email, token)
@@ -0,0 +1,145 @@
+"""Validation and grading for whole exam sheets uploaded in one request.
+
+A marks row is keyed on (student_id, subject, exam_name, academic_year). The
+academic year comes from the exam date, so "Unit Test 1" next year is a new
+row and never overwrites this year's.
+"""
+import logging
+
+from pydantic import ValidationError
+from pymongo import ReplaceOne, UpdateOne
+
+from models import MarksBulkCreate, MarksBulkRow
+from utils import academic_year_of, calculate_grade, generate_id, get_current_timestamp
+
+logger = logging.getLogger(__name__)
+
+
+EXAM_KEY = ("student_id", "subject", "exam_name", "academic_year")
+BACKFILL_BATCH_SIZE = 1000
+
+
+def marks_academic_year(mark: dict):
+    """Academic year of the exam, from exam_date, else from when the row was created"""
+    for value in (mark.get("exam_date"), mark.get("created_at")):
+        if not value:
+            continue
+        try:
+            return academic_year_of(value)
+        except ValueError:
+            continue
+    return None
+
+
+async def _backfill_academic_year(db):
+    operations = []
+    async for mark in db.marks.find({"academic_year": {"$exists": False}}, {"_id": 1, "exam_date": 1, "created_at": 1}):
+        operations.append(UpdateOne({"_id": mark["_id"]}, {"$set": {"academic_year": marks_academic_year(mark)}}))
+        if len(operations) >= BACKFILL_BATCH_SIZE:
+            await db.marks.bulk_write(operations, ordered=False)
+            operations = []
+    if operations:
+        await db.marks.bulk_write(operations, ordered=False)
+
+
+async def archive_duplicate_marks(db) -> int:
+    """
+    Move all but the newest marks row per (student, subject, exam, academic
+    year) into marks_duplicates, so the unique index can be built. Rows of
+    the same exam name in different years are not duplicates and stay.
+    """
+    pipeline = [
+        {"$sort": {"updated_at": -1, "created_at": -1, "_id": -1}},
+        {"$group": {"_id": {field: f"${field}" for field in EXAM_KEY}, "ids": {"$push": "$_id"}}},
+        {"$match": {"ids.1": {"$exists": True}}}
+    ]
+    archived = 0
+    async for group in db.marks.aggregate(pipeline, allowDiskUse=True):
+        keep, extra = group["ids"][0], group["ids"][1:]
+        timestamp = get_current_timestamp()
+        # Upserts, so a rerun after a crash between the two writes is harmless
+        await db.marks_duplicates.bulk_write([
+            ReplaceOne({"_id": doc["_id"]}, {**doc, "duplicate_of": keep, "archived_at": timestamp}, upsert=True)
+            async for doc in db.marks.find({"_id": {"$in": extra}})
+        ])
+        await db.marks.delete_many({"_id": {"$in": extra}})
+        archived += len(extra)
+    if archived:
+        logger.warning(f"Archived {archived} duplicate marks rows to marks_duplicates")
+    return archived
+
+
+async def ensure_marks_indexes(db):
+    """One marks row per (student, subject, exam, academic year)"""
+    await _backfill_academic_year(db)
+    await archive_duplicate_marks(db)
+    await db.marks.create_index([(field, 1) for field in EXAM_KEY], unique=True, name="uniq_exam_marks")
+
+
+async def existing_student_ids(db, raw_rows) -> set:
+    """The student_ids referenced by the sheet that belong to a student"""
+    ids = {str(raw["student_id"]) for raw in raw_rows if isinstance(raw, dict) and raw.get("student_id") is not None}
+    if not ids:
+        return set()
+    return set(await db.students.distinct("student_id", {"student_id": {"$in": list(ids)}}))
+
+
+def build_marks_upserts(sheet: MarksBulkCreate, raw_rows, uploaded_by: str, known_student_ids: set = None):
+    """
+    Validate every row of the sheet and compute its grade in a single pass.
+    Returns (operations, errors): one upsert per valid row keyed on
+    (student_id, subject, exam_name, academic_year), and per-row error
+    reports. Rows of students not in `known_student_ids` are errors too, when
+    it is given. ValueError if the sheet's exam_date is not a date.
+    """
+    academic_year = academic_year_of(sheet.exam_date)
+    timestamp = get_current_timestamp()
+    operations, errors, seen = [], [], set()
+    for index, raw in enumerate(raw_rows, start=1):
+        if not isinstance(raw, dict):
+            errors.append({"row": index, "student_id": None, "errors": ["row: must be an object"]})
+            continue
+        try:
+            row = MarksBulkRow(**{k: v for k, v in raw.items() if v is not None})
+        except ValidationError as e:
+            errors.append({"row": index, "student_id": raw.get("student_id"), "errors": [f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()]})
+            continue
+
+        subject = row.subject or sheet.subject
+        exam_name = row.exam_name or sheet.exam_name
+        total_marks = row.total_marks if row.total_marks is not None else sheet.total_marks
+        problems = []
+        if not subject:
+            problems.append("subject: required")
+        if not exam_name:
+            problems.append("exam_name: required")
+        if total_marks is None or total_marks <= 0:
+            problems.append("total_marks: must be greater than 0")
+        elif not 0 <= row.marks_obtained <= total_marks:
+            problems.append(f"marks_obtained: must be between 0 and {total_marks:g}")
+        if known_student_ids is not None and row.student_id not in known_student_ids:
+            problems.append("student_id: no such student")
+        key = (row.student_id, subject, exam_name)
+        if key in seen:
+            problems.append("duplicate row for this student, subject and exam")
+        if problems:
+            errors.append({"row": index, "student_id": row.student_id, "errors": problems})
+            continue
+        seen.add(key)
+
+        operations.append(UpdateOne(
+            {"student_id": row.student_id, "subject": subject, "exam_name": exam_name, "academic_year": academic_year},
+            {
+                "$set": {
+                    "marks_obtained": row.marks_obtained,
+                    "total_marks": total_marks,
+                    "grade": row.grade or calculate_grade(row.marks_obtained, total_marks),
+                    "uploaded_by": uploaded_by,
+                    "exam_date": sheet.exam_date,
+                    "updated_at": timestamp
+                },
+                "$setOnInsert": {"marks_id": generate_id("mrk_"), "created_at": timestamp}
+            },
+            upsert=True
+        ))
+    return operations, errors
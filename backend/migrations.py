@@ -0,0 +1,200 @@
+"""Versioned, run-once schema migrations.
+
+Applied migrations are recorded in `schema_migrations`. On startup every
+worker reads that collection once; if nothing is pending it does no schema
+work at all. Otherwise one worker takes the migration lease and applies the
+pending steps in order while the others wait for it to finish. The lease is
+renewed in the background while a step runs, since backfills over whole
+collections can outlast its TTL; a worker that loses it stops instead of
+racing the new holder.
+
+Add new steps to the end of MIGRATIONS; never rename or reorder applied ones.
+
+Usage: python migrations.py
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+from pathlib import Path
+
+from pymongo import UpdateOne
+
+from admin_search import ensure_admin_search_indexes
+from bson_dates import convert_timestamps
+from counters import seed_roll_counters
+from dashboards import ensure_dashboard_indexes
+from defaulters import ensure_defaulter_indexes
+from exports import ensure_export_indexes
+from fee_summary import backfill_fee_summaries, ensure_fee_summary_indexes
+from fee_recompute import ensure_fee_recompute_indexes
+from fee_payments import ensure_payment_claim_index, ensure_payment_history_index, ensure_payment_indexes, trim_payment_history
+from installments import backfill_installments, ensure_installment_indexes
+from invites import ensure_invite_indexes
+from jobs import ensure_job_indexes
+from leases import acquire_lease, release_lease
+from marks_bulk import ensure_marks_indexes
+from parent_links import backfill_parent_links
+from payment_events import ensure_payment_event_indexes
+from query_filters import ensure_list_indexes
+from rollover import ensure_rollover_indexes
+from student_search import backfill_search_terms, ensure_search_index
+from utils import generate_id, get_current_timestamp
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = "schema_migrations"
+LEASE_TTL_SECONDS = 120
+HEARTBEAT_SECONDS = 30
+
+
+class MigrationLeaseLost(RuntimeError):
+    """Another worker took the migration lease while this one was applying a step"""
+
+
+async def students_roster_index(db):
+    """
+    Unique (academic_year, class_name, section, roll_number), the key roll
+    numbers are allocated on (see counters.py); only students with a roll
+    number are indexed
+    """
+    legacy = "class_name_1_section_1_roll_number_1"
+    if legacy in await db.students.index_information():
+        await db.students.drop_index(legacy)
+    await db.students.create_index(
+        [("academic_year", 1), ("class_name", 1), ("section", 1), ("roll_number", 1)],
+        unique=True,
+        partialFilterExpression={"roll_number": {"$type": "string"}},
+        name="uniq_roster_roll_number"
+    )
+
+
+async def default_fee_structures(db):
+    """Class-wide fee structures for classes 1-10 (Class 1: ₹5,000 ... Class 10: ₹50,000)"""
+    ops = []
+    for class_num in range(1, 11):
+        total_fee = class_num * 5000.0
+        ops.append(UpdateOne(
+            {"class_id": str(class_num), "section": None},
+            {
+                "$set": {
+                    "tuition_fee": total_fee * 0.625,      # 62.5%
+                    "exam_fee": total_fee * 0.125,         # 12.5%
+                    "lab_fee": total_fee * 0.0625,         # 6.25%
+                    "transport": total_fee * 0.1875,       # 18.75%
+                    "scholarship": 0.0
+                },
+                "$setOnInsert": {
+                    "fee_id": generate_id("fee_"),
+                    "frequency": "yearly",
+                    "created_at": get_current_timestamp()
+                }
+            },
+            upsert=True
+        ))
+    await db.fee_structures.bulk_write(ops, ordered=False)
+
+
+MIGRATIONS = [
+    ("0001_students_roster_index", students_roster_index),
+    ("0002_default_fee_structures", default_fee_structures),
+    ("0003_payment_indexes", ensure_payment_indexes),
+    ("0004_payment_event_indexes", ensure_payment_event_indexes),
+    ("0005_marks_exam_unique", ensure_marks_indexes),
+    ("0006_seed_roll_counters", seed_roll_counters),
+    ("0007_job_indexes", ensure_job_indexes),
+    ("0008_rollover_indexes", ensure_rollover_indexes),
+    ("0009_fee_recompute_index", ensure_fee_recompute_indexes),
+    ("0010_installment_indexes", ensure_installment_indexes),
+    ("0011_backfill_installments", backfill_installments),
+    ("0012_defaulter_indexes", ensure_defaulter_indexes),
+    ("0013_student_search_index", ensure_search_index),
+    ("0014_backfill_student_search_terms", backfill_search_terms),
+    ("0015_admin_search_indexes", ensure_admin_search_indexes),
+    ("0016_list_filter_indexes", ensure_list_indexes),
+    ("0017_fee_summary_indexes", ensure_fee_summary_indexes),
+    ("0018_backfill_fee_summaries", backfill_fee_summaries),
+    ("0019_payment_history_index", ensure_payment_history_index),
+    ("0020_trim_payment_history", trim_payment_history),
+    ("0021_timestamps_to_dates", convert_timestamps),
+    ("0022_unify_parent_links", backfill_parent_links),
+    ("0023_dashboard_indexes", ensure_dashboard_indexes),
+    ("0024_payment_claim_index", ensure_payment_claim_index),
+    ("0025_user_invite_index", ensure_invite_indexes),
+    ("0026_export_date_indexes", ensure_export_indexes),
+]
+
+
+async def _pending(db):
+    applied = {doc["_id"] async for doc in db.schema_migrations.find({}, {"_id": 1})}
+    return [(name, step) for name, step in MIGRATIONS if name not in applied]
+
+
+async def _heartbeat(db, owner: str):
+    """Renew the lease every HEARTBEAT_SECONDS; returns as soon as a renewal fails"""
+    while True:
+        await asyncio.sleep(HEARTBEAT_SECONDS)
+        if not await acquire_lease(db, LEASE_NAME, owner, LEASE_TTL_SECONDS):
+            return
+
+
+async def _run_step(db, name: str, step, owner: str):
+    """Run one step while heartbeating the lease; abort the step if the lease is lost"""
+    step_task = asyncio.ensure_future(step(db))
+    heartbeat = asyncio.ensure_future(_heartbeat(db, owner))
+    try:
+        done, _ = await asyncio.wait({step_task, heartbeat}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        heartbeat.cancel()
+        if not step_task.done():
+            step_task.cancel()
+    if step_task not in done:
+        raise MigrationLeaseLost(f"Lost the migration lease while applying {name}; aborted it")
+    step_task.result()
+
+
+async def run_migrations(db, owner: str = None, wait_timeout: float = None):
+    """
+    Apply pending migrations exactly once across all workers. Returns the names applied here.
+
+    Workers that do not get the lease wait until the holder has applied
+    everything (or take over if it dies and its lease expires); they never
+    return while migrations are still pending. With `wait_timeout` they raise
+    instead of waiting longer than that.
+    """
+    if not await _pending(db):
+        return []
+
+    owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+    deadline = time.monotonic() + wait_timeout if wait_timeout is not None else None
+    while not await acquire_lease(db, LEASE_NAME, owner, LEASE_TTL_SECONDS):
+        if not await _pending(db):
+            return []
+        if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError("Timed out waiting for another worker to finish migrations")
+        await asyncio.sleep(1)
+
+    applied = []
+    try:
+        # Whoever held the lease before us may already have applied everything
+        for name, step in await _pending(db):
+            logger.info(f"Applying migration {name}")
+            await _run_step(db, name, step, owner)
+            if not await acquire_lease(db, LEASE_NAME, owner, LEASE_TTL_SECONDS):
+                raise MigrationLeaseLost(f"Lost the migration lease before recording {name}")
+            await db.schema_migrations.insert_one({"_id": name, "applied_at": get_current_timestamp(), "applied_by": owner})
+            applied.append(name)
+    finally:
+        await release_lease(db, LEASE_NAME, owner)
+    return applied
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    from database import get_database
+
+    load_dotenv(Path(__file__).parent / '.env')
+    logging.basicConfig(level=logging.INFO)
+    applied = asyncio.run(run_migrations(get_database()))
+    print(f"Applied {len(applied)} migration(s): {', '.join(applied) or 'none pending'}")
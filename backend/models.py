@@ -3,6 +3,8 @@ from typing import Optional, List
 from datetime import datetime
 from enum import Enum
 
+from utils import current_academic_year
+
 class UserRole(str, Enum):
     ADMIN = "ADMIN"
     FACULTY = "FACULTY"
@@ -19,7 +21,7 @@ class User(BaseModel):
     phone: Optional[str] = None
     avatar: Optional[str] = None
     is_active: bool = True
-    created_at: str
+    created_at: datetime
 
 class UserCreate(BaseModel):
     email: EmailStr
@@ -32,6 +34,24 @@ class UserLogin(BaseModel):
     email: EmailStr
     password: str
 
+class InviteAccept(BaseModel):
+    token: str
+    password: str
+
+class UserIdsAction(BaseModel):
+    user_ids: List[str] = Field(min_length=1, max_length=1000)
+
+class StudentIdsAction(BaseModel):
+    student_ids: List[str] = Field(min_length=1, max_length=1000)
+
+class FacultyIdsAction(BaseModel):
+    faculty_ids: List[str] = Field(min_length=1, max_length=1000)
+
+class RolloverRequest(BaseModel):
+    from_year: Optional[str] = Field(default=None, pattern=r"^\d{4}-\d{4}$")
+    to_year: Optional[str] = Field(default=None, pattern=r"^\d{4}-\d{4}$")
+    dry_run: bool = True
+
 class TokenResponse(BaseModel):
     access_token: str
     token_type: str = "bearer"
@@ -48,19 +68,18 @@ class Student(BaseModel):
     class_name: str
     section: str
     roll_number: str
-    parent_ids: List[str] = []  # Multiple parents can be linked
     admission_number: str
-    admission_date: str
+    admission_date: datetime
     date_of_birth: Optional[str] = None
     gender: Optional[str] = None  # M, F, Other
     blood_group: Optional[str] = None
     aadhaar_id: Optional[str] = None
     student_photo_url: Optional[str] = None
     address: Optional[str] = None
-    academic_year: str = "2025-2026"
+    academic_year: str = Field(default_factory=current_academic_year)
     previous_school: Optional[str] = None
     previous_class: Optional[str] = None
-    created_at: str
+    created_at: datetime
 
 class StudentCreate(BaseModel):
     user_id: str
@@ -70,7 +89,7 @@ class StudentCreate(BaseModel):
     section: str
     roll_number: str
     admission_number: str
-    academic_year: str = "2025-2026"
+    academic_year: str = Field(default_factory=current_academic_year)
     date_of_birth: Optional[str] = None
     gender: Optional[str] = None
     blood_group: Optional[str] = None
@@ -79,7 +98,27 @@ class StudentCreate(BaseModel):
     address: Optional[str] = None
     previous_school: Optional[str] = None
     previous_class: Optional[str] = None
-    parent_ids: List[str] = []
+    parent_ids: List[str] = []  # linked through parent_mapping on registration
+
+class StudentImportRow(BaseModel):
+    """One row of a bulk student import file (CSV/XLSX)"""
+    model_config = ConfigDict(extra="ignore", str_strip_whitespace=True)
+
+    name: str = Field(min_length=1)
+    email: EmailStr
+    class_name: str
+    section: str
+    admission_number: Optional[str] = None
+    academic_year: str = Field(default_factory=current_academic_year)
+    phone: Optional[str] = None
+    password: Optional[str] = None
+    date_of_birth: Optional[str] = None
+    gender: Optional[str] = None
+    blood_group: Optional[str] = None
+    aadhaar_id: Optional[str] = None
+    address: Optional[str] = None
+    previous_school: Optional[str] = None
+    previous_class: Optional[str] = None
 
 class Faculty(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -90,11 +129,11 @@ class Faculty(BaseModel):
     email: EmailStr
     subject: str
     qualification: Optional[str] = None
-    joining_date: str
+    joining_date: datetime
     phone: Optional[str] = None
     assigned_class: Optional[str] = None  # Class assigned to teach (1-10)
     assigned_section: Optional[str] = None  # Section assigned to teach (A/B/C)
-    created_at: str
+    created_at: datetime
 
 class FacultyCreate(BaseModel):
     user_id: str
@@ -112,8 +151,7 @@ class Parent(BaseModel):
     name: str
     email: EmailStr
     phone: Optional[str] = None
-    children_ids: List[str] = []
-    created_at: str
+    created_at: datetime
 
 class ParentCreate(BaseModel):
     user_id: str
@@ -129,14 +167,14 @@ class ParentMapping(BaseModel):
     parent_id: str
     student_id: str
     unique_student_id: str  # SMS-2026-10A-001 format
-    relationship: str  # FATHER, MOTHER, GUARDIAN
-    parent_name: str
-    parent_email: EmailStr
-    parent_phone: str
+    relationship: Optional[str] = None  # FATHER, MOTHER, GUARDIAN; None for links made from the parent portal
+    parent_name: Optional[str] = None
+    parent_email: Optional[EmailStr] = None
+    parent_phone: Optional[str] = None
     parent_occupation: Optional[str] = None
     parent_address: Optional[str] = None
     parent_pin_code: Optional[str] = None
-    created_at: str
+    created_at: datetime
 
 class ParentMappingCreate(BaseModel):
     parent_id: str
@@ -164,11 +202,11 @@ class FeeTracking(BaseModel):
     paid_amount: float = 0.0
     pending_amount: float
     payment_status: str  # PENDING, PARTIAL, PAID
-    payment_history: List[dict] = []  # [{"date": "2025-01-01", "amount": 5000, "method": "online"}]
-    last_payment_date: Optional[str] = None
+    payment_history: List[dict] = []  # last few payments only: [{"date": "2025-01-01", "amount": 5000, "method": "online"}]; full history is in payments
+    last_payment_date: Optional[datetime] = None
     due_date: Optional[str] = None
-    created_at: str
-    updated_at: str
+    created_at: datetime
+    updated_at: datetime
 
 class FeeTrackingCreate(BaseModel):
     student_id: str
@@ -189,15 +227,15 @@ class Attendance(BaseModel):
     
     attendance_id: str
     student_id: str
-    date: str
+    date: datetime
     status: str  # PRESENT, ABSENT, LATE
     marked_by: str  # faculty_id
     remarks: Optional[str] = None
-    created_at: str
+    created_at: datetime
 
 class AttendanceCreate(BaseModel):
     student_id: str
-    date: str
+    date: str = Field(pattern=r"^\d{4}-\d{2}-\d{2}$")  # stored as midnight UTC of that day
     status: str
     marked_by: str
 
@@ -207,7 +245,7 @@ class ClassRoom(BaseModel):
 
     class_id: str
     name: str  # e.g., "1", "2", "10"
-    created_at: str
+    created_at: datetime
 
 class Section(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -216,7 +254,7 @@ class Section(BaseModel):
     class_id: str
     name: str  # e.g., 'A', 'B'
     capacity: int = 20
-    created_at: str
+    created_at: datetime
 
 class FeeStructure(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -230,7 +268,7 @@ class FeeStructure(BaseModel):
     transport: float = 0.0
     scholarship: float = 0.0
     frequency: str = 'yearly'  # monthly | quarterly | yearly
-    created_at: str
+    created_at: datetime
     remarks: Optional[str] = None
 
 class AttendanceBulkCreate(BaseModel):
@@ -248,7 +286,8 @@ class Marks(BaseModel):
     grade: Optional[str] = None
     uploaded_by: str  # faculty_id
     exam_date: str
-    created_at: str
+    academic_year: Optional[str] = None
+    created_at: datetime
 
 class MarksCreate(BaseModel):
     student_id: str
@@ -260,6 +299,22 @@ class MarksCreate(BaseModel):
     uploaded_by: str
     exam_date: str
 
+class MarksBulkRow(BaseModel):
+    student_id: str
+    marks_obtained: float
+    grade: Optional[str] = None
+    # Optional per-row overrides of the sheet-level values
+    subject: Optional[str] = None
+    exam_name: Optional[str] = None
+    total_marks: Optional[float] = None
+
+class MarksBulkCreate(BaseModel):
+    subject: Optional[str] = None
+    exam_name: Optional[str] = None
+    total_marks: Optional[float] = None
+    exam_date: str
+    rows: List[MarksBulkRow]
+
 class Fee(BaseModel):
     model_config = ConfigDict(extra="ignore")
     
@@ -270,7 +325,7 @@ class Fee(BaseModel):
     status: str  # PENDING, PAID, OVERDUE
     fee_type: str  # TUITION, TRANSPORT, EXAM, etc
     academic_year: str
-    created_at: str
+    created_at: datetime
 
 class FeeCreate(BaseModel):
     student_id: str
@@ -291,8 +346,8 @@ class Payment(BaseModel):
     razorpay_order_id: Optional[str] = None
     razorpay_payment_id: Optional[str] = None
     status: str  # SUCCESS, PENDING, FAILED
-    payment_date: str
-    created_at: str
+    payment_date: datetime
+    created_at: datetime
 
 class PaymentCreate(BaseModel):
     amount: float
@@ -317,7 +372,7 @@ class Notification(BaseModel):
     message: str
     type: str  # INFO, WARNING, SUCCESS, ERROR
     is_read: bool = False
-    created_at: str
+    created_at: datetime
 
 class NotificationCreate(BaseModel):
     user_id: str
@@ -334,7 +389,7 @@ class Announcement(BaseModel):
     target_roles: List[str]  # ["STUDENT", "PARENT", "FACULTY"]
     created_by: str  # admin or faculty user_id
     priority: str  # HIGH, MEDIUM, LOW
-    created_at: str
+    created_at: datetime
     expires_at: Optional[str] = None
 
 class AnnouncementCreate(BaseModel):
@@ -353,7 +408,7 @@ class Timetable(BaseModel):
     section: str
     day: str
     periods: List[dict]  # [{"period": 1, "subject": "Math", "faculty": "John", "time": "9:00-10:00"}]
-    created_at: str
+    created_at: datetime
 
 class TimetableCreate(BaseModel):
     class_name: str
@@ -366,4 +421,4 @@ class ChatMessage(BaseModel):
 
 class ChatResponse(BaseModel):
     response: str
-    timestamp: str
+    timestamp: datetime
@@ -0,0 +1,145 @@
+"""Parent <-> student links.
+
+`parent_mapping` is the one place a link lives: one document per
+(parent_id, student_id) pair, carrying the parent's contact details and the
+student's unique ID for display and search. Both directions are index
+lookups: (parent_id, student_id) for "my children" and access checks,
+(student_id, parent_id) for "this student's parents".
+
+Links used to be spread over parents.children_ids, students.parent_ids,
+students.parent_id and parent_mapping, each read by a different endpoint;
+backfill_parent_links folds the first three into parent_mapping and removes
+them.
+"""
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from admin_search import backfill_contact_terms, contact_search_terms
+from utils import generate_id, get_current_timestamp
+
+CONTACT_FIELDS = ("parent_name", "parent_email", "parent_phone", "parent_occupation", "parent_address", "parent_pin_code")
+BACKFILL_BATCH_SIZE = 1000
+
+
+async def ensure_parent_link_indexes(db):
+    linked = {"student_id": {"$type": "string"}, "parent_id": {"$type": "string"}}
+    await db.parent_mapping.create_index(
+        [("parent_id", 1), ("student_id", 1)], unique=True, partialFilterExpression=linked, name="parent_student"
+    )
+    await db.parent_mapping.create_index([("student_id", 1), ("parent_id", 1)], name="student_parent")
+
+
+def parent_contact(parent: dict) -> dict:
+    """Mapping contact fields from a parents profile"""
+    return {"parent_name": parent.get("name"), "parent_email": parent.get("email"), "parent_phone": parent.get("phone")}
+
+
+def _given(details: dict) -> dict:
+    return {field: value for field, value in (details or {}).items() if field in CONTACT_FIELDS and value is not None}
+
+
+def link_update(parent_id: str, student: dict, details: dict = None, relationship: str = None, defaults: dict = None) -> UpdateOne:
+    """
+    Upsert for one link. `details` and `relationship` overwrite what they
+    provide; `defaults` only fill a link that does not exist yet.
+    """
+    fields = {"unique_student_id": student.get("unique_student_id"), **_given(details)}
+    if relationship:
+        fields["relationship"] = relationship
+    on_insert = {"mapping_id": generate_id("map_"), "created_at": get_current_timestamp(), "relationship": None, **_given(defaults)}
+    on_insert = {field: value for field, value in on_insert.items() if field not in fields}
+    return UpdateOne(
+        {"parent_id": parent_id, "student_id": student["student_id"]},
+        {"$set": fields, "$setOnInsert": on_insert},
+        upsert=True
+    )
+
+
+async def link_parent(db, parent_id: str, student: dict, details: dict = None, relationship: str = None, defaults: dict = None) -> dict:
+    """Create or update the link and return the stored mapping"""
+    operation = link_update(parent_id, student, details, relationship, defaults)
+    try:
+        await db.parent_mapping.bulk_write([operation])
+    except BulkWriteError:
+        # A concurrent upsert inserted the pair first; this one now matches it
+        await db.parent_mapping.bulk_write([operation])
+    pair = {"parent_id": parent_id, "student_id": student["student_id"]}
+    mapping = await db.parent_mapping.find_one(pair, {"_id": 0})
+    # The contact details are only final once merged with what was stored, so the terms follow the write
+    terms = contact_search_terms("parent_mapping", mapping)
+    if mapping.pop("search_terms", None) != terms:
+        await db.parent_mapping.update_one(pair, {"$set": {"search_terms": terms}})
+    return mapping
+
+
+async def children_ids(db, parent_id: str) -> list:
+    return await db.parent_mapping.distinct("student_id", {"parent_id": parent_id, "student_id": {"$type": "string"}})
+
+
+async def is_linked(db, parent_id: str, student_id: str) -> bool:
+    return await db.parent_mapping.count_documents({"parent_id": parent_id, "student_id": student_id}, limit=1) > 0
+
+
+async def mappings_for_student(db, student_id: str) -> list:
+    return await db.parent_mapping.find({"student_id": student_id}, {"_id": 0, "search_terms": 0}).sort("parent_id", 1).to_list(100)
+
+
+async def _resolve_mapping_students(db):
+    """Older mappings only recorded the unique student ID"""
+    async for mapping in db.parent_mapping.find({"student_id": {"$not": {"$type": "string"}}, "unique_student_id": {"$type": "string"}}, {"_id": 1, "unique_student_id": 1}):
+        student = await db.students.find_one({"unique_student_id": mapping["unique_student_id"]}, {"_id": 0, "student_id": 1})
+        if student:
+            await db.parent_mapping.update_one({"_id": mapping["_id"]}, {"$set": {"student_id": student["student_id"]}})
+
+
+async def _drop_duplicate_mappings(db):
+    """Keep the oldest mapping per pair so the unique index can be built"""
+    pipeline = [
+        {"$match": {"parent_id": {"$type": "string"}, "student_id": {"$type": "string"}}},
+        {"$sort": {"_id": 1}},
+        {"$group": {"_id": {"parent_id": "$parent_id", "student_id": "$student_id"}, "ids": {"$push": "$_id"}}},
+        {"$match": {"ids.1": {"$exists": True}}}
+    ]
+    async for group in db.parent_mapping.aggregate(pipeline, allowDiskUse=True):
+        await db.parent_mapping.delete_many({"_id": {"$in": group["ids"][1:]}})
+
+
+async def _flush(db, operations):
+    if operations:
+        await db.parent_mapping.bulk_write(operations, ordered=False)
+    operations.clear()
+
+
+async def backfill_parent_links(db):
+    """Migration step: move every legacy link into parent_mapping, then drop the legacy fields"""
+    await _resolve_mapping_students(db)
+    await _drop_duplicate_mappings(db)
+    await ensure_parent_link_indexes(db)
+
+    student_projection = {"_id": 0, "student_id": 1, "unique_student_id": 1}
+    operations = []
+    async for parent in db.parents.find({"children_ids.0": {"$exists": True}}, {"_id": 0, "parent_id": 1, "name": 1, "email": 1, "phone": 1, "children_ids": 1}):
+        async for student in db.students.find({"student_id": {"$in": parent["children_ids"]}}, student_projection):
+            operations.append(link_update(parent["parent_id"], student, defaults=parent_contact(parent)))
+        if len(operations) >= BACKFILL_BATCH_SIZE:
+            await _flush(db, operations)
+    await _flush(db, operations)
+
+    legacy = {"$or": [{"parent_ids.0": {"$exists": True}}, {"parent_id": {"$type": "string"}}]}
+    async for student in db.students.find(legacy, {**student_projection, "parent_ids": 1, "parent_id": 1}):
+        parent_ids = set(student.get("parent_ids") or [])
+        if student.get("parent_id"):
+            parent_ids.add(student["parent_id"])
+        profiles = {p["parent_id"]: p async for p in db.parents.find({"parent_id": {"$in": list(parent_ids)}}, {"_id": 0})}
+        for parent_id in parent_ids:
+            operations.append(link_update(parent_id, student, defaults=parent_contact(profiles.get(parent_id) or {})))
+        if len(operations) >= BACKFILL_BATCH_SIZE:
+            await _flush(db, operations)
+    await _flush(db, operations)
+
+    await db.parents.update_many({"children_ids": {"$exists": True}}, {"$unset": {"children_ids": ""}})
+    await db.students.update_many(
+        {"$or": [{"parent_ids": {"$exists": True}}, {"parent_id": {"$exists": True}}]}, {"$unset": {"parent_ids": "", "parent_id": ""}}
+    )
+    # The links written above carry no search_terms yet
+    await backfill_contact_terms(db, "parent_mapping")
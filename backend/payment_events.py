@@ -0,0 +1,192 @@
+"""Batched consumer for Razorpay webhook events.
+
+The webhook endpoint only verifies the signature and appends the raw event to
+`payment_events`. This module drains that collection in batches and applies
+captured payments to `payments`/`fee_tracking`.
+
+Usage: python payment_events.py
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from fee_payments import applied_rows, credit_filter, credit_pipeline, finish_credits, lease_claims, reconcile_processing_payments
+from utils import generate_id, get_current_timestamp
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+CLAIM_TIMEOUT = timedelta(minutes=5)
+PAYMENT_EVENTS = ("payment.captured", "order.paid")
+
+
+async def ensure_payment_event_indexes(db):
+    await db.payment_events.create_index("event_id", unique=True)
+    await db.payment_events.create_index([("status", 1), ("received_at", 1)])
+
+
+def _tracking_filter(notes: dict):
+    """Orders carry the fee_tracking key in their notes (see create-order endpoints)"""
+    if notes.get("tracking_id"):
+        return "tracking_id", notes["tracking_id"]
+    if notes.get("unique_student_id"):
+        return "unique_student_id", notes["unique_student_id"]
+    return None, None
+
+
+def _payment_entity(event: dict) -> dict:
+    """payload.payment.entity, or {} when any level is missing or not an object"""
+    entity = event
+    for key in ("payload", "payment", "entity"):
+        entity = entity.get(key) if isinstance(entity, dict) else None
+    return entity if isinstance(entity, dict) else {}
+
+
+async def _claim_batch(db, batch_size: int):
+    stale_before = datetime.now(timezone.utc) - CLAIM_TIMEOUT
+    claimable = {"$or": [
+        {"status": "PENDING"},
+        {"status": "PROCESSING", "claimed_at": {"$lt": stale_before}}
+    ]}
+    candidates = await db.payment_events.find(claimable, {"_id": 1}).sort("received_at", 1).limit(batch_size).to_list(batch_size)
+    if not candidates:
+        return []
+
+    claim_token = generate_id("claim_")
+    await db.payment_events.update_many(
+        {"_id": {"$in": [c["_id"] for c in candidates]}, **claimable},
+        {"$set": {"status": "PROCESSING", "claim_token": claim_token, "claimed_at": get_current_timestamp()},
+         "$inc": {"attempts": 1}}
+    )
+    return await db.payment_events.find({"claim_token": claim_token}).to_list(batch_size)
+
+
+async def process_payment_events(db, batch_size: int = BATCH_SIZE) -> int:
+    """Apply one batch of pending events. Returns the number of events claimed."""
+    events = await _claim_batch(db, batch_size)
+    if not events:
+        return 0
+
+    ignored = {}
+    payments = []
+    for event in events:
+        if event.get("event") not in PAYMENT_EVENTS:
+            ignored[event["_id"]] = "unhandled event type"
+            continue
+        entity = _payment_entity(event)
+        key, value = _tracking_filter(entity.get("notes") if isinstance(entity.get("notes"), dict) else {})
+        if not entity.get("id") or not key:
+            ignored[event["_id"]] = "payment is not linked to a fee record"
+            continue
+        payments.append((event["_id"], key, value, entity))
+
+    # One lookup for every fee_tracking row referenced by the batch
+    tracking_rows = {}
+    for key in ("tracking_id", "unique_student_id"):
+        values = [value for _, k, value, _ in payments if k == key]
+        if values:
+            async for row in db.fee_tracking.find({key: {"$in": values}}, {"_id": 0, "tracking_id": 1, "unique_student_id": 1, "student_id": 1}):
+                tracking_rows[(key, row.get(key))] = row
+
+    claims = []
+    for event_id, key, value, entity in payments:
+        row = tracking_rows.get((key, value))
+        if not row:
+            ignored[event_id] = "fee record not found"
+            continue
+        timestamp = get_current_timestamp()
+        claims.append({
+            "payment_id": generate_id("pay_"),
+            "fee_id": row.get("tracking_id"),
+            "student_id": row.get("student_id"),
+            "unique_student_id": row.get("unique_student_id"),
+            "amount": entity.get("amount", 0) / 100,
+            "payment_method": "razorpay",
+            "razorpay_order_id": entity.get("order_id"),
+            "razorpay_payment_id": entity["id"],
+            "status": "PROCESSING",
+            "tracking_filter": {"tracking_id": row.get("tracking_id")},
+            "source": "webhook",
+            "payment_date": timestamp,
+            "created_at": timestamp
+        })
+
+    # The unique razorpay_payment_id index rejects payments that were already
+    # claimed, either by an earlier event or by the /verify endpoints
+    if claims:
+        try:
+            await db.payments.insert_many(claims, ordered=False)
+        except BulkWriteError as e:
+            if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                raise
+
+    # Credit every claim for these payments that is still PROCESSING and not
+    # being credited elsewhere: ours, and any left by a batch or verify call
+    # that died before finishing. The applied_payment_ids guard makes
+    # re-crediting a no-op.
+    applied = 0
+    razorpay_ids = [claim["razorpay_payment_id"] for claim in claims]
+    pending = []
+    if razorpay_ids:
+        payment_ids = await db.payments.distinct("payment_id", {"razorpay_payment_id": {"$in": razorpay_ids}, "status": "PROCESSING"})
+        token, pending = await lease_claims(db, payment_ids)
+    if pending:
+        timestamp = get_current_timestamp()
+        result = await db.fee_tracking.bulk_write(
+            [UpdateOne(credit_filter(claim), credit_pipeline(claim, timestamp)) for claim in pending], ordered=False
+        )
+        applied = result.modified_count
+        rows = await applied_rows(db, pending)
+        done = [claim for claim in pending if claim["payment_id"] in rows]
+        if done:
+            await finish_credits(db, token, done, rows)
+
+    processed_at = get_current_timestamp()
+    done_ids = [event["_id"] for event in events if event["_id"] not in ignored]
+    if done_ids:
+        await db.payment_events.update_many(
+            {"_id": {"$in": done_ids}},
+            {"$set": {"status": "DONE", "processed_at": processed_at}, "$unset": {"claim_token": ""}}
+        )
+    if ignored:
+        await db.payment_events.bulk_write([
+            UpdateOne({"_id": event_id}, {"$set": {"status": "IGNORED", "reason": reason, "processed_at": processed_at},
+                                          "$unset": {"claim_token": ""}})
+            for event_id, reason in ignored.items()
+        ], ordered=False)
+
+    logger.info(f"Processed {len(events)} payment events: {applied} applied, {len(ignored)} ignored")
+    return len(events)
+
+
+async def run_consumer(db, batch_size: int = BATCH_SIZE, poll_interval: float = 1.0):
+    """Drain payment_events forever, sleeping only when the queue is empty"""
+    await ensure_payment_event_indexes(db)
+    while True:
+        try:
+            claimed = await process_payment_events(db, batch_size)
+        except Exception as e:
+            logger.error(f"Payment event batch failed: {e}")
+            claimed = 0
+        if claimed < batch_size:
+            # Idle: finish any payment claim a crashed verify call left PROCESSING
+            try:
+                credited = await reconcile_processing_payments(db)
+                if credited:
+                    logger.info(f"Credited {credited} stale payment claims")
+            except Exception as e:
+                logger.error(f"Payment claim reconcile failed: {e}")
+            await asyncio.sleep(poll_interval)
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    from database import get_database
+
+    load_dotenv(Path(__file__).parent / '.env')
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_consumer(get_database()))
@@ -0,0 +1,112 @@
+"""Shared filter/sort grammar for list endpoints.
+
+A filter spec maps a query parameter to (field, operator, type):
+
+    eq   exact match            ?class_name=7
+    in   comma separated list   ?payment_status=PARTIAL,PENDING
+    gte  lower bound            ?min_pending=1000
+    lte  upper bound            ?max_pending=5000
+
+A sort spec maps a public sort name to a field; prefix it with "-" for
+descending (?sort=-pending_amount). A unique tiebreaker field is always
+appended so skip/limit pages are stable. Bad values raise ValueError, which
+endpoints turn into a 400.
+"""
+
+PAYMENT_STATUSES = ("PENDING", "PARTIAL", "PAID")
+
+
+def payment_status(value: str) -> str:
+    if value.upper() not in PAYMENT_STATUSES:
+        raise ValueError(value)
+    return value.upper()
+
+
+# Students carry their fee summary (see fee_summary.py), so payment filters need no join
+STUDENT_FILTERS = {
+    "class_name": ("class_name", "eq", str),
+    "section": ("section", "eq", str),
+    "academic_year": ("academic_year", "eq", str),
+    "payment_status": ("payment_status", "in", payment_status),
+    "min_pending": ("pending_amount", "gte", float),
+    "max_pending": ("pending_amount", "lte", float),
+}
+STUDENT_SORTS = {
+    "name": "name",
+    "class_name": "class_name",
+    "admission_date": "admission_date",
+    "created_at": "created_at",
+    "pending_amount": "pending_amount",
+    "paid_amount": "paid_amount",
+    "total_fee_amount": "total_fee_amount",
+}
+
+FACULTY_FILTERS = {
+    "subject": ("subject", "eq", str),
+    "assigned_class": ("assigned_class", "eq", str),
+    "assigned_section": ("assigned_section", "eq", str),
+    "is_active": ("is_active", "eq", bool),
+}
+FACULTY_SORTS = {"name": "name", "subject": "subject", "joining_date": "joining_date"}
+
+FEE_STRUCTURE_FILTERS = {
+    "class_id": ("class_id", "eq", str),
+    "section": ("section", "eq", str),
+    "frequency": ("frequency", "in", str),
+}
+FEE_STRUCTURE_SORTS = {"class_id": "class_id", "created_at": "created_at"}
+
+
+async def ensure_list_indexes(db):
+    """Compound indexes behind the filter + sort combinations above (equality fields first, then the sort)"""
+    await db.students.create_index([("class_name", 1), ("section", 1), ("name", 1)])
+    await db.students.create_index([("academic_year", 1), ("class_name", 1), ("section", 1), ("name", 1)])
+    await db.faculty.create_index([("assigned_class", 1), ("assigned_section", 1)])
+    await db.faculty.create_index([("subject", 1), ("name", 1)])
+
+
+def _convert(param: str, value, kind):
+    if kind is bool:
+        if isinstance(value, bool):
+            return value
+        if str(value).lower() in ("true", "1", "yes"):
+            return True
+        if str(value).lower() in ("false", "0", "no"):
+            return False
+        raise ValueError(f"{param} must be true or false")
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {param}: {value!r}")
+
+
+def build_filter(spec: dict, params: dict) -> dict:
+    """Mongo query from the non-empty params named in `spec`"""
+    query = {}
+    for param, (field, operator, kind) in spec.items():
+        value = params.get(param)
+        if value is None or value == "":
+            continue
+        if operator == "in":
+            values = [_convert(param, v.strip(), kind) for v in str(value).split(",") if v.strip()]
+            query[field] = values[0] if len(values) == 1 else {"$in": values}
+        elif operator in ("gte", "lte"):
+            condition = query.get(field) if isinstance(query.get(field), dict) else {}
+            condition[f"${operator}"] = _convert(param, value, kind)
+            query[field] = condition
+        else:
+            query[field] = _convert(param, value, kind)
+    return query
+
+
+def parse_sort(spec: dict, sort: str, tiebreaker: str) -> list:
+    """[(field, direction), ..., (tiebreaker, direction)] for "name" / "-name"; None/"" -> tiebreaker only"""
+    if not sort:
+        return [(tiebreaker, 1)]
+    direction = -1 if sort.startswith("-") else 1
+    name = sort.lstrip("-+")
+    if name not in spec:
+        raise ValueError(f"sort must be one of {', '.join(spec)} (prefix with - for descending)")
+    return [(spec[name], direction), (tiebreaker, direction)]
+
+
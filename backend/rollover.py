@@ -0,0 +1,320 @@
+"""Academic-year rollover.
+
+Moves every assigned student from `from_year` to `to_year`:
+
+- class N students are promoted to class N+1 in the same section and get
+  roll numbers 1..n in name order; class 10 students graduate and leave the
+  roster (class, section and roll number are kept under `promotion`);
+- their fee_tracking rows are moved to fee_tracking_archive and new rows for
+  `to_year` (with installment plans) are created from fee_structures.
+
+Sections are processed from class 10 down to class 1, so every target
+section has already been vacated when a class moves into it. Each section
+is written in bounded batches and recorded in the job checkpoint once done.
+Every write is filtered on the old academic year or keyed on the new one,
+so re-running (or resuming a failed job) never promotes anyone twice.
+
+Within a batch the students are written first and only the ones actually
+moved get their fee rows rolled. A student whose new roll number collides
+with someone already in the target section stays put, fee rows intact, and
+is listed in the job result under `roll_number_conflicts`. Moved students
+carry `promotion.fees_pending` until their fees are done, so a run that
+dies in between is finished by the next one.
+
+Sections that end up over capacity are only reported (by the estimate);
+moving students into other sections is left to the admin.
+"""
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from counters import SECTION_CAPACITY, roll_counter_id
+from fee_summary import sync_fee_summaries
+from installments import schedule_installments
+from jobs import report_progress
+from utils import fee_structure_total, generate_id, get_current_timestamp
+
+BATCH_SIZE = 500
+TOP_CLASS = 10
+
+
+async def ensure_rollover_indexes(db):
+    await db.students.create_index([("academic_year", 1), ("class_name", 1), ("section", 1)])
+    await db.fee_tracking.create_index("student_id")
+    await db.fee_tracking.create_index("unique_student_id")
+    await db.fee_tracking_archive.create_index("tracking_id", unique=True)
+    await db.fee_tracking_archive.create_index([("student_id", 1), ("academic_year", 1)])
+
+
+def _roster_filter(academic_year):
+    return {
+        "academic_year": academic_year,
+        "class_name": {"$in": [str(c) for c in range(1, TOP_CLASS + 1)]},
+        "section": {"$ne": None},
+        "unique_student_id": {"$ne": "PENDING"}
+    }
+
+
+async def _sections(db, from_year):
+    """(class_name, section, student count) still at from_year, top class first"""
+    pipeline = [
+        {"$match": _roster_filter(from_year)},
+        {"$group": {"_id": {"class_name": "$class_name", "section": "$section"}, "count": {"$sum": 1}}}
+    ]
+    groups = [(g["_id"]["class_name"], g["_id"]["section"], g["count"]) async for g in db.students.aggregate(pipeline)]
+    return sorted(groups, key=lambda g: (-int(g[0]), g[1]))
+
+
+async def _fee_totals(db):
+    return {(fee.get("class_id"), fee.get("section")): fee_structure_total(fee) async for fee in db.fee_structures.find({}, {"_id": 0})}
+
+
+def _fee_total_for(fee_totals, class_name, section):
+    return fee_totals.get((class_name, section), fee_totals.get((class_name, None)))
+
+
+async def _count_fee_rows_to_archive(db, from_year, to_year) -> int:
+    """fee_tracking rows of the roster not for `to_year`, counted in the database"""
+    pipeline = [
+        {"$match": _roster_filter(from_year)},
+        {"$lookup": {
+            "from": "fee_tracking",
+            "let": {"student_id": "$student_id"},
+            "pipeline": [
+                {"$match": {"$expr": {"$and": [{"$eq": ["$student_id", "$$student_id"]}, {"$ne": ["$academic_year", to_year]}]}}},
+                {"$count": "rows"}
+            ],
+            "as": "fees"
+        }},
+        {"$group": {"_id": None, "rows": {"$sum": {"$sum": "$fees.rows"}}}}
+    ]
+    result = await db.students.aggregate(pipeline, allowDiskUse=True).to_list(1)
+    return result[0]["rows"] if result else 0
+
+
+async def estimate_rollover(db, from_year: str, to_year: str) -> dict:
+    """Dry run: what a rollover would do, without writing anything"""
+    sections = await _sections(db, from_year)
+    fee_totals = await _fee_totals(db)
+    promote = graduate = new_tracking = 0
+    missing_fee_structures, over_capacity = set(), []
+    for class_name, section, count in sections:
+        if int(class_name) == TOP_CLASS:
+            graduate += count
+            continue
+        promote += count
+        new_class = str(int(class_name) + 1)
+        if _fee_total_for(fee_totals, new_class, section) is None:
+            missing_fee_structures.add(f"{new_class}{section}")
+        else:
+            new_tracking += count
+        if count > SECTION_CAPACITY:
+            over_capacity.append(f"{new_class}{section}")
+    to_archive = await _count_fee_rows_to_archive(db, from_year, to_year)
+    return {
+        "from_year": from_year,
+        "to_year": to_year,
+        "students_promoted": promote,
+        "students_graduating": graduate,
+        "sections": len(sections),
+        "fee_tracking_to_archive": to_archive,
+        "fee_tracking_to_create": new_tracking,
+        "missing_fee_structures": sorted(missing_fee_structures),
+        "sections_over_capacity": over_capacity,
+        "batches": sum(-(-count // BATCH_SIZE) for _, _, count in sections)
+    }
+
+
+def _student_update(student, from_year, to_year, new_class, roll_number, timestamp):
+    promotion = {
+        "from_year": from_year,
+        "class_name": student["class_name"],
+        "section": student["section"],
+        "roll_number": student.get("roll_number"),
+        # Cleared once the student's fee rows are rolled too (see _roll_fees)
+        "fees_pending": True
+    }
+    if new_class is None:
+        return {
+            "$set": {"status": "GRADUATED", "is_active": False, "graduated_at": timestamp, "promotion": promotion},
+            "$unset": {"class_name": "", "section": "", "roll_number": ""}
+        }
+    return {"$set": {
+        "class_name": new_class,
+        "roll_number": str(roll_number),
+        "academic_year": to_year,
+        "promotion": promotion,
+        "updated_at": timestamp
+    }}
+
+
+async def _roll_fees(db, students, to_year, fee_totals):
+    """
+    Archive the students' fee rows from earlier years and create their rows
+    for `to_year`. `students` are already written: promoted ones carry their
+    new class and section, graduates have none. Safe to repeat.
+    """
+    if not students:
+        return
+    timestamp = get_current_timestamp()
+    student_ids = [s["student_id"] for s in students]
+    tracking_ops = []
+    for student in students:
+        new_class, section = student.get("class_name"), student.get("section")
+        total_fee = _fee_total_for(fee_totals, new_class, section) if new_class else None
+        if total_fee is None:
+            continue
+        tracking_ops.append(UpdateOne(
+            {"student_id": student["student_id"], "academic_year": to_year},
+            {"$setOnInsert": {
+                "tracking_id": generate_id("track_"),
+                "unique_student_id": student.get("unique_student_id"),
+                "class_name": new_class,
+                "section": section,
+                "total_fee_amount": total_fee,
+                "paid_amount": 0.0,
+                "pending_amount": total_fee,
+                "payment_status": "PENDING",
+                "payment_history": [],
+                "created_at": timestamp,
+                "updated_at": timestamp
+            }},
+            upsert=True
+        ))
+
+    # Archive last year's fee rows before the new ones exist, so lookups by student_id stay unambiguous
+    old_rows = await db.fee_tracking.find({"student_id": {"$in": student_ids}, "academic_year": {"$ne": to_year}}).to_list(None)
+    if old_rows:
+        try:
+            await db.fee_tracking_archive.bulk_write(
+                [InsertOne({**row, "archived_at": timestamp, "archived_for": to_year}) for row in old_rows], ordered=False
+            )
+        except BulkWriteError as e:
+            # Rows archived by an earlier, interrupted run
+            if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                raise
+        await db.fee_tracking.delete_many({"_id": {"$in": [row["_id"] for row in old_rows]}})
+
+    if tracking_ops:
+        await db.fee_tracking.bulk_write(tracking_ops, ordered=False)
+        new_rows = await db.fee_tracking.find({"student_id": {"$in": student_ids}, "academic_year": to_year}, {"_id": 0}).to_list(None)
+        await schedule_installments(db, new_rows)
+    await sync_fee_summaries(db, student_ids=student_ids)
+    await db.students.update_many({"student_id": {"$in": student_ids}}, {"$unset": {"promotion.fees_pending": ""}})
+
+
+async def _roll_batch(db, students, from_year, to_year, new_class, first_roll, fee_totals):
+    """
+    Move one batch of students, then their fee rows. Returns (moved, conflicts):
+    the students written and the ones whose new roll number collided with
+    a student already in the target section, which are left where they are
+    with their fee rows untouched.
+    """
+    timestamp = get_current_timestamp()
+    student_ops = [
+        UpdateOne(
+            {"student_id": student["student_id"], "academic_year": from_year},
+            _student_update(student, from_year, to_year, new_class, first_roll + offset, timestamp)
+        )
+        for offset, student in enumerate(students)
+    ]
+    failed = set()
+    try:
+        await db.students.bulk_write(student_ops, ordered=False)
+    except BulkWriteError as e:
+        write_errors = e.details.get("writeErrors", [])
+        if any(err.get("code") != 11000 for err in write_errors):
+            raise
+        failed = {err["index"] for err in write_errors}
+
+    moved, conflicts = [], []
+    for offset, student in enumerate(students):
+        if offset in failed:
+            conflicts.append(student)
+        elif new_class is None:
+            moved.append({**student, "class_name": None, "section": None, "roll_number": None})
+        else:
+            moved.append({**student, "class_name": new_class, "roll_number": str(first_roll + offset)})
+    await _roll_fees(db, moved, to_year, fee_totals)
+    return moved, conflicts
+
+
+async def _roll_section(db, from_year, to_year, class_name, section, fee_totals):
+    """Promote (or graduate) one section; returns (students moved, students left behind on a roll-number conflict)"""
+    new_class = None if int(class_name) == TOP_CLASS else str(int(class_name) + 1)
+    next_roll = 1
+    if new_class:
+        # Continue after anyone already in the target section for to_year: direct
+        # admissions, or students moved by an interrupted run of this section
+        taken = await db.students.find(
+            {"academic_year": to_year, "class_name": new_class, "section": section}, {"_id": 0, "roll_number": 1}
+        ).to_list(None)
+        next_roll = max([int(s["roll_number"]) for s in taken if str(s.get("roll_number") or "").isdigit()] or [0]) + 1
+
+    moved, conflicts, assigned = 0, [], []
+    query = {"academic_year": from_year, "class_name": class_name, "section": section, "unique_student_id": {"$ne": "PENDING"}}
+    projection = {"_id": 0, "student_id": 1, "unique_student_id": 1, "class_name": 1, "section": 1, "roll_number": 1}
+    while True:
+        # Always read the first batch: students written by the previous batch no longer match,
+        # and students left behind on a conflict are excluded
+        if conflicts:
+            query["student_id"] = {"$nin": [s["student_id"] for s in conflicts]}
+        batch = await db.students.find(query, projection).sort([("name", 1), ("student_id", 1)]).limit(BATCH_SIZE).to_list(BATCH_SIZE)
+        if not batch:
+            break
+        batch_moved, batch_conflicts = await _roll_batch(db, batch, from_year, to_year, new_class, next_roll, fee_totals)
+        next_roll += len(batch)
+        moved += len(batch_moved)
+        conflicts += batch_conflicts
+        assigned += [int(s["roll_number"]) for s in batch_moved if s.get("roll_number")]
+
+    if new_class and assigned:
+        await db.counters.update_one(
+            {"_id": roll_counter_id(to_year, new_class, section)},
+            {
+                "$addToSet": {"taken": {"$each": assigned}},
+                "$setOnInsert": {"academic_year": to_year, "class_name": new_class, "section": section}
+            },
+            upsert=True
+        )
+    return moved, conflicts
+
+
+async def _finish_interrupted_fees(db, from_year, to_year, fee_totals):
+    """Fee rows of students an interrupted run moved but did not get to roll the fees of"""
+    query = {"promotion.from_year": from_year, "promotion.fees_pending": True}
+    projection = {"_id": 0, "student_id": 1, "unique_student_id": 1, "class_name": 1, "section": 1}
+    while True:
+        batch = await db.students.find(query, projection).limit(BATCH_SIZE).to_list(BATCH_SIZE)
+        if not batch:
+            return
+        await _roll_fees(db, batch, to_year, fee_totals)
+
+
+async def run_rollover(db, job):
+    """Job handler for kind "academic_rollover"; params: from_year, to_year"""
+    from_year, to_year = job["params"]["from_year"], job["params"]["to_year"]
+    checkpoint = job.get("checkpoint") or {"completed_sections": []}
+    completed = list(checkpoint["completed_sections"])
+    done = (job.get("progress") or {}).get("done") or 0
+
+    sections = await _sections(db, from_year)
+    fee_totals = await _fee_totals(db)
+    await report_progress(db, job["job_id"], done=done, total=done + sum(count for _, _, count in sections))
+
+    await _finish_interrupted_fees(db, from_year, to_year, fee_totals)
+    promoted = graduated = 0
+    conflicts = []
+    for class_name, section, _ in sections:
+        moved, left = await _roll_section(db, from_year, to_year, class_name, section, fee_totals)
+        if int(class_name) == TOP_CLASS:
+            graduated += moved
+        else:
+            promoted += moved
+        conflicts += [{"student_id": s["student_id"], "class_name": class_name, "section": section} for s in left]
+        done += moved + len(left)
+        completed.append(f"{class_name}{section}")
+        await report_progress(db, job["job_id"], done=done, checkpoint={"completed_sections": completed})
+    return {
+        "from_year": from_year, "to_year": to_year, "promoted": promoted, "graduated": graduated,
+        "sections": completed, "roll_number_conflicts": conflicts
+    }
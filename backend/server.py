@@ -1,138 +1,104 @@
-from fastapi import FastAPI, APIRouter, Depends, HTTPException, status
+from fastapi import FastAPI, APIRouter, BackgroundTasks, Depends, HTTPException, Request, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
 from dotenv import load_dotenv
 from pathlib import Path
 import os
 import logging
 from datetime import datetime, timezone
-import razorpay
 import hmac
 import hashlib
+import json
+import asyncio
 from contextlib import asynccontextmanager
 
 from models import (
-    User, UserCreate, UserLogin, TokenResponse, UserRole,
-    Student, StudentCreate, Faculty, FacultyCreate, Parent, ParentCreate,
-    ParentMapping, ParentMappingCreate, FeeTracking, FeeTrackingCreate, FeeTrackingUpdate,
-    Attendance, AttendanceCreate, AttendanceBulkCreate,
-    Marks, MarksCreate, Fee, FeeCreate, Payment, PaymentCreate, PaymentVerify,
-    Notification, NotificationCreate, Announcement, AnnouncementCreate,
-    Timetable, TimetableCreate, ChatMessage, ChatResponse
+    User, UserCreate, UserLogin, InviteAccept, TokenResponse, UserRole, UserIdsAction,
+    StudentIdsAction, FacultyIdsAction, RolloverRequest,
+    StudentCreate, ParentMappingCreate, AttendanceBulkCreate,
+    Marks, MarksCreate, Fee, FeeCreate, PaymentCreate, PaymentVerify,
+    MarksBulkCreate, ChatMessage, ChatResponse
 )
 from auth import (
     get_password_hash, verify_password, create_access_token,
     get_current_user, require_role
 )
-from utils import generate_id, get_current_timestamp, calculate_percentage, generate_student_id
+from utils import academic_year_of, generate_id, get_current_timestamp, day_start, calculate_percentage, generate_student_id, current_academic_year, next_academic_year, fee_structure_total
+from database import LazyDatabase, mongo_settings, pool_metrics
+from fee_payments import apply_verified_payment, payment_history_page
+from migrations import run_migrations
+from student_import import StudentImporter, iter_student_rows
+from marks_bulk import build_marks_upserts, existing_student_ids
+from counters import SectionFullError, release_roll_numbers, release_students_roll_numbers, reserve_roll_numbers
+from user_approvals import approve_users, reject_users
+from invites import accept_invite, reissue_invite
+from cascade_delete import delete_students, delete_faculty_members, purge_attendance
+from jobs import create_job, get_job, run_job
+from rollover import estimate_rollover, run_rollover
+from fee_recompute import recompute_fee_tracking
+from fee_summary import SUMMARY_DEFAULTS, reconcile_fee_summaries, sync_fee_summaries
+from installments import run_overdue_sweeper, schedule_installments, sweep_overdue
+from defaulters import SORTS, aging_summary, defaulter_query, encode_cursor, iter_defaulters
+from student_search import search_students, search_terms
+from admin_search import contact_search_terms, global_search
+from dashboards import STUDENT_PROJECTION, faculty_home, parent_dashboard, parse_if_none_match, student_dashboard
+from parent_links import children_ids, is_linked, link_parent, mappings_for_student, parent_contact
+from query_filters import (
+    FACULTY_FILTERS, FACULTY_SORTS, FEE_STRUCTURE_FILTERS, FEE_STRUCTURE_SORTS, STUDENT_FILTERS, STUDENT_SORTS,
+    build_filter, parse_sort
+)
+from exports import DATASETS, EXPORT_FORMATS, export_columns, export_cursor, export_query, streaming_export
+from tabular import iter_rows
+from pydantic import ValidationError
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-MONGO_URI = os.getenv("MONGODB_URI")
-
-if not MONGO_URI:
-    raise RuntimeError("MONGODB_URI is not set")
-
-client = AsyncIOMotorClient(
-    MONGO_URI,
-    serverSelectionTimeoutMS=5000
-)
-
-db = client["smart_school_db"]
+# The Motor client is only built on first use, after gunicorn has forked
+db = LazyDatabase()
 
 razorpay_key_id = os.environ.get('RAZORPAY_KEY_ID', '')
 razorpay_key_secret = os.environ.get('RAZORPAY_KEY_SECRET', '')
-razorpay_client = razorpay.Client(auth=(razorpay_key_id, razorpay_key_secret)) if razorpay_key_id else None
+razorpay_webhook_secret = os.environ.get('RAZORPAY_WEBHOOK_SECRET', '')
+_razorpay_client = None
+
+def get_razorpay_client():
+    """Import the Razorpay SDK and build its client on first use; None when keys are missing"""
+    global _razorpay_client
+    if _razorpay_client is None and razorpay_key_id:
+        import razorpay
+        _razorpay_client = razorpay.Client(auth=(razorpay_key_id, razorpay_key_secret))
+    return _razorpay_client
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def initialize_database():
-    """Initialize database indexes and default fee structures on startup"""
-    try:
-        # Get all existing indexes on the students collection
-        indexes = await db.students.list_indexes().to_list(None)
-        index_names = [idx.get("name") for idx in indexes]
-        
-        # Drop conflicting compound indexes if they exist
-        target_index_name = "class_name_1_section_1_roll_number_1"
-        if target_index_name in index_names:
-            try:
-                await db.students.drop_index(target_index_name)
-                logger.info(f"Dropped existing index: {target_index_name}")
-            except Exception as e:
-                logger.warning(f"Could not drop index {target_index_name}: {e}")
-        
-        # Create a compound unique index on class_name, section, roll_number
-        # sparse=True ensures null values are ignored in the unique constraint
-        await db.students.create_index(
-            [("class_name", 1), ("section", 1), ("roll_number", 1)],
-            unique=True,
-            sparse=True
-        )
-        logger.info("Created compound unique index on class_name, section, roll_number")
-        
-        # Initialize default fee structures for all classes
-        # Class 10: ₹50,000 (Razorpay test limit), Class 9: ₹45,000, ..., Class 1: ₹5,000
-        for class_num in range(1, 11):  # Classes 1-10
-            class_id = str(class_num)
-            total_fee = (class_num * 5000.0)  # Class 1: 5k, Class 2: 10k, ..., Class 10: 50k
-            
-            # Check if fee structure already exists
-            existing = await db.fee_structures.find_one({"class_id": class_id, "section": None})
-            if existing:
-                # Update existing fee structure
-                await db.fee_structures.update_one(
-                    {"class_id": class_id, "section": None},
-                    {"$set": {
-                        "tuition_fee": total_fee * 0.625,
-                        "exam_fee": total_fee * 0.125,
-                        "lab_fee": total_fee * 0.0625,
-                        "transport": total_fee * 0.1875,
-                        "scholarship": 0.0,
-                        "created_at": get_current_timestamp()
-                    }}
-                )
-                logger.info(f"Updated default fee structure for class {class_num}: ₹{total_fee}")
-            else:
-                # Create default fee structure with fees proportional to class number
-                fee_structure = {
-                    "class_id": class_id,
-                    "section": None,  # Class-wide structure
-                    "tuition_fee": total_fee * 0.625,      # 62.5%
-                    "exam_fee": total_fee * 0.125,         # 12.5%
-                    "lab_fee": total_fee * 0.0625,         # 6.25%
-                    "transport": total_fee * 0.1875,       # 18.75%
-                    "scholarship": 0.0,
-                    "created_at": get_current_timestamp()
-                }
-                await db.fee_structures.insert_one(fee_structure)
-                logger.info(f"Created default fee structure for class {class_num}: ₹{total_fee}")
-    except Exception as e:
-        logger.error(f"Error initializing startup: {e}")
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup
-    await initialize_database()
+    # Startup: no-op unless a migration is pending; then one worker applies it.
+    # A failed migration stops the worker: later steps and the code both assume the schema is current.
+    try:
+        await run_migrations(db)
+    except Exception:
+        logger.exception("Startup migrations failed; refusing to serve on a partly migrated schema")
+        raise
+    # Every worker runs the sweeper loop; a lease lets one of them sweep per interval
+    sweeper = asyncio.create_task(run_overdue_sweeper(db))
     yield
     # Shutdown (cleanup if needed)
+    sweeper.cancel()
     logger.info("Application shutdown")
 
-app = FastAPI(
-    title="Sadhana Memorial School Management System"
-)
 api_router = APIRouter(prefix="/api")
 
 # Consistent HTTPException handler to return JSON {"error": message}
-from fastapi.responses import JSONResponse
-
-@app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc):
     return JSONResponse(status_code=exc.status_code, content={"error": exc.detail})
 
-# CORS Middleware
+# CORS origins
 allowed_origins = [
     "http://localhost:3000",
     "http://localhost:5173",
@@ -141,19 +107,7 @@ allowed_origins = [
     "https://sadhana-school.onrender.com"
 ]
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=allowed_origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
 # Health check endpoint for Render
-@app.get("/health")
 async def health():
     return {"status": "ok"}
 
@@ -165,11 +119,13 @@ async def root():
 async def register(user_data: UserCreate):
     existing_user = await db.users.find_one({"email": user_data.email}, {"_id": 0})
     if existing_user:
+        # Imported accounts without a password are activated through their invite, not claimed here
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    user_id = generate_id("user_")
     hashed_password = get_password_hash(user_data.password)
     
+    user_id = generate_id("user_")
+    
     # Require admin approval for non-admin users
     is_active = True if user_data.role == UserRole.ADMIN else False
     
@@ -184,6 +140,7 @@ async def register(user_data: UserCreate):
         "is_active": is_active,
         "created_at": get_current_timestamp()
     }
+    user_doc["search_terms"] = contact_search_terms("users", user_doc)
     
     await db.users.insert_one(user_doc)
 
@@ -231,7 +188,6 @@ async def register_student_enhanced(student_data: StudentCreate):
             "class_name": None,
             "section": None,
             "roll_number": None,
-            "parent_ids": [],
             "admission_number": None,
             "admission_date": get_current_timestamp(),
             "date_of_birth": None,
@@ -240,11 +196,13 @@ async def register_student_enhanced(student_data: StudentCreate):
             "aadhaar_id": None,
             "student_photo_url": None,
             "address": None,
-            "academic_year": "2025-2026",
+            "academic_year": current_academic_year(),
             "previous_school": None,
             "previous_class": None,
+            **SUMMARY_DEFAULTS,
             "created_at": get_current_timestamp()
         }
+        initial_student_doc["search_terms"] = search_terms(initial_student_doc)
         await db.students.insert_one(initial_student_doc)
         student = initial_student_doc
     else:
@@ -257,18 +215,18 @@ async def register_student_enhanced(student_data: StudentCreate):
     if not student_data.section or student_data.section not in ['A', 'B', 'C']:
         raise HTTPException(status_code=400, detail="Invalid section. Must be A, B, or C")
     
-    # Check section capacity (max 20 students)
-    section_count = await db.students.count_documents({
-        "class_name": student_data.class_name,
-        "section": student_data.section,
-        "unique_student_id": {"$ne": "PENDING"}  # Only count registered students
-    })
-    
-    if section_count >= 20:
-        raise HTTPException(status_code=400, detail=f"Section {student_data.section} of class {student_data.class_name} is full (max 20 students)")
-    
-    # Generate roll number based on section count
-    roll_number = section_count + 1
+    # Re-registering into the same section keeps the roll number; otherwise take the lowest
+    # free one (capacity, max 20 students, is enforced atomically) and give the old one back
+    placement = (student.get("academic_year"), student.get("class_name"), student.get("section"))
+    same_section = placement == (student_data.academic_year, student_data.class_name, student_data.section)
+    if same_section and str(student.get("roll_number") or "").isdigit():
+        roll_number = int(student["roll_number"])
+    else:
+        try:
+            roll_numbers = await reserve_roll_numbers(db, student_data.academic_year, student_data.class_name, student_data.section)
+        except SectionFullError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        roll_number = roll_numbers[0]
     
     # Generate unique Student ID: SMS-YYYY-CLASS+SECTION-ROLL
     unique_student_id = generate_student_id(student_data.class_name, student_data.section, roll_number)
@@ -288,11 +246,26 @@ async def register_student_enhanced(student_data: StudentCreate):
         "address": student_data.address,
         "academic_year": student_data.academic_year,
         "previous_school": student_data.previous_school,
-        "previous_class": student_data.previous_class,
-        "parent_ids": student_data.parent_ids
+        "previous_class": student_data.previous_class
     }
     
-    await db.students.update_one({"user_id": student_data.user_id}, {"$set": update_data})
+    update_data["search_terms"] = search_terms({**student, **update_data})
+    
+    try:
+        await db.students.update_one({"user_id": student_data.user_id}, {"$set": update_data})
+    except DuplicateKeyError:
+        if not same_section:
+            await release_roll_numbers(db, student_data.academic_year, student_data.class_name, student_data.section, [roll_number])
+        raise HTTPException(status_code=409, detail="Roll number was taken concurrently, please retry")
+    if not same_section:
+        await release_students_roll_numbers(db, [student])
+    
+    # Links live in parent_mapping; keep their copy of the student ID current
+    await db.parent_mapping.update_many({"student_id": student["student_id"]}, {"$set": {"unique_student_id": unique_student_id}})
+    if student_data.parent_ids:
+        parents = await db.parents.find({"parent_id": {"$in": student_data.parent_ids}}, {"_id": 0}).to_list(len(student_data.parent_ids))
+        for parent in parents:
+            await link_parent(db, parent["parent_id"], {**student, "unique_student_id": unique_student_id}, defaults=parent_contact(parent))
     
     # Fetch fee structure for the class and section
     fee_structure = await db.fee_structures.find_one({
@@ -309,13 +282,7 @@ async def register_student_enhanced(student_data: StudentCreate):
     
     # Create/update fee tracking
     if fee_structure:
-        total_fee = (
-            fee_structure.get("tuition_fee", 0) +
-            fee_structure.get("exam_fee", 0) +
-            fee_structure.get("lab_fee", 0) +
-            fee_structure.get("transport", 0) -
-            fee_structure.get("scholarship", 0)
-        )
+        total_fee = fee_structure_total(fee_structure)
         
         fee_tracking_doc = {
             "tracking_id": generate_id("track_"),
@@ -333,8 +300,10 @@ async def register_student_enhanced(student_data: StudentCreate):
             "updated_at": get_current_timestamp()
         }
         await db.fee_tracking.insert_one(fee_tracking_doc)
+        await schedule_installments(db, [fee_tracking_doc])
+    await sync_fee_summaries(db, student_ids=[student["student_id"]])
     
-    updated_student = await db.students.find_one({"user_id": student_data.user_id}, {"_id": 0})
+    updated_student = await db.students.find_one({"user_id": student_data.user_id}, {"_id": 0, "search_terms": 0})
     return {
         "message": "Student registration completed successfully",
         "student": updated_student,
@@ -342,10 +311,22 @@ async def register_student_enhanced(student_data: StudentCreate):
     }
 
 
+@api_router.post("/auth/accept-invite", response_model=TokenResponse)
+async def accept_account_invite(payload: InviteAccept):
+    """Set the password of an imported account with its single-use invite token and sign in"""
+    hashed_password = await asyncio.to_thread(get_password_hash, payload.password)
+    user = await accept_invite(db, payload.token, hashed_password)
+    if not user:
+        raise HTTPException(status_code=400, detail="Invite is invalid, already used or expired")
+    
+    token_data = {"sub": user["user_id"], "email": user["email"], "role": user["role"]}
+    access_token = create_access_token(token_data)
+    return TokenResponse(access_token=access_token, user=User(**user))
+
 @api_router.post("/auth/login", response_model=TokenResponse)
 async def login(credentials: UserLogin):
     user = await db.users.find_one({"email": credentials.email}, {"_id": 0})
-    if not user or not verify_password(credentials.password, user["password"]):
+    if not user or not user.get("password") or not verify_password(credentials.password, user["password"]):
         raise HTTPException(status_code=401, detail="Invalid email or password")
 
     # ALL users (STUDENT, FACULTY, PARENT) require admin approval before login
@@ -369,86 +350,100 @@ async def get_me(current_user: dict = Depends(get_current_user)):
 
 # Student Routes
 @api_router.get("/students")
-async def get_students(limit: int = 100, offset: int = 0, current_user: dict = Depends(require_role(["ADMIN", "FACULTY"]))):
-    cursor = db.students.find({}, {"_id": 0}).skip(offset).limit(limit)
+async def get_students(
+    limit: int = 100,
+    offset: int = 0,
+    class_name: str = None,
+    section: str = None,
+    academic_year: str = None,
+    payment_status: str = None,
+    min_pending: float = None,
+    max_pending: float = None,
+    sort: str = None,
+    current_user: dict = Depends(require_role(["ADMIN", "FACULTY"]))
+):
+    """
+    Student directory with each student's fee summary.
+    payment_status takes a comma separated list (PENDING, PARTIAL, PAID); min_pending/max_pending bound pending_amount.
+    sort: name, class_name, admission_date, created_at, pending_amount, paid_amount or total_fee_amount; prefix - for descending.
+    """
+    params = {
+        "class_name": class_name, "section": section, "academic_year": academic_year,
+        "payment_status": payment_status, "min_pending": min_pending, "max_pending": max_pending
+    }
+    try:
+        query = build_filter(STUDENT_FILTERS, params)
+        order = parse_sort(STUDENT_SORTS, sort, "student_id")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    limit, offset = max(1, min(limit, 500)), max(0, offset)
+    # The fee summary is embedded on each student; no fee_tracking lookup needed
+    cursor = db.students.find(query, {"_id": 0, "search_terms": 0, "fee_updated_at": 0}).sort(order).skip(offset).limit(limit)
     students = await cursor.to_list(length=limit)
-    
-    # Enrich students with fee tracking info
-    enriched_students = []
-    for student in students:
-        unique_student_id = student.get("unique_student_id")
-        student_id = student.get("student_id")
-        
-        # Try to find fee_tracking by unique_student_id first, then by student_id
-        fee_tracking = None
-        if unique_student_id and unique_student_id != "PENDING":
-            fee_tracking = await db.fee_tracking.find_one(
-                {"unique_student_id": unique_student_id},
-                {"_id": 0, "payment_status": 1, "total_fee_amount": 1, "paid_amount": 1, "pending_amount": 1}
-            )
-        
-        # If not found by unique_student_id, try student_id
-        if not fee_tracking and student_id:
-            fee_tracking = await db.fee_tracking.find_one(
-                {"student_id": student_id},
-                {"_id": 0, "payment_status": 1, "total_fee_amount": 1, "paid_amount": 1, "pending_amount": 1}
-            )
-        
-        if fee_tracking:
-            student["payment_status"] = fee_tracking.get("payment_status", "PENDING")
-            student["total_fee_amount"] = fee_tracking.get("total_fee_amount", 0)
-            student["paid_amount"] = fee_tracking.get("paid_amount", 0)
-            student["pending_amount"] = fee_tracking.get("pending_amount", 0)
-        else:
-            student["payment_status"] = "PENDING"
-            student["total_fee_amount"] = 0
-            student["paid_amount"] = 0
-            student["pending_amount"] = 0
-        enriched_students.append(student)
-    
-    return {"items": enriched_students, "limit": limit, "offset": offset, "count": len(enriched_students)}
+    return {"items": students, "limit": limit, "offset": offset, "count": len(students)}
+
+@api_router.get("/students/search")
+async def search_students_endpoint(q: str, limit: int = 10, current_user: dict = Depends(require_role(["ADMIN", "FACULTY", "PARENT"]))):
+    """
+    Autocomplete students by name, unique student ID (e.g. SMS-2026-10A), admission number or email prefix.
+    Every word of q must match; best matches (exact IDs, then names) come first.
+    Parents only search their own linked children.
+    """
+    limit = max(1, min(limit, 50))
+    student_ids = None
+    if current_user["role"] == "PARENT":
+        parent = await db.parents.find_one({"user_id": current_user["user_id"]}, {"_id": 0, "parent_id": 1})
+        student_ids = await children_ids(db, parent["parent_id"]) if parent else []
+    items = await search_students(db, q, limit, student_ids)
+    return {"items": items, "count": len(items)}
 
 @api_router.get('/students/class/{class_name}/section/{section}')
 async def get_students_by_class_section(class_name: str, section: str, current_user: dict = Depends(require_role(["FACULTY", "ADMIN"]))):
-    students = await db.students.find({"class_name": class_name, "section": section}, {"_id": 0}).to_list(1000)
-    
-    # Enrich students with fee tracking info
-    enriched_students = []
-    for student in students:
-        student_id = student.get("unique_student_id") or student.get("student_id")
-        fee_tracking = await db.fee_tracking.find_one(
-            {"unique_student_id": student_id},
-            {"_id": 0, "payment_status": 1, "total_fee_amount": 1, "paid_amount": 1, "pending_amount": 1}
-        )
-        if fee_tracking:
-            student["payment_status"] = fee_tracking.get("payment_status", "PENDING")
-            student["total_fee_amount"] = fee_tracking.get("total_fee_amount", 0)
-            student["paid_amount"] = fee_tracking.get("paid_amount", 0)
-            student["pending_amount"] = fee_tracking.get("pending_amount", 0)
-        else:
-            student["payment_status"] = "PENDING"
-            student["total_fee_amount"] = 0
-            student["paid_amount"] = 0
-            student["pending_amount"] = 0
-        enriched_students.append(student)
-    
-    return {"items": enriched_students, "count": len(enriched_students)}
+    # The fee summary is embedded on each student; no fee_tracking lookup needed
+    students = await db.students.find(
+        {"class_name": class_name, "section": section}, {"_id": 0, "search_terms": 0, "fee_updated_at": 0}
+    ).to_list(1000)
+    return {"items": students, "count": len(students)}
 
 @api_router.get("/students/me")
 async def get_my_student_profile(current_user: dict = Depends(require_role(["STUDENT"]))):
-    student = await db.students.find_one({"user_id": current_user["user_id"]}, {"_id": 0})
+    student = await db.students.find_one({"user_id": current_user["user_id"]}, {"_id": 0, "search_terms": 0})
     if not student:
         raise HTTPException(status_code=404, detail="Student profile not found")
     return student
 
+@api_router.get("/students/me/dashboard")
+async def get_my_student_dashboard(request: Request, current_user: dict = Depends(require_role(["STUDENT"]))):
+    """
+    The student home page in one call: profile, fees, attendance, recent marks,
+    today's timetable and announcements. Every part carries an ETag; send the ones
+    you hold in If-None-Match to skip unchanged parts (304 when nothing changed).
+    """
+    student = await db.students.find_one({"user_id": current_user["user_id"]}, STUDENT_PROJECTION)
+    if not student:
+        raise HTTPException(status_code=404, detail="Student profile not found")
+    known = parse_if_none_match(request.headers.get("if-none-match"))
+    payload, etag = await student_dashboard(db, student, known)
+    headers = {"Cache-Control": "private, no-cache"}
+    if etag:
+        headers["ETag"] = etag
+        if etag in known:
+            return Response(status_code=304, headers=headers)
+    return JSONResponse(jsonable_encoder(payload), headers=headers)
+
 # Attendance Routes
 @api_router.post("/attendance/bulk")
 async def mark_bulk_attendance(bulk_data: AttendanceBulkCreate, current_user: dict = Depends(require_role(["FACULTY", "ADMIN"]))):
     attendance_docs = []
     for record in bulk_data.records:
+        try:
+            day = day_start(record.date)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid date {record.date!r}; use YYYY-MM-DD")
         doc = {
             "attendance_id": generate_id("att_"),
             **record.model_dump(),
+            "date": day,
             "created_at": get_current_timestamp()
         }
         attendance_docs.append(doc)
@@ -459,7 +454,11 @@ async def mark_bulk_attendance(bulk_data: AttendanceBulkCreate, current_user: di
 
 @api_router.get("/attendance/student/{student_id}")
 async def get_student_attendance(student_id: str, current_user: dict = Depends(get_current_user)):
-    attendance_records = await db.attendance.find({"student_id": student_id}, {"_id": 0}).to_list(1000)
+    attendance_records = await db.attendance.find({"student_id": student_id}, {"_id": 0}).sort("date", 1).to_list(1000)
+    for record in attendance_records:
+        # Stored as a date at midnight UTC; the API keeps returning the calendar day
+        if isinstance(record.get("date"), datetime):
+            record["date"] = record["date"].strftime("%Y-%m-%d")
     
     total_days = len(attendance_records)
     present_days = len([r for r in attendance_records if r["status"] == "PRESENT"])
@@ -475,14 +474,65 @@ async def get_student_attendance(student_id: str, current_user: dict = Depends(g
 # Marks Routes
 @api_router.post("/marks", response_model=Marks)
 async def upload_marks(marks_data: MarksCreate, current_user: dict = Depends(require_role(["FACULTY", "ADMIN"]))):
-    marks_id = generate_id("mrk_")
-    marks_doc = {
-        "marks_id": marks_id,
-        **marks_data.model_dump(),
-        "created_at": get_current_timestamp()
+    # Re-uploading the same student/subject/exam in the same academic year replaces the earlier marks
+    fields = marks_data.model_dump()
+    try:
+        academic_year = academic_year_of(marks_data.exam_date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="exam_date must be a YYYY-MM-DD date")
+    marks_doc = await db.marks.find_one_and_update(
+        {"student_id": fields.pop("student_id"), "subject": fields.pop("subject"), "exam_name": fields.pop("exam_name"), "academic_year": academic_year},
+        {"$set": fields, "$setOnInsert": {"marks_id": generate_id("mrk_"), "created_at": get_current_timestamp()}},
+        projection={"_id": 0},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return Marks(**marks_doc)
+
+@api_router.post("/marks/bulk")
+async def upload_marks_bulk(request: Request, current_user: dict = Depends(require_role(["FACULTY", "ADMIN"]))):
+    """
+    Upload a whole exam sheet in one request.
+    JSON: {"subject", "exam_name", "total_marks", "exam_date", "rows": [{"student_id", "marks_obtained"}]}
+    CSV: multipart form with the same sheet fields and a `file` with student_id,marks_obtained columns.
+    Grades are computed when not given. Rows upsert on (student_id, subject, exam_name)
+    within the academic year of exam_date.
+    """
+    try:
+        if request.headers.get("content-type", "").startswith("multipart/form-data"):
+            form = await request.form()
+            upload = form.get("file")
+            if upload is None or not hasattr(upload, "file"):
+                raise HTTPException(status_code=400, detail="CSV upload requires a file field")
+            sheet = MarksBulkCreate(**{k: form.get(k) for k in ("subject", "exam_name", "total_marks", "exam_date") if form.get(k)}, rows=[])
+            raw_rows = list(iter_rows(upload.file, upload.filename))
+        else:
+            payload = await request.json()
+            if not isinstance(payload, dict) or not isinstance(payload.get("rows", []), list):
+                raise HTTPException(status_code=400, detail="Body must be a JSON object with a rows list")
+            sheet = MarksBulkCreate(**{**payload, "rows": []})
+            raw_rows = payload.get("rows") or []
+        known = await existing_student_ids(db, raw_rows)
+        operations, errors = build_marks_upserts(sheet, raw_rows, current_user["user_id"], known)
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid marks sheet: {e.errors()[0]['msg']}")
+    except ImportError:
+        raise HTTPException(status_code=400, detail="XLSX upload is not available on this server; upload a CSV instead")
+    except (UnicodeDecodeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Could not read marks sheet: {e}")
+    
+    inserted = updated = 0
+    if operations:
+        result = await db.marks.bulk_write(operations, ordered=False)
+        inserted, updated = result.upserted_count, result.matched_count
+    
+    return {
+        "message": f"Saved marks for {inserted + updated} students",
+        "total_rows": len(raw_rows),
+        "inserted": inserted,
+        "updated": updated,
+        "errors": errors
     }
-    await db.marks.insert_one(marks_doc)
-    return Marks(**{k: v for k, v in marks_doc.items() if k != "_id"})
 
 @api_router.get("/marks/student/{student_id}")
 async def get_student_marks(student_id: str, current_user: dict = Depends(get_current_user)):
@@ -527,6 +577,7 @@ async def get_student_fees(student_id: str, current_user: dict = Depends(get_cur
 # Payment Routes
 @api_router.post("/payments/create-order")
 async def create_payment_order(payment_data: PaymentCreate, current_user: dict = Depends(get_current_user)):
+    razorpay_client = get_razorpay_client()
     if not razorpay_client:
         raise HTTPException(status_code=500, detail="Payment gateway not configured. Please add Razorpay keys.")
     
@@ -538,7 +589,8 @@ async def create_payment_order(payment_data: PaymentCreate, current_user: dict =
         order = razorpay_client.order.create({
             "amount": amount_in_paise,
             "currency": payment_data.currency,
-            "payment_capture": 1
+            "payment_capture": 1,
+            "notes": {"tracking_id": payment_data.fee_id, "student_id": payment_data.student_id}
         })
         
         logger.info(f"Order created successfully: {order['id']}")
@@ -564,78 +616,72 @@ async def verify_payment(verify_data: PaymentVerify, current_user: dict = Depend
     if signature != verify_data.razorpay_signature:
         raise HTTPException(status_code=400, detail="Invalid payment signature")
     
-    # Get the fee tracking record to update
-    fee_tracking = await db.fee_tracking.find_one({"tracking_id": verify_data.fee_id})
-    if not fee_tracking:
-        raise HTTPException(status_code=404, detail="Fee tracking not found")
-    
-    # FIX: Use the amount from verify_data (passed from frontend), not total_fee_amount
-    amount_paid = fee_tracking.get("paid_amount", 0) + verify_data.amount
-    total_fee = fee_tracking.get("total_fee_amount", 0)
-    pending_amount = max(0, total_fee - amount_paid)
-    
-    # Determine payment status
-    if pending_amount <= 0:
-        payment_status = "PAID"
-    elif amount_paid > 0:
-        payment_status = "PARTIAL"
-    else:
-        payment_status = "PENDING"
-    
-    # Create payment record for history
-    payment_record = {
-        "date": get_current_timestamp(),
-        "amount": verify_data.amount,
-        "method": "online",
-        "razorpay_payment_id": verify_data.razorpay_payment_id,
-        "razorpay_order_id": verify_data.razorpay_order_id
-    }
-    
-    # Update fee_tracking with payment info
-    await db.fee_tracking.update_one(
-        {"tracking_id": verify_data.fee_id},
-        {
-            "$set": {
-                "paid_amount": amount_paid,
-                "pending_amount": pending_amount,
-                "payment_status": payment_status,
-                "last_payment_date": get_current_timestamp(),
-                "updated_at": get_current_timestamp()
-            },
-            "$push": {
-                "payment_history": payment_record
-            }
-        }
-    )
-    
-    # Also update fees collection for backward compatibility
-    await db.fees.update_one(
-        {"fee_id": verify_data.fee_id},
-        {"$set": {"status": payment_status}}
-    )
-    
-    # Create payment record
     payment_doc = {
         "payment_id": generate_id("pay_"),
         "fee_id": verify_data.fee_id,
         "student_id": verify_data.student_id,
-        "unique_student_id": fee_tracking.get("unique_student_id"),
         "razorpay_order_id": verify_data.razorpay_order_id,
         "razorpay_payment_id": verify_data.razorpay_payment_id,
         "amount": verify_data.amount,
-        "status": "SUCCESS",
         "payment_date": get_current_timestamp(),
         "created_at": get_current_timestamp()
     }
-    await db.payments.insert_one(payment_doc)
+    fee_tracking, applied = await apply_verified_payment(db, {"tracking_id": verify_data.fee_id}, payment_doc)
+    if not fee_tracking:
+        raise HTTPException(status_code=404, detail="Fee tracking not found")
+    
+    if not applied:
+        return {"message": "Payment already verified", "status": "SUCCESS"}
+    
+    # Also update fees collection for backward compatibility
+    await db.fees.update_one(
+        {"fee_id": verify_data.fee_id},
+        {"$set": {"status": fee_tracking["payment_status"]}}
+    )
     
     logger.info(f"Payment verified successfully for student {verify_data.student_id}: {verify_data.razorpay_payment_id}")
     
     return {"message": "Payment verified successfully", "status": "SUCCESS"}
 
+@api_router.post("/payments/webhook")
+async def razorpay_webhook(request: Request):
+    """
+    Razorpay webhook receiver. Only verifies the signature and queues the event;
+    payment_events.py applies queued events to fee tracking in batches.
+    """
+    if not razorpay_webhook_secret:
+        raise HTTPException(status_code=500, detail="Webhook secret not configured")
+    
+    body = await request.body()
+    expected = hmac.new(razorpay_webhook_secret.encode(), body, hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(expected, request.headers.get("X-Razorpay-Signature", "")):
+        raise HTTPException(status_code=400, detail="Invalid webhook signature")
+    
+    try:
+        event = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid webhook payload")
+    if not isinstance(event, dict):
+        raise HTTPException(status_code=400, detail="Invalid webhook payload")
+    
+    event_id = request.headers.get("X-Razorpay-Event-Id") or hashlib.sha256(body).hexdigest()
+    try:
+        await db.payment_events.insert_one({
+            "event_id": event_id,
+            "event": event.get("event"),
+            "payload": event.get("payload"),
+            "status": "PENDING",
+            "attempts": 0,
+            "received_at": get_current_timestamp()
+        })
+    except DuplicateKeyError:
+        # Razorpay retries deliveries; the first copy is already queued
+        pass
+    return {"status": "ok"}
+
 @api_router.get("/payments/student/{student_id}")
 async def get_student_payments(student_id: str, current_user: dict = Depends(get_current_user)):
-    payments = await db.payments.find({"student_id": student_id}, {"_id": 0}).to_list(1000)
+    payments = await db.payments.find({"student_id": student_id}, {"_id": 0}).sort([("payment_date", -1), ("payment_id", -1)]).to_list(1000)
     
     # Map payment fields to match frontend expectations
     mapped_payments = []
@@ -653,6 +699,26 @@ async def get_student_payments(student_id: str, current_user: dict = Depends(get
     
     return mapped_payments
 
+@api_router.get("/payments/student/{student_id}/history")
+async def get_student_payment_history(student_id: str, limit: int = 20, cursor: str = None, current_user: dict = Depends(get_current_user)):
+    """
+    Full payment history, newest first, one page at a time.
+    fee_tracking.payment_history only keeps the last few payments; pass next_cursor back for older ones.
+    Parents only see their linked children and students only themselves.
+    """
+    if current_user["role"] == "PARENT":
+        parent = await db.parents.find_one({"user_id": current_user["user_id"]}, {"_id": 0, "parent_id": 1})
+        if not parent or not await is_linked(db, parent["parent_id"], student_id):
+            raise HTTPException(status_code=403, detail="You do not have access to this student's information")
+    elif current_user["role"] == "STUDENT":
+        if not await db.students.count_documents({"user_id": current_user["user_id"], "student_id": student_id}, limit=1):
+            raise HTTPException(status_code=403, detail="You do not have access to this student's information")
+    try:
+        items, next_cursor = await payment_history_page(db, student_id, max(1, min(limit, 100)), cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": items, "next_cursor": next_cursor}
+
 # Fee Tracking Routes (for parents and students)
 @api_router.get("/fees/student-id/{unique_student_id}")
 async def get_fees_by_student_id(unique_student_id: str, current_user: dict = Depends(get_current_user)):
@@ -680,6 +746,7 @@ async def pay_fees_by_student_id(unique_student_id: str, amount: float, current_
         raise HTTPException(status_code=404, detail="Fee record not found for this Student ID")
     
     # Create payment order
+    razorpay_client = get_razorpay_client()
     if not razorpay_client:
         raise HTTPException(status_code=500, detail="Payment gateway not configured")
     
@@ -688,7 +755,8 @@ async def pay_fees_by_student_id(unique_student_id: str, amount: float, current_
         order = razorpay_client.order.create({
             "amount": amount_in_paise,
             "currency": "INR",
-            "payment_capture": 1
+            "payment_capture": 1,
+            "notes": {"unique_student_id": unique_student_id}
         })
         
         return {
@@ -717,68 +785,27 @@ async def verify_payment_by_student_id(unique_student_id: str, razorpay_order_id
     if signature != razorpay_signature:
         raise HTTPException(status_code=400, detail="Invalid payment signature")
     
-    # Get fee tracking
-    fee_tracking = await db.fee_tracking.find_one({"unique_student_id": unique_student_id}, {"_id": 0})
-    if not fee_tracking:
-        raise HTTPException(status_code=404, detail="Fee record not found")
-    
-    # Update fee tracking
-    new_paid_amount = fee_tracking.get("paid_amount", 0) + amount
-    new_pending_amount = fee_tracking.get("total_fee_amount", 0) - new_paid_amount
-    
-    # Determine payment status
-    if new_pending_amount <= 0:
-        payment_status = "PAID"
-    elif new_paid_amount > 0:
-        payment_status = "PARTIAL"
-    else:
-        payment_status = "PENDING"
-    
-    # Add to payment history
-    payment_record = {
-        "date": get_current_timestamp(),
-        "amount": amount,
-        "method": "online",
-        "razorpay_payment_id": razorpay_payment_id,
-        "razorpay_order_id": razorpay_order_id
-    }
-    
-    await db.fee_tracking.update_one(
-        {"unique_student_id": unique_student_id},
-        {
-            "$set": {
-                "paid_amount": new_paid_amount,
-                "pending_amount": max(0, new_pending_amount),
-                "payment_status": payment_status,
-                "last_payment_date": get_current_timestamp(),
-                "updated_at": get_current_timestamp()
-            },
-            "$push": {"payment_history": payment_record}
-        }
-    )
-    
-    # Create payment record in payments collection
     payment_doc = {
         "payment_id": generate_id("pay_"),
         "unique_student_id": unique_student_id,
-        "student_id": fee_tracking.get("student_id"),
         "amount": amount,
         "payment_method": "razorpay",
         "razorpay_order_id": razorpay_order_id,
         "razorpay_payment_id": razorpay_payment_id,
-        "status": "SUCCESS",
         "payment_date": get_current_timestamp(),
         "created_at": get_current_timestamp()
     }
-    await db.payments.insert_one(payment_doc)
+    fee_tracking, applied = await apply_verified_payment(db, {"unique_student_id": unique_student_id}, payment_doc)
+    if not fee_tracking:
+        raise HTTPException(status_code=404, detail="Fee record not found")
     
     return {
-        "message": "Payment verified successfully",
+        "message": "Payment verified successfully" if applied else "Payment already verified",
         "status": "SUCCESS",
         "unique_student_id": unique_student_id,
-        "paid_amount": new_paid_amount,
-        "pending_amount": max(0, new_pending_amount),
-        "payment_status": payment_status
+        "paid_amount": fee_tracking.get("paid_amount", 0),
+        "pending_amount": fee_tracking.get("pending_amount", 0),
+        "payment_status": fee_tracking.get("payment_status", "PENDING")
     }
 
 # Parent Mapping Routes
@@ -788,33 +815,20 @@ async def register_parent_with_student(mapping_data: ParentMappingCreate, curren
     Link parent to student using unique Student ID
     """
     # Verify student exists
-    student = await db.students.find_one({"unique_student_id": mapping_data.unique_student_id}, {"_id": 0})
+    student = await db.students.find_one({"unique_student_id": mapping_data.unique_student_id}, {"_id": 0, "student_id": 1, "unique_student_id": 1})
     if not student:
         raise HTTPException(status_code=404, detail="Student not found with this Student ID")
     
-    # Create parent mapping
-    mapping_doc = {
-        "mapping_id": generate_id("map_"),
-        "parent_id": mapping_data.parent_id,
-        "student_id": mapping_data.student_id,
-        "unique_student_id": mapping_data.unique_student_id,
-        "relationship": mapping_data.relationship,
-        "parent_name": mapping_data.parent_name,
-        "parent_email": mapping_data.parent_email,
-        "parent_phone": mapping_data.parent_phone,
-        "parent_occupation": mapping_data.parent_occupation,
-        "parent_address": mapping_data.parent_address,
-        "parent_pin_code": mapping_data.parent_pin_code,
-        "created_at": get_current_timestamp()
-    }
+    # Parents can only link themselves
+    parent_id = mapping_data.parent_id
+    if current_user["role"] == "PARENT":
+        parent = await db.parents.find_one({"user_id": current_user["user_id"]}, {"_id": 0, "parent_id": 1})
+        if not parent:
+            raise HTTPException(status_code=404, detail="Parent profile not found")
+        parent_id = parent["parent_id"]
     
-    await db.parent_mapping.insert_one(mapping_doc)
-    
-    # Update student's parent_ids list
-    await db.students.update_one(
-        {"student_id": mapping_data.student_id},
-        {"$addToSet": {"parent_ids": mapping_data.parent_id}}
-    )
+    # One mapping per parent and student; registering again updates it
+    mapping_doc = await link_parent(db, parent_id, student, details=mapping_data.model_dump(), relationship=mapping_data.relationship)
     
     return {"message": "Parent successfully linked to student", "mapping": mapping_doc}
 
@@ -823,7 +837,8 @@ async def get_parents_by_student_id(unique_student_id: str, current_user: dict =
     """
     Get all parents linked to a student using unique Student ID
     """
-    parent_mappings = await db.parent_mapping.find({"unique_student_id": unique_student_id}, {"_id": 0}).to_list(100)
+    student = await db.students.find_one({"unique_student_id": unique_student_id}, {"_id": 0, "student_id": 1})
+    parent_mappings = await mappings_for_student(db, student["student_id"]) if student else []
     # Return empty array instead of 404 - allows frontend to handle gracefully
     return {"parent_mappings": parent_mappings or [], "count": len(parent_mappings) if parent_mappings else 0}
 
@@ -848,13 +863,27 @@ async def get_timetable(class_name: str, section: str, current_user: dict = Depe
 
 # Faculty Routes
 @api_router.get("/faculty")
-async def get_faculty_list(current_user: dict = Depends(require_role(["ADMIN"]))):
-    faculty = await db.faculty.find({}, {"_id": 0}).to_list(1000)
+async def get_faculty_list(
+    subject: str = None,
+    assigned_class: str = None,
+    assigned_section: str = None,
+    is_active: bool = None,
+    sort: str = None,
+    current_user: dict = Depends(require_role(["ADMIN"]))
+):
+    try:
+        query = build_filter(FACULTY_FILTERS, {
+            "subject": subject, "assigned_class": assigned_class, "assigned_section": assigned_section, "is_active": is_active
+        })
+        order = parse_sort(FACULTY_SORTS, sort, "faculty_id")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    faculty = await db.faculty.find(query, {"_id": 0, "search_terms": 0}).sort(order).to_list(1000)
     return {"items": faculty, "count": len(faculty)}
 
 @api_router.get("/faculty/me")
 async def get_my_faculty_profile(current_user: dict = Depends(require_role(["FACULTY"]))):
-    faculty = await db.faculty.find_one({"user_id": current_user["user_id"]}, {"_id": 0})
+    faculty = await db.faculty.find_one({"user_id": current_user["user_id"]}, {"_id": 0, "search_terms": 0})
     if not faculty:
         raise HTTPException(status_code=404, detail="Faculty profile not found")
     return faculty
@@ -881,6 +910,24 @@ async def get_faculty_assigned_class(current_user: dict = Depends(require_role([
         "subject": faculty.get("subject")
     }
 
+@api_router.get("/faculty/me/home")
+async def get_faculty_home(date: str = None, current_user: dict = Depends(require_role(["FACULTY"]))):
+    """
+    The teacher's home page in one call: assigned class roster in roll order, each
+    student's attendance for the day (default today, YYYY-MM-DD) and the exams of the
+    day's academic year whose marks are still missing for part of the class.
+    """
+    try:
+        day = day_start(date) if date else day_start(datetime.now(timezone.utc).strftime("%Y-%m-%d"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="date must be YYYY-MM-DD")
+    faculty = await db.faculty.find_one(
+        {"user_id": current_user["user_id"]}, {"_id": 0, "faculty_id": 1, "subject": 1, "assigned_class": 1, "assigned_section": 1}
+    )
+    if not faculty:
+        raise HTTPException(status_code=404, detail="Faculty profile not found")
+    return await faculty_home(db, faculty, day)
+
 @api_router.get("/faculty/me/students")
 async def get_my_class_students(current_user: dict = Depends(require_role(["FACULTY"]))):
     """
@@ -906,7 +953,7 @@ async def get_my_class_students(current_user: dict = Depends(require_role(["FACU
         "class_name": assigned_class,
         "section": assigned_section,
         "unique_student_id": {"$ne": "PENDING"}  # Only registered students
-    }, {"_id": 0}).sort([("roll_number", 1)]).to_list(100)
+    }, {"_id": 0, "search_terms": 0}).sort([("roll_number", 1)]).to_list(100)
     
     return {
         "items": students,
@@ -938,22 +985,35 @@ async def get_parent_children(current_user: dict = Depends(require_role(["PARENT
     if not parent:
         raise HTTPException(status_code=404, detail="Parent profile not found")
     
-    children_ids = parent.get("children_ids", [])
-    children = await db.students.find({"student_id": {"$in": children_ids}}, {"_id": 0}).to_list(100)
+    student_ids = await children_ids(db, parent["parent_id"])
+    children = await db.students.find({"student_id": {"$in": student_ids}}, {"_id": 0, "search_terms": 0}).to_list(100)
     return children
 
+@api_router.get("/parents/me/dashboard")
+async def get_parent_dashboard(current_user: dict = Depends(require_role(["PARENT"]))):
+    """
+    Everything the parent home page shows, in one call: each child with fee summary,
+    attendance percentage, recent marks and today's timetable. Parts that did not
+    finish in time are null and listed in timed_out / failed.
+    """
+    parent = await db.parents.find_one({"user_id": current_user["user_id"]}, {"_id": 0, "parent_id": 1})
+    if not parent:
+        raise HTTPException(status_code=404, detail="Parent profile not found")
+    return await parent_dashboard(db, await children_ids(db, parent["parent_id"]))
+
 @api_router.get("/parents/{parent_id}")
 async def get_parent_by_id(parent_id: str, current_user: dict = Depends(get_current_user)):
     """Get parent details by parent_id"""
-    parent = await db.parents.find_one({"parent_id": parent_id}, {"_id": 0})
+    parent = await db.parents.find_one({"parent_id": parent_id}, {"_id": 0, "search_terms": 0})
     if not parent:
         raise HTTPException(status_code=404, detail="Parent not found")
     return parent
 
 @api_router.get("/parents/by-student/{student_id}")
 async def get_parents_by_student_id(student_id: str, current_user: dict = Depends(get_current_user)):
-    """Get all parents who have this student in their children_ids"""
-    parents = await db.parents.find({"children_ids": student_id}, {"_id": 0}).to_list(100)
+    """Get the parent profiles linked to this student"""
+    parent_ids = [m["parent_id"] for m in await mappings_for_student(db, student_id)]
+    parents = await db.parents.find({"parent_id": {"$in": parent_ids}}, {"_id": 0, "search_terms": 0}).to_list(100)
     return {"parents": parents or [], "count": len(parents) if parents else 0}
 
 @api_router.post("/parents/link-child/{student_id}")
@@ -962,19 +1022,11 @@ async def link_child_to_parent(student_id: str, current_user: dict = Depends(req
     if not parent:
         raise HTTPException(status_code=404, detail="Parent profile not found")
     
-    student = await db.students.find_one({"student_id": student_id}, {"_id": 0})
+    student = await db.students.find_one({"student_id": student_id}, {"_id": 0, "search_terms": 0})
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
     
-    await db.parents.update_one(
-        {"user_id": current_user["user_id"]},
-        {"$addToSet": {"children_ids": student_id}}
-    )
-    
-    await db.students.update_one(
-        {"student_id": student_id},
-        {"$set": {"parent_id": parent["parent_id"]}}
-    )
+    await link_parent(db, parent["parent_id"], student, details=parent_contact(parent))
     
     return {"message": "Child linked successfully"}
 
@@ -986,8 +1038,7 @@ async def get_student_fees_for_parent(student_id: str, current_user: dict = Depe
         raise HTTPException(status_code=404, detail="Parent profile not found")
     
     # Check if student is linked to this parent
-    student_ids = parent.get("children_ids", [])
-    if student_id not in student_ids:
+    if not await is_linked(db, parent["parent_id"], student_id):
         raise HTTPException(status_code=403, detail="You do not have access to this student's information")
     
     # Get fee tracking for this student
@@ -1020,113 +1071,116 @@ async def get_admin_stats(current_user: dict = Depends(require_role(["ADMIN"])))
         "pending_fees": pending_fees
     }
 
+@api_router.post('/admin/students/import')
+async def import_students(background_tasks: BackgroundTasks, file: UploadFile = File(...), current_user: dict = Depends(require_role(["ADMIN"]))):
+    """
+    Bulk-import students from a CSV or XLSX file (one student per row, header row required).
+    Required columns: name, email, class_name, section. Creates the user account,
+    student profile and fee tracking for every valid row and reports the rest.
+    Rows without a password get an invite token (in the report and by email).
+    """
+    try:
+        rows = iter_student_rows(file.file, file.filename)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    importer = StudentImporter(db)
+    try:
+        report = await importer.run(rows)
+    except ImportError:
+        raise HTTPException(status_code=400, detail="XLSX import is not available on this server; upload a CSV instead")
+    except (UnicodeDecodeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Could not read import file: {e}")
+    
+    from mailer import notify_invites
+    background_tasks.add_task(notify_invites, importer.invite_emails())
+    logger.info(f"Student import by admin {current_user.get('user_id')}: {report['imported']} imported, {report['failed']} failed")
+    return report
+
+@api_router.post('/admin/users/{user_id}/invite')
+async def resend_invite(user_id: str, background_tasks: BackgroundTasks, current_user: dict = Depends(require_role(["ADMIN"]))):
+    """New invite token for an imported account that has not set its password; the old token stops working"""
+    token = await reissue_invite(db, user_id)
+    if not token:
+        raise HTTPException(status_code=404, detail="No account awaiting an invite with this ID")
+    user = await db.users.find_one({"user_id": user_id}, {"_id": 0, "email": 1})
+    from mailer import notify_invites
+    background_tasks.add_task(notify_invites, [(user["email"], token)])
+    return {"user_id": user_id, "invite_token": token}
+
+@api_router.get('/admin/metrics/db-pool')
+async def get_db_pool_metrics(current_user: dict = Depends(require_role(["ADMIN"]))):
+    """
+    Connection pool checkout wait times for the worker that served this request.
+    Use these to size MONGO_MAX_POOL_SIZE per gunicorn worker.
+    """
+    settings = mongo_settings()
+    return {
+        "pool": {
+            "max_pool_size": settings["max_pool_size"],
+            "min_pool_size": settings["min_pool_size"],
+            "max_idle_time_ms": settings["max_idle_time_ms"],
+            "compressors": settings["compressors"],
+            "read_preference": settings["read_preference"]
+        },
+        "metrics": pool_metrics.snapshot()
+    }
+
 @api_router.get('/admin/users/pending')
-async def list_pending_users(current_user: dict = Depends(require_role(["ADMIN"]))):
-    pending = await db.users.find({"is_active": False}, {"_id": 0, "password": 0}).to_list(100)
+async def list_pending_users(skip: int = 0, limit: int = 100, current_user: dict = Depends(require_role(["ADMIN"]))):
+    limit = max(1, min(limit, 1000))
+    # Accounts still waiting on their invite have no password and are not approved here
+    pending = await db.users.find(
+        {"is_active": False, "password": {"$ne": None}}, {"_id": 0, "password": 0, "invite_token_hash": 0, "search_terms": 0}
+    ).sort([("created_at", 1), ("user_id", 1)]).skip(max(0, skip)).limit(limit).to_list(limit)
     return pending
 
+@api_router.post('/admin/users/approve')
+async def approve_users_bulk(payload: UserIdsAction, background_tasks: BackgroundTasks, current_user: dict = Depends(require_role(["ADMIN"]))):
+    """Approve many accounts at once; creates missing role profiles and queues approval emails"""
+    results, emails = await approve_users(db, payload.user_ids)
+    from mailer import notify_each, notify_user_on_approval
+    background_tasks.add_task(notify_each, notify_user_on_approval, emails)
+    approved = sum(1 for r in results if r["status"] == "approved")
+    return {"message": f"{approved} users approved", "results": results}
+
+@api_router.post('/admin/users/reject')
+async def reject_users_bulk(payload: UserIdsAction, background_tasks: BackgroundTasks, current_user: dict = Depends(require_role(["ADMIN"]))):
+    """Reject and remove many pending accounts at once; active ones are skipped. Queues rejection emails"""
+    results, emails = await reject_users(db, payload.user_ids)
+    from mailer import notify_each, notify_user_on_rejection
+    background_tasks.add_task(notify_each, notify_user_on_rejection, emails)
+    rejected = sum(1 for r in results if r["status"] == "rejected")
+    return {"message": f"{rejected} users rejected and removed", "results": results}
+
 @api_router.post('/admin/users/approve/{user_id}')
-async def approve_user(user_id: str, current_user: dict = Depends(require_role(["ADMIN"]))):
-    result = await db.users.update_one({"user_id": user_id}, {"$set": {"is_active": True}})
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    # Get user details to create role-specific profile
-    user = await db.users.find_one({"user_id": user_id}, {"_id": 0})
-    if not user:
+async def approve_user(user_id: str, background_tasks: BackgroundTasks, current_user: dict = Depends(require_role(["ADMIN"]))):
+    results, emails = await approve_users(db, [user_id])
+    status = results[0]["status"]
+    if status == "not_found":
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Create role-specific profile only after approval
-    if user.get("role") == "STUDENT":
-        # Check if student profile already exists
-        existing_student = await db.students.find_one({"user_id": user_id}, {"_id": 0})
-        if not existing_student:
-            student_doc = {
-                "student_id": generate_id("stu_"),
-                "unique_student_id": "PENDING",
-                "user_id": user_id,
-                "name": user.get("name"),
-                "email": user.get("email"),
-                "class_name": None,
-                "section": None,
-                "roll_number": None,
-                "parent_ids": [],
-                "admission_number": None,
-                "admission_date": get_current_timestamp(),
-                "date_of_birth": None,
-                "gender": None,
-                "blood_group": None,
-                "aadhaar_id": None,
-                "student_photo_url": None,
-                "address": None,
-                "academic_year": "2025-2026",
-                "previous_school": None,
-                "previous_class": None,
-                "is_active": True,
-                "created_at": get_current_timestamp()
-            }
-            await db.students.insert_one(student_doc)
-    
-    elif user.get("role") == "FACULTY":
-        # Check if faculty profile already exists
-        existing_faculty = await db.faculty.find_one({"user_id": user_id}, {"_id": 0})
-        if not existing_faculty:
-            faculty_doc = {
-                "faculty_id": generate_id("fac_"),
-                "user_id": user_id,
-                "name": user.get("name"),
-                "email": user.get("email"),
-                "subject": "General",
-                "qualification": None,
-                "joining_date": get_current_timestamp(),
-                "phone": user.get("phone"),
-                "is_active": True,
-                "created_at": get_current_timestamp()
-            }
-            await db.faculty.insert_one(faculty_doc)
-    
-    elif user.get("role") == "PARENT":
-        # Check if parent profile already exists
-        existing_parent = await db.parents.find_one({"user_id": user_id}, {"_id": 0})
-        if not existing_parent:
-            parent_doc = {
-                "parent_id": generate_id("par_"),
-                "user_id": user_id,
-                "name": user.get("name"),
-                "email": user.get("email"),
-                "phone": user.get("phone"),
-                "children_ids": [],
-                "is_active": True,
-                "created_at": get_current_timestamp()
-            }
-            await db.parents.insert_one(parent_doc)
-    
-    # send approval email
-    from mailer import notify_user_on_approval
-    if user:
-        notify_user_on_approval(user.get('email'))
-    return {"message": "User approved"}
+    # send approval email after the response
+    from mailer import notify_each, notify_user_on_approval
+    background_tasks.add_task(notify_each, notify_user_on_approval, emails)
+    messages = {
+        "approved": "User approved",
+        "already_active": "User is already active",
+        "awaiting_invite": "User has no password yet; the account activates when they accept their invite",
+    }
+    return {"message": messages[status], "status": status}
 
 @api_router.post('/admin/users/reject/{user_id}')
-async def reject_user(user_id: str, current_user: dict = Depends(require_role(["ADMIN"]))):
-    user = await db.users.find_one({"user_id": user_id}, {"_id": 0})
-    result = await db.users.delete_one({"user_id": user_id})
-    if result.deleted_count == 0:
+async def reject_user(user_id: str, background_tasks: BackgroundTasks, current_user: dict = Depends(require_role(["ADMIN"]))):
+    results, emails = await reject_users(db, [user_id])
+    if results[0]["status"] == "not_found":
         raise HTTPException(status_code=404, detail="User not found")
+    if results[0]["status"] == "already_active":
+        raise HTTPException(status_code=409, detail="User is already active; only pending accounts can be rejected")
     
-    # Also delete role-specific profile if it exists
-    if user:
-        if user.get("role") == "STUDENT":
-            await db.students.delete_one({"user_id": user_id})
-        elif user.get("role") == "FACULTY":
-            await db.faculty.delete_one({"user_id": user_id})
-        elif user.get("role") == "PARENT":
-            await db.parents.delete_one({"user_id": user_id})
-    
-    # send rejection email
-    from mailer import notify_user_on_rejection
-    if user:
-        notify_user_on_rejection(user.get('email'))
+    # send rejection email after the response
+    from mailer import notify_each, notify_user_on_rejection
+    background_tasks.add_task(notify_each, notify_user_on_rejection, emails)
     return {"message": "User rejected and removed"}
 
 # Admin - Teacher Assignment
@@ -1157,7 +1211,7 @@ async def assign_class_section_to_teacher(faculty_id: str, class_name: str, sect
         }}
     )
     
-    updated = await db.faculty.find_one({"faculty_id": faculty_id}, {"_id": 0})
+    updated = await db.faculty.find_one({"faculty_id": faculty_id}, {"_id": 0, "search_terms": 0})
     return {
         "message": "Class and section assigned to teacher",
         "faculty": updated
@@ -1168,7 +1222,7 @@ async def get_faculty_by_id(faculty_id: str, current_user: dict = Depends(requir
     """
     Get details of a specific faculty member
     """
-    faculty = await db.faculty.find_one({"faculty_id": faculty_id}, {"_id": 0})
+    faculty = await db.faculty.find_one({"faculty_id": faculty_id}, {"_id": 0, "search_terms": 0})
     if not faculty:
         raise HTTPException(status_code=404, detail="Faculty not found")
     return faculty
@@ -1296,8 +1350,14 @@ async def list_all_sections(limit: int = 100, offset: int = 0, current_user: dic
     sections = await cursor.to_list(length=limit)
     return {"items": sections, "limit": limit, "offset": offset, "count": len(sections)}
 
+async def _queue_fee_recompute(background_tasks: BackgroundTasks, class_id: str, current_user: dict):
+    """Re-total the class's fee_tracking rows after its fee structures change"""
+    job = await create_job(db, "fee_recompute", {"class_id": class_id}, current_user.get("user_id"))
+    background_tasks.add_task(run_job, db, job["job_id"], recompute_fee_tracking)
+    return job["job_id"]
+
 @api_router.post('/admin/fees')
-async def create_fee_structure(class_id: str, tuition_fee: float, exam_fee: float = 0.0, lab_fee: float = 0.0, transport: float = 0.0, scholarship: float = 0.0, section: str = None, frequency: str = 'yearly', current_user: dict = Depends(require_role(["ADMIN"]))):
+async def create_fee_structure(background_tasks: BackgroundTasks, class_id: str, tuition_fee: float, exam_fee: float = 0.0, lab_fee: float = 0.0, transport: float = 0.0, scholarship: float = 0.0, section: str = None, frequency: str = 'yearly', current_user: dict = Depends(require_role(["ADMIN"]))):
     # validations
     if tuition_fee < 0 or exam_fee < 0 or lab_fee < 0 or transport < 0 or scholarship < 0:
         raise HTTPException(status_code=400, detail="Fees must be non-negative")
@@ -1323,10 +1383,11 @@ async def create_fee_structure(class_id: str, tuition_fee: float, exam_fee: floa
     result = await db.fee_structures.insert_one(fee_doc)
     inserted_id = result.inserted_id
     fee_doc.pop('_id', None)
-    return {"message": "Fee structure created", "fee": {**fee_doc, "id": str(inserted_id)}}
+    job_id = await _queue_fee_recompute(background_tasks, class_id, current_user)
+    return {"message": "Fee structure created", "fee": {**fee_doc, "id": str(inserted_id)}, "recompute_job_id": job_id}
 
 @api_router.put('/admin/fees/{fee_id}')
-async def update_fee(fee_id: str, tuition_fee: float = None, exam_fee: float = None, lab_fee: float = None, transport: float = None, scholarship: float = None, section: str = None, frequency: str = None, current_user: dict = Depends(require_role(["ADMIN"]))):
+async def update_fee(fee_id: str, background_tasks: BackgroundTasks, tuition_fee: float = None, exam_fee: float = None, lab_fee: float = None, transport: float = None, scholarship: float = None, section: str = None, frequency: str = None, current_user: dict = Depends(require_role(["ADMIN"]))):
     update = {}
     if tuition_fee is not None:
         if tuition_fee < 0:
@@ -1361,52 +1422,35 @@ async def update_fee(fee_id: str, tuition_fee: float = None, exam_fee: float = N
         raise HTTPException(status_code=404, detail="Fee structure not found")
     await db.fee_structures.update_one({"fee_id": fee_id}, {"$set": update})
     updated = await db.fee_structures.find_one({"fee_id": fee_id}, {"_id": 0})
-    return {"message": "Fee updated", "fee": updated}
+    job_id = await _queue_fee_recompute(background_tasks, fee["class_id"], current_user)
+    return {"message": "Fee updated", "fee": updated, "recompute_job_id": job_id}
 
 @api_router.delete('/admin/fees/{fee_id}')
-async def delete_fee(fee_id: str, current_user: dict = Depends(require_role(["ADMIN"]))):
-    res = await db.fee_structures.delete_one({"fee_id": fee_id})
-    if res.deleted_count == 0:
+async def delete_fee(fee_id: str, background_tasks: BackgroundTasks, current_user: dict = Depends(require_role(["ADMIN"]))):
+    fee = await db.fee_structures.find_one_and_delete({"fee_id": fee_id}, projection={"_id": 0, "class_id": 1})
+    if not fee:
         raise HTTPException(status_code=404, detail="Fee not found")
-    return {"message": "Fee deleted"}
+    job_id = await _queue_fee_recompute(background_tasks, fee["class_id"], current_user)
+    return {"message": "Fee deleted", "recompute_job_id": job_id}
+
+async def _queue_attendance_purge(background_tasks: BackgroundTasks, student_ids, current_user: dict):
+    if not student_ids:
+        return None
+    job = await create_job(db, "attendance_purge", {"student_ids": student_ids}, current_user.get("user_id"))
+    background_tasks.add_task(run_job, db, job["job_id"], purge_attendance)
+    return job["job_id"]
 
 @api_router.delete('/admin/students/{student_id}')
-async def delete_student(student_id: str, current_user: dict = Depends(require_role(["ADMIN"]))):
-    """Delete a student and all related data"""
+async def delete_student(student_id: str, background_tasks: BackgroundTasks, current_user: dict = Depends(require_role(["ADMIN"]))):
+    """Delete a student and all related data; attendance is purged by a background job"""
     try:
-        # Find student first
-        student = await db.students.find_one({"student_id": student_id})
-        if not student:
+        results, deleted = await delete_students(db, [student_id])
+        if not deleted:
             raise HTTPException(status_code=404, detail="Student not found")
-        
-        # Delete student record
-        await db.students.delete_one({"student_id": student_id})
-        
-        # Delete associated fee tracking
-        await db.fee_tracking.delete_many({"student_id": student_id})
-        
-        # Delete associated payments
-        await db.payments.delete_many({"student_id": student_id})
-        
-        # Delete attendance records
-        await db.attendance.delete_many({"student_id": student_id})
-        
-        # Delete marks
-        await db.marks.delete_many({"student_id": student_id})
-        
-        # Remove from parent's children list if linked
-        if student.get("parent_ids"):
-            await db.parents.update_many(
-                {"children_ids": student_id},
-                {"$pull": {"children_ids": student_id}}
-            )
-        
-        # Delete associated user account
-        if student.get("user_id"):
-            await db.users.delete_one({"user_id": student.get("user_id")})
+        job_id = await _queue_attendance_purge(background_tasks, deleted, current_user)
         
         logger.info(f"Student {student_id} and all related data deleted by admin {current_user.get('user_id')}")
-        return {"message": f"Student {student_id} and all related data deleted successfully"}
+        return {"message": f"Student {student_id} and all related data deleted successfully", "purge_job_id": job_id}
         
     except HTTPException:
         raise
@@ -1414,22 +1458,26 @@ async def delete_student(student_id: str, current_user: dict = Depends(require_r
         logger.error(f"Error deleting student {student_id}: {str(e)}")
         raise HTTPException(status_code=500, detail="Error deleting student")
 
+@api_router.post('/admin/students/bulk-delete')
+async def delete_students_bulk(payload: StudentIdsAction, background_tasks: BackgroundTasks, current_user: dict = Depends(require_role(["ADMIN"]))):
+    """Delete many students and their related data at once; reports a status per ID"""
+    try:
+        results, deleted = await delete_students(db, payload.student_ids)
+    except Exception as e:
+        logger.error(f"Error bulk deleting students: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error deleting students")
+    job_id = await _queue_attendance_purge(background_tasks, deleted, current_user)
+    logger.info(f"{len(deleted)} students deleted by admin {current_user.get('user_id')}")
+    return {"message": f"{len(deleted)} students deleted", "results": results, "purge_job_id": job_id}
+
 @api_router.delete('/admin/faculty/{faculty_id}')
 async def delete_faculty(faculty_id: str, current_user: dict = Depends(require_role(["ADMIN"]))):
     """Delete a faculty/teacher and all related data"""
     try:
-        # Find faculty first
-        faculty = await db.faculty.find_one({"faculty_id": faculty_id})
-        if not faculty:
+        results = await delete_faculty_members(db, [faculty_id])
+        if results[0]["status"] == "not_found":
             raise HTTPException(status_code=404, detail="Faculty not found")
         
-        # Delete faculty record
-        await db.faculty.delete_one({"faculty_id": faculty_id})
-        
-        # Delete associated user account
-        if faculty.get("user_id"):
-            await db.users.delete_one({"user_id": faculty.get("user_id")})
-        
         logger.info(f"Faculty {faculty_id} and related data deleted by admin {current_user.get('user_id')}")
         return {"message": f"Faculty {faculty_id} deleted successfully"}
         
@@ -1439,6 +1487,48 @@ async def delete_faculty(faculty_id: str, current_user: dict = Depends(require_r
         logger.error(f"Error deleting faculty {faculty_id}: {str(e)}")
         raise HTTPException(status_code=500, detail="Error deleting faculty")
 
+@api_router.post('/admin/faculty/bulk-delete')
+async def delete_faculty_bulk(payload: FacultyIdsAction, current_user: dict = Depends(require_role(["ADMIN"]))):
+    """Delete many faculty members at once; reports a status per ID"""
+    try:
+        results = await delete_faculty_members(db, payload.faculty_ids)
+    except Exception as e:
+        logger.error(f"Error bulk deleting faculty: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error deleting faculty")
+    deleted = sum(1 for r in results if r["status"] == "deleted")
+    logger.info(f"{deleted} faculty deleted by admin {current_user.get('user_id')}")
+    return {"message": f"{deleted} faculty deleted", "results": results}
+
+@api_router.post('/admin/rollover')
+async def academic_year_rollover(payload: RolloverRequest, background_tasks: BackgroundTasks, current_user: dict = Depends(require_role(["ADMIN"]))):
+    """
+    Promote every student to the next class, graduate class 10 and start the
+    new year's fee tracking. dry_run (the default) only estimates the work.
+    A real run is a background job; posting again resumes an unfinished one.
+    """
+    from_year = payload.from_year or current_academic_year()
+    to_year = payload.to_year or next_academic_year(from_year)
+    if to_year <= from_year:
+        raise HTTPException(status_code=400, detail="to_year must be after from_year")
+    if payload.dry_run:
+        return {"dry_run": True, **(await estimate_rollover(db, from_year, to_year))}
+    
+    params = {"from_year": from_year, "to_year": to_year}
+    job = await db.jobs.find_one(
+        {"kind": "academic_rollover", "params": params, "status": {"$ne": "DONE"}}, {"_id": 0}
+    ) or await create_job(db, "academic_rollover", params, current_user.get("user_id"))
+    background_tasks.add_task(run_job, db, job["job_id"], run_rollover)
+    logger.info(f"Academic rollover {from_year} -> {to_year} started by admin {current_user.get('user_id')} (job {job['job_id']})")
+    return {"dry_run": False, "job_id": job["job_id"], "status": job["status"]}
+
+@api_router.get('/admin/jobs/{job_id}')
+async def get_job_status(job_id: str, current_user: dict = Depends(require_role(["ADMIN"]))):
+    """Status and progress of a background job"""
+    job = await get_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 @api_router.delete('/admin/users/{user_id}')
 async def delete_user(user_id: str, current_user: dict = Depends(require_role(["ADMIN"]))):
     """Delete a user account"""
@@ -1464,20 +1554,32 @@ async def delete_user(user_id: str, current_user: dict = Depends(require_role(["
         logger.error(f"Error deleting user {user_id}: {str(e)}")
         raise HTTPException(status_code=500, detail="Error deleting user")
 
-@api_router.get('/admin/fees')
-async def list_fee_structures(class_id: str = None, limit: int = 100, offset: int = 0, current_user: dict = Depends(require_role(["ADMIN"]))):
-    query = {}
-    if class_id:
-        query['class_id'] = class_id
-    cursor = db.fee_structures.find(query, {"_id": 0}).skip(offset).limit(limit)
+async def _list_fee_structures(params: dict, sort: str, limit: int, offset: int):
+    try:
+        query = build_filter(FEE_STRUCTURE_FILTERS, params)
+        order = parse_sort(FEE_STRUCTURE_SORTS, sort, "fee_id")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    cursor = db.fee_structures.find(query, {"_id": 0}).sort(order).skip(offset).limit(limit)
     fees = await cursor.to_list(length=limit)
     return {"items": fees, "limit": limit, "offset": offset, "count": len(fees)}
 
+@api_router.get('/admin/fees')
+async def list_fee_structures(
+    class_id: str = None,
+    section: str = None,
+    frequency: str = None,
+    sort: str = None,
+    limit: int = 100,
+    offset: int = 0,
+    current_user: dict = Depends(require_role(["ADMIN"]))
+):
+    params = {"class_id": class_id, "section": section, "frequency": frequency}
+    return await _list_fee_structures(params, sort, limit, offset)
+
 @api_router.get('/admin/fees/all')
-async def list_all_fees(limit: int = 100, offset: int = 0, current_user: dict = Depends(require_role(["ADMIN"]))):
-    cursor = db.fee_structures.find({}, {"_id": 0}).skip(offset).limit(limit)
-    fees = await cursor.to_list(length=limit)
-    return {"items": fees, "limit": limit, "offset": offset, "count": len(fees)}
+async def list_all_fees(sort: str = None, limit: int = 100, offset: int = 0, current_user: dict = Depends(require_role(["ADMIN"]))):
+    return await _list_fee_structures({}, sort, limit, offset)
 
 # Finance summary for admin dashboard
 @api_router.get('/admin/finance/summary')
@@ -1520,7 +1622,7 @@ async def admin_finance_timeseries(current_user: dict = Depends(require_role(["A
     pipeline = [
         {"$match": {"payment_status": "PAID"}},
         {"$group": {
-            "_id": {"$dateToString": {"format": "%Y-%m", "date": {"$dateFromString": {"dateString": "$updated_at"}}}},
+            "_id": {"$dateToString": {"format": "%Y-%m", "date": {"$toDate": "$updated_at"}}},
             "amount": {"$sum": "$paid_amount"}
         }},
         {"$sort": {"_id": 1}}
@@ -1607,10 +1709,14 @@ async def fee_report_student_wise(unique_student_id: str, current_user: dict = D
         raise HTTPException(status_code=404, detail="Fee record not found for this Student ID")
     
     # Get student details
-    student = await db.students.find_one({"unique_student_id": unique_student_id}, {"_id": 0})
+    student = await db.students.find_one({"unique_student_id": unique_student_id}, {"_id": 0, "search_terms": 0})
     
     # Get parent details
-    parent_mappings = await db.parent_mapping.find({"unique_student_id": unique_student_id}, {"_id": 0}).to_list(100)
+    parent_mappings = await mappings_for_student(db, student["student_id"]) if student else []
+    
+    installments = await db.fee_installments.find(
+        {"tracking_id": fee_tracking["tracking_id"]}, {"_id": 0}
+    ).sort("sequence", 1).to_list(12)
     
     return {
         "unique_student_id": unique_student_id,
@@ -1621,9 +1727,116 @@ async def fee_report_student_wise(unique_student_id: str, current_user: dict = D
             "roll_number": student.get("roll_number") if student else None
         },
         "fee_tracking": fee_tracking,
+        "installments": installments,
         "parent_details": parent_mappings
     }
 
+@api_router.get('/admin/search')
+async def admin_global_search(q: str, limit: int = 20, current_user: dict = Depends(require_role(["ADMIN"]))):
+    """
+    Search users, students, faculty, parents and parent mappings at once by name, email, phone or student ID.
+    One result per person, best match first; sources that timed out are listed in timed_out.
+    """
+    if len(q.strip()) < 2:
+        raise HTTPException(status_code=400, detail="q must be at least 2 characters")
+    result = await global_search(db, q.strip(), max(1, min(limit, 100)))
+    if result["failed"]:
+        logger.error(f"Admin search failed for sources: {', '.join(result['failed'])}")
+    return result
+
+@api_router.post('/admin/fees/reconcile-summaries')
+async def reconcile_student_fee_summaries(background_tasks: BackgroundTasks, current_user: dict = Depends(require_role(["ADMIN"]))):
+    """Re-copy every student's fee summary from fee_tracking in the background; poll /admin/jobs/{job_id}"""
+    job = await create_job(db, "fee_summary_reconcile", {}, current_user.get("user_id"))
+    background_tasks.add_task(run_job, db, job["job_id"], reconcile_fee_summaries)
+    return {"message": "Fee summary reconciliation queued", "job_id": job["job_id"]}
+
+@api_router.get('/admin/fees/defaulters')
+async def fee_defaulters(
+    class_name: str = None,
+    section: str = None,
+    bucket: str = None,
+    min_amount: float = None,
+    sort: str = "amount",
+    limit: int = 50,
+    cursor: str = None,
+    format: str = "json",
+    current_user: dict = Depends(require_role(["ADMIN"]))
+):
+    """
+    Students with overdue, unpaid fees and how long they have owed.
+    sort: amount (largest first) or age (longest overdue first).
+    bucket: 0-30, 31-60, 61-90 or 90+ days overdue.
+    JSON pages are fetched with the returned next_cursor; format=csv streams every matching row.
+    """
+    if sort not in SORTS:
+        raise HTTPException(status_code=400, detail="sort must be amount or age")
+    if format not in ("json", "csv"):
+        raise HTTPException(status_code=400, detail="format must be json or csv")
+    try:
+        query = defaulter_query(class_name, section, bucket, min_amount)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if format == "csv":
+        columns = ["unique_student_id", "name", "class_name", "section", "roll_number", "academic_year",
+                   "total_fee_amount", "paid_amount", "pending_amount", "overdue_since", "days_overdue", "aging_bucket"]
+        return streaming_export(iter_defaulters(db, query, sort), columns, "csv", "fee_defaulters")
+    
+    limit = max(1, min(limit, 500))
+    try:
+        items = [row async for row in iter_defaulters(db, query, sort, cursor, limit + 1)]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    has_more = len(items) > limit
+    items = items[:limit]
+    response = {
+        "items": items,
+        "next_cursor": encode_cursor(items[-1], sort) if has_more else None
+    }
+    if not cursor:
+        # Totals only on the first page; later pages stay a pure index range scan
+        response["aging"] = await aging_summary(db, query)
+    return response
+
+@api_router.get('/admin/exports/{dataset}')
+async def export_dataset(
+    dataset: str,
+    format: str = "csv",
+    class_name: str = None,
+    section: str = None,
+    academic_year: str = None,
+    date_from: str = None,
+    date_to: str = None,
+    columns: str = None,
+    current_user: dict = Depends(require_role(["ADMIN"]))
+):
+    """
+    Stream students, fees, attendance or payments as CSV or NDJSON.
+    columns: comma separated subset (default: all exportable columns).
+    date_from/date_to (YYYY-MM-DD, inclusive) filter on the dataset's main date.
+    For attendance and payments, class_name/section select the students in that class now.
+    Rows go from the cursor to the client in batches, so exports of any size use constant memory.
+    """
+    if dataset not in DATASETS:
+        raise HTTPException(status_code=404, detail=f"Unknown export; use one of {', '.join(DATASETS)}")
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+    try:
+        selected = export_columns(dataset, columns)
+        query = await export_query(db, dataset, class_name, section, academic_year, date_from, date_to)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    filename = "_".join(part for part in (dataset, class_name, section, academic_year) if part)
+    return streaming_export(export_cursor(db, dataset, query, selected), selected, format, filename)
+
+@api_router.post('/admin/fees/overdue-sweep')
+async def run_overdue_sweep(current_user: dict = Depends(require_role(["ADMIN"]))):
+    """Flip past-due installments to OVERDUE now instead of waiting for the periodic sweep"""
+    flipped = await sweep_overdue(db)
+    return {"message": f"{flipped} installments marked overdue", "overdue": flipped}
+
 # Chatbot
 @api_router.post("/chat")
 async def chat_with_bot(message: ChatMessage, current_user: dict = Depends(get_current_user)):
@@ -1649,14 +1862,35 @@ async def chat_with_bot(message: ChatMessage, current_user: dict = Depends(get_c
         timestamp=get_current_timestamp()
     )
 
-# Mount the API router
-app.include_router(api_router)
-
-@app.get("/")
-async def root():
+async def index():
     return {
         "message": "Sadhana Memorial School API",
         "status": "active",
         "docs": "/docs",
         "api": "/api"
     }
+
+def create_app() -> FastAPI:
+    """
+    Build the ASGI app. Safe to call before forking (gunicorn --preload):
+    no database or payment gateway connections are opened here.
+    """
+    application = FastAPI(
+        title="Sadhana Memorial School Management System",
+        lifespan=lifespan
+    )
+    application.add_exception_handler(HTTPException, http_exception_handler)
+    application.add_middleware(
+        CORSMiddleware,
+        allow_origins=allowed_origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    application.add_api_route("/health", health, methods=["GET"])
+    # Mount the API router
+    application.include_router(api_router)
+    application.add_api_route("/", index, methods=["GET"])
+    return application
+
+app = create_app()
@@ -0,0 +1,285 @@
+"""Streaming bulk import of students from CSV/XLSX uploads.
+
+Rows are read one at a time from the uploaded file and processed in chunks:
+each chunk is validated, checked against existing accounts with a single
+query, given a block of roll numbers per section from `counters` and written
+with one insert_many per collection (users, students, fee_tracking).
+
+Passwords given in the file are hashed in a process pool, several rows at a
+time. Rows without one create an inactive account with a single-use invite
+(see invites.py); the tokens are returned in the report and emailed by the
+caller.
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+
+from admin_search import contact_search_terms
+from auth import get_password_hash
+from fee_summary import SUMMARY_DEFAULTS, sync_fee_summaries
+from installments import schedule_installments
+from invites import new_invite
+from counters import SECTION_CAPACITY, release_students_roll_numbers, reserve_available_roll_numbers
+from models import StudentImportRow
+from student_search import search_terms
+from tabular import iter_rows
+from utils import fee_structure_total, generate_id, get_current_timestamp, generate_student_id
+
+CHUNK_SIZE = 200
+VALID_CLASSES = {str(i) for i in range(1, 11)}
+VALID_SECTIONS = {"A", "B", "C"}
+HASH_WORKERS = min(4, os.cpu_count() or 1)
+
+HEADER_ALIASES = {
+    "class": "class_name",
+    "student_name": "name",
+    "dob": "date_of_birth",
+    "admission_no": "admission_number",
+}
+
+
+def iter_student_rows(fileobj, filename: str):
+    """Rows of an uploaded .csv/.xlsx file; ValueError for any other file type"""
+    return iter_rows(fileobj, filename, HEADER_ALIASES)
+
+
+_hash_pool = None
+
+
+def _password_pool():
+    global _hash_pool
+    if _hash_pool is None:
+        # spawn: forking a process that already runs the event loop and Motor's threads is unsafe
+        _hash_pool = ProcessPoolExecutor(max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _hash_pool
+
+
+async def hash_passwords(passwords: list) -> list:
+    """get_password_hash for every entry, spread over HASH_WORKERS processes"""
+    if not passwords:
+        return []
+    loop = asyncio.get_running_loop()
+    pool = _password_pool()
+    return await asyncio.gather(*(loop.run_in_executor(pool, get_password_hash, password) for password in passwords))
+
+
+def _row_errors(error: ValidationError):
+    return [f"{'.'.join(str(p) for p in e['loc']) or 'row'}: {e['msg']}" for e in error.errors()]
+
+
+class StudentImporter:
+    """Accumulates state across chunks: emails seen so far and fee totals"""
+
+    def __init__(self, db, chunk_size: int = CHUNK_SIZE):
+        self.db = db
+        self.chunk_size = chunk_size
+        self.seen_emails = set()
+        self.fee_totals = None
+        self.total_rows = 0
+        self.created = []
+        self.errors = []
+        self.invites = []
+
+    async def run(self, rows) -> dict:
+        chunk = []
+        for row in rows:
+            self.total_rows += 1
+            # Header is line 1, so data rows start at 2
+            chunk.append((self.total_rows + 1, row))
+            if len(chunk) >= self.chunk_size:
+                await self._process_chunk(chunk)
+                chunk = []
+        if chunk:
+            await self._process_chunk(chunk)
+        return {
+            "total_rows": self.total_rows,
+            "imported": len(self.created),
+            "failed": len(self.errors),
+            "created": self.created,
+            "errors": self.errors
+        }
+
+    def invite_emails(self) -> list:
+        """(email, token) for every account created without a password"""
+        return [(created["email"], created["invite_token"]) for created in self.created if created.get("invite_token")]
+
+    def _fail(self, row_number, email, errors):
+        self.errors.append({"row": row_number, "email": email, "errors": errors})
+
+    async def _load_fee_totals(self):
+        self.fee_totals = {}
+        async for fee in self.db.fee_structures.find({}, {"_id": 0}):
+            self.fee_totals[(fee.get("class_id"), fee.get("section"))] = fee_structure_total(fee)
+
+    async def _process_chunk(self, chunk):
+        if self.fee_totals is None:
+            await self._load_fee_totals()
+
+        # 1. Validate rows on their own
+        valid = []
+        for row_number, raw in chunk:
+            email = (raw.get("email") or "").lower() or None
+            try:
+                row = StudentImportRow(**{**{k: v for k, v in raw.items() if v is not None}, "email": email})
+            except ValidationError as e:
+                self._fail(row_number, email, _row_errors(e))
+                continue
+            problems = []
+            if row.class_name not in VALID_CLASSES:
+                problems.append("class_name: must be 1-10")
+            if row.section.upper() not in VALID_SECTIONS:
+                problems.append("section: must be A, B, or C")
+            if row.email in self.seen_emails:
+                problems.append("email: duplicated earlier in the file")
+            if problems:
+                self._fail(row_number, row.email, problems)
+                continue
+            row.section = row.section.upper()
+            self.seen_emails.add(row.email)
+            valid.append((row_number, row))
+
+        # 2. One query for accounts that already exist
+        if valid:
+            existing = await self.db.users.find(
+                {"email": {"$in": [row.email for _, row in valid]}}, {"_id": 0, "email": 1}
+            ).to_list(len(valid))
+            taken = {u["email"] for u in existing}
+            for row_number, row in [item for item in valid if item[1].email in taken]:
+                self._fail(row_number, row.email, ["email: already registered"])
+            valid = [item for item in valid if item[1].email not in taken]
+
+        # 3. One block of roll numbers per section in the chunk
+        by_section = {}
+        for row_number, row in valid:
+            by_section.setdefault((row.academic_year, row.class_name, row.section), []).append((row_number, row))
+        allocated = []
+        for (academic_year, class_name, section), section_rows in by_section.items():
+            roll_numbers = await reserve_available_roll_numbers(self.db, academic_year, class_name, section, len(section_rows))
+            for (row_number, row), roll_number in zip(section_rows, roll_numbers):
+                allocated.append((row_number, row, roll_number))
+            for row_number, row in section_rows[len(roll_numbers):]:
+                self._fail(row_number, row.email, [f"section: {section} of class {class_name} is full (max {SECTION_CAPACITY} students)"])
+        if not allocated:
+            return
+        allocated.sort(key=lambda item: item[0])
+
+        # Password hashing is CPU-bound; run it in parallel, off the event loop
+        given = [row.password for _, row, _ in allocated if row.password]
+        hashed = iter(await hash_passwords(given))
+        hashes = [next(hashed) if row.password else None for _, row, _ in allocated]
+
+        timestamp = get_current_timestamp()
+        users, students, trackings, tokens = [], [], [], []
+        for (row_number, row, roll_number), password_hash in zip(allocated, hashes):
+            token, invite = new_invite(timestamp) if password_hash is None else (None, {})
+            tokens.append(token)
+            user_id = generate_id("user_")
+            student_id = generate_id("stu_")
+            unique_student_id = generate_student_id(row.class_name, row.section, roll_number)
+            users.append({
+                "user_id": user_id,
+                "email": row.email,
+                "name": row.name,
+                "role": "STUDENT",
+                "phone": row.phone,
+                "password": password_hash,
+                # Accounts without a password are activated with their invite (POST /auth/accept-invite)
+                "is_active": password_hash is not None,
+                **invite,
+                "imported": True,
+                "avatar": None,
+                "created_at": timestamp
+            })
+            users[-1]["search_terms"] = contact_search_terms("users", users[-1])
+            students.append({
+                "student_id": student_id,
+                "unique_student_id": unique_student_id,
+                "user_id": user_id,
+                "name": row.name,
+                "email": row.email,
+                "class_name": row.class_name,
+                "section": row.section,
+                "roll_number": str(roll_number),
+                "admission_number": row.admission_number,
+                "admission_date": timestamp,
+                "date_of_birth": row.date_of_birth,
+                "gender": row.gender,
+                "blood_group": row.blood_group,
+                "aadhaar_id": row.aadhaar_id,
+                "student_photo_url": None,
+                "address": row.address,
+                "academic_year": row.academic_year,
+                "previous_school": row.previous_school,
+                "previous_class": row.previous_class,
+                "is_active": True,
+                **SUMMARY_DEFAULTS,
+                "created_at": timestamp
+            })
+            students[-1]["search_terms"] = search_terms(students[-1])
+            total_fee = self.fee_totals.get((row.class_name, row.section), self.fee_totals.get((row.class_name, None)))
+            trackings.append(None if total_fee is None else {
+                "tracking_id": generate_id("track_"),
+                "student_id": student_id,
+                "unique_student_id": unique_student_id,
+                "class_name": row.class_name,
+                "section": row.section,
+                "academic_year": row.academic_year,
+                "total_fee_amount": total_fee,
+                "paid_amount": 0.0,
+                "pending_amount": total_fee,
+                "payment_status": "PENDING",
+                "payment_history": [],
+                "created_at": timestamp,
+                "updated_at": timestamp
+            })
+
+        # 4. One insert_many per collection; rows rejected by a unique index drop out
+        failed = await self._insert(self.db.users, users, allocated, "email: already registered")
+        keep = [i for i in range(len(allocated)) if i not in failed]
+        failed_students = await self._insert(self.db.students, [students[i] for i in keep], [allocated[i] for i in keep], "roll_number: already taken, retry the row")
+        if failed_students:
+            orphaned = [users[keep[i]]["user_id"] for i in failed_students]
+            await self.db.users.delete_many({"user_id": {"$in": orphaned}})
+            keep = [index for i, index in enumerate(keep) if i not in failed_students]
+        # Roll numbers of rows that were not written go back to their sections
+        kept = set(keep)
+        await release_students_roll_numbers(self.db, [
+            {"academic_year": row.academic_year, "class_name": row.class_name, "section": row.section, "roll_number": roll_number}
+            for i, (_, row, roll_number) in enumerate(allocated) if i not in kept
+        ])
+        fee_docs = [trackings[i] for i in keep if trackings[i]]
+        if fee_docs:
+            await self.db.fee_tracking.insert_many(fee_docs, ordered=False)
+            await schedule_installments(self.db, fee_docs)
+            await sync_fee_summaries(self.db, student_ids=[doc["student_id"] for doc in fee_docs])
+
+        for i in keep:
+            row_number, row, _ = allocated[i]
+            self.created.append({
+                "row": row_number,
+                "email": row.email,
+                "student_id": students[i]["student_id"],
+                "unique_student_id": students[i]["unique_student_id"],
+                **({"invite_token": tokens[i]} if tokens[i] else {})
+            })
+
+    async def _insert(self, collection, docs, rows, duplicate_message):
+        """insert_many(ordered=False); returns the positions that hit a duplicate key"""
+        if not docs:
+            return set()
+        try:
+            await collection.insert_many(docs, ordered=False)
+            return set()
+        except BulkWriteError as e:
+            write_errors = e.details.get("writeErrors", [])
+            if any(err.get("code") != 11000 for err in write_errors):
+                raise
+            failed = {err["index"] for err in write_errors}
+            for index in failed:
+                row_number, row = rows[index][0], rows[index][1]
+                self._fail(row_number, row.email, [duplicate_message])
+            return failed
@@ -0,0 +1,153 @@
+"""Prefix search over students by name, unique student ID, admission number and email.
+
+Every student document carries `search_terms`: the normalized prefixes of
+those fields, kept up to date wherever a student is written, plus one
+"=<key>" term per exact identifier (compacted unique ID and admission
+number, whole email). A multikey index on it turns autocomplete into an
+index range scan. Exact identifier matches are fetched first with their own
+index lookup, so a short query that prefixes thousands of names still
+returns them; up to CANDIDATE_LIMIT prefix matches are then ranked here
+(exact ID/admission number first, then name matches) and cut to the limit.
+"""
+import re
+import unicodedata
+
+from pymongo import UpdateOne
+
+MAX_PREFIX = 20
+CANDIDATE_LIMIT = 200
+BACKFILL_BATCH_SIZE = 1000
+
+SEARCH_PROJECTION = {
+    "_id": 0, "student_id": 1, "unique_student_id": 1, "name": 1, "email": 1,
+    "admission_number": 1, "class_name": 1, "section": 1, "roll_number": 1
+}
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def _fold(text) -> str:
+    """Lowercase with accents stripped ("José" -> "jose")"""
+    text = unicodedata.normalize("NFKD", str(text))
+    return "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+
+
+def _compact(text: str) -> str:
+    """Folded text with separators removed ("SMS-2026-10A-001" -> "sms202610a001")"""
+    return "".join(_WORD.findall(_fold(text)))
+
+
+def _prefixes(word: str):
+    return {word[:n] for n in range(1, min(len(word), MAX_PREFIX) + 1)}
+
+
+def _exact_keys(student: dict) -> list:
+    keys = [_compact(student[field]) for field in ("unique_student_id", "admission_number") if student.get(field) and student[field] != "PENDING"]
+    email = _fold(student.get("email") or "").strip()
+    return [f"={key}" for key in keys + ([email] if email else []) if key]
+
+
+def name_terms(name) -> set:
+    """Prefixes of every word of a name, so "kum" finds "Ravi Kumar" """
+    terms = set()
+    for word in _WORD.findall(_fold(name or "")):
+        terms |= _prefixes(word)
+    return terms
+
+
+def email_terms(email) -> set:
+    """Prefixes of the whole address and of each word of its local part (not the domain)"""
+    email = _fold(email or "").strip()
+    if not email:
+        return set()
+    terms = _prefixes(email)
+    for part in _WORD.findall(email.split("@")[0]):
+        terms |= _prefixes(part)
+    return terms
+
+
+def search_terms(student: dict) -> list:
+    terms = name_terms(student.get("name"))
+    for field in ("unique_student_id", "admission_number"):
+        value = student.get(field)
+        if value and value != "PENDING":
+            terms |= _prefixes(_compact(value))
+            for part in _WORD.findall(_fold(value)):
+                terms |= _prefixes(part)
+    terms |= set(_exact_keys(student))
+    terms |= email_terms(student.get("email"))
+    return sorted(terms)
+
+
+def query_terms(q: str) -> list:
+    """One term per whitespace-separated token; emails are kept whole, anything else is compacted"""
+    terms = []
+    for token in _fold(q).split():
+        term = token if "@" in token else _compact(token)
+        if term:
+            terms.append(term[:MAX_PREFIX])
+    return list(dict.fromkeys(terms))
+
+
+def rank(student: dict, q: str) -> tuple:
+    """Sort key: exact ID / admission number, then name prefix, then anything else; ties by name"""
+    needle = _compact(q)
+    folded = _fold(q).strip()
+    name = _fold(student.get("name") or "")
+    if needle and needle in (_compact(student.get("unique_student_id") or ""), _compact(student.get("admission_number") or "")):
+        score = 0
+    elif folded and folded == _fold(student.get("email") or ""):
+        score = 1
+    elif folded and name.startswith(folded):
+        score = 2
+    elif folded and any(word.startswith(folded) for word in name.split()):
+        score = 3
+    else:
+        score = 4
+    return score, name, student.get("student_id") or ""
+
+
+def exact_query_keys(q: str) -> list:
+    """The "=<key>" terms an exact ID, admission number or email query would match"""
+    folded = _fold(q).strip()
+    keys = [f"={_compact(q)}"] if _compact(q) else []
+    if "@" in folded:
+        keys.append(f"={folded}")
+    return keys
+
+
+async def search_students(db, q: str, limit: int = 10, student_ids: list = None) -> list:
+    """Best `limit` matches for q; `student_ids` restricts the search to those students"""
+    terms = query_terms(q)
+    if not terms:
+        return []
+    scope = {} if student_ids is None else {"student_id": {"$in": list(student_ids)}}
+    exact = await db.students.find(
+        {"search_terms": {"$in": exact_query_keys(q)}, **scope}, SEARCH_PROJECTION
+    ).limit(limit).to_list(limit)
+    # The longest (most selective) term drives the index scan
+    terms.sort(key=len, reverse=True)
+    query = {"search_terms": {"$all": terms}, **scope}
+    if exact:
+        query["student_id"] = {**query.get("student_id", {}), "$nin": [s["student_id"] for s in exact]}
+    candidates = await db.students.find(query, SEARCH_PROJECTION).limit(CANDIDATE_LIMIT).to_list(CANDIDATE_LIMIT)
+    candidates = exact + candidates
+    candidates.sort(key=lambda student: rank(student, q))
+    return candidates[:limit]
+
+
+async def ensure_search_index(db):
+    await db.students.create_index("search_terms", name="search_terms")
+
+
+async def backfill_search_terms(db):
+    """Compute search_terms for existing students, in batches"""
+    fields = {"_id": 1, "name": 1, "email": 1, "unique_student_id": 1, "admission_number": 1}
+    ops = []
+    async for student in db.students.find({}, fields):
+        ops.append(UpdateOne({"_id": student["_id"]}, {"$set": {"search_terms": search_terms(student)}}))
+        if len(ops) >= BACKFILL_BATCH_SIZE:
+            await db.students.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        await db.students.bulk_write(ops, ordered=False)
@@ -0,0 +1,58 @@
+"""Row-by-row readers for uploaded CSV and XLSX files.
+
+Both readers are generators, so an upload is never fully loaded into memory;
+headers are normalized to snake_case keys and cells to stripped strings.
+"""
+import csv
+import io
+from datetime import date, datetime
+
+
+def _normalize_header(header, aliases) -> str:
+    key = str(header or "").strip().lower().replace(" ", "_")
+    return aliases.get(key, key)
+
+
+def _cell_to_str(value):
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if isinstance(value, (datetime, date)):
+        return value.date().isoformat() if isinstance(value, datetime) else value.isoformat()
+    value = str(value).strip()
+    return value or None
+
+
+def iter_csv_rows(fileobj, aliases: dict = None):
+    aliases = aliases or {}
+    reader = csv.DictReader(io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline=""))
+    for row in reader:
+        yield {_normalize_header(k, aliases): _cell_to_str(v) for k, v in row.items() if k}
+
+
+def iter_xlsx_rows(fileobj, aliases: dict = None):
+    # openpyxl is only needed for spreadsheet uploads, so import it on demand
+    from openpyxl import load_workbook
+
+    aliases = aliases or {}
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [_normalize_header(h, aliases) for h in next(rows, [])]
+        for values in rows:
+            if all(v is None for v in values):
+                continue
+            yield {key: _cell_to_str(value) for key, value in zip(header, values) if key}
+    finally:
+        workbook.close()
+
+
+def iter_rows(fileobj, filename: str, aliases: dict = None):
+    """Pick the reader from the file extension; ValueError for unsupported files"""
+    filename = (filename or "").lower()
+    if filename.endswith(".csv"):
+        return iter_csv_rows(fileobj, aliases)
+    if filename.endswith(".xlsx"):
+        return iter_xlsx_rows(fileobj, aliases)
+    raise ValueError("Upload a .csv or .xlsx file")
@@ -9,7 +9,7 @@ def fresh_db():
     mongo_url = os.environ.get('MONGO_URL')
     if not mongo_url:
         pytest.skip("MONGO_URL not set in environment")
-    client = AsyncIOMotorClient(mongo_url)
+    client = AsyncIOMotorClient(mongo_url, tz_aware=True)
     test_db = client[os.environ.get('DB_NAME')]
     import server as server_mod
     server_mod.db = test_db
@@ -0,0 +1,43 @@
+import asyncio
+import time
+
+import pytest
+from admin_search import classify, contact_search_terms, gather_with_timeouts, merge_results, source_query
+
+
+def test_query_kinds_and_merging_by_person():
+    assert [classify(q) for q in ("ravi@school.in", "+91 98765", "Ravi K", "SMS-2026")] == ["email", "phone", "name", "name"]
+    terms = set(contact_search_terms("users", {"name": "Ravi Kumar", "email": "ravi.k@school.in", "phone": "+91 98765 43210"}))
+    # Surnames, the national number, the number with country code and its trailing digits all match
+    assert {"kum", "ravi.k@", "k", "98765", "9198765", "~3210", "~43210"} <= terms
+    assert "school" not in terms and "3210" not in terms
+    assert source_query("users", "+91 98765", "phone") == {"search_terms": {"$in": ["9198765", "~9198765"]}}
+    assert source_query("faculty", "Ravi kum", "name") == {"search_terms": {"$all": ["ravi", "kum"]}}
+
+    rows = {
+        "users": [{"user_id": "u1", "name": "Ravi Kumar", "email": "ravi@x.in"}, {"user_id": "u2", "name": "Ravina"}],
+        "parents": [{"parent_id": "p1", "user_id": "u1", "name": "Ravi Kumar", "email": "ravi@x.in"}],
+        "parent_mapping": [{"mapping_id": "m1", "parent_id": "p1", "parent_name": "Ravi Kumar"}],
+        "students": [{"student_id": "s1", "user_id": "u3", "name": "Ravi", "unique_student_id": "SMS-2026-1A-001"}],
+    }
+    items = merge_results(rows, "ravi", "name", 10)
+    assert [(i["type"], i["name"]) for i in items] == [("student", "Ravi"), ("parent", "Ravi Kumar"), ("user", "Ravina")]
+    assert items[1]["matched_in"] == ["users", "parents", "parent_mapping"]
+
+
+@pytest.mark.asyncio
+async def test_slow_source_times_out_without_delaying_the_rest():
+    async def answer(value, delay):
+        await asyncio.sleep(delay)
+        return value
+
+    async def broken():
+        raise RuntimeError("down")
+
+    started = time.monotonic()
+    results, timed_out, failed = await gather_with_timeouts(
+        {"fast": answer(1, 0.01), "also_fast": answer(2, 0.02), "slow": answer(3, 5), "broken": broken()}, 0.1
+    )
+    assert time.monotonic() - started < 1
+    assert results == {"fast": 1, "also_fast": 2}
+    assert timed_out == ["slow"] and failed == ["broken"]
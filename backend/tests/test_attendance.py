@@ -1,4 +1,5 @@
 import pytest
+from datetime import datetime
 from httpx import AsyncClient, ASGITransport
 from server import app, db
 from auth import get_password_hash
@@ -73,7 +74,7 @@ async def test_bulk_attendance_and_student_record(monkeypatch, fresh_db, ac):
     from pymongo import MongoClient
     client = MongoClient(**{ 'host': os.environ.get('MONGO_URL') })
     test_db = client[os.environ.get('DB_NAME')]
-    att_docs = list(test_db.attendance.find({"date": "2025-01-01"}))
+    att_docs = list(test_db.attendance.find({"date": datetime(2025, 1, 1)}))
     client.close()
     assert len(att_docs) >= 2
     ids = [d['student_id'] for d in att_docs]
@@ -131,7 +132,7 @@ async def test_bulk_attendance_and_student_record(monkeypatch, fresh_db, ac):
     test_db.users.delete_one({"email": faculty_email})
     for s in students:
         test_db.students.delete_one({"student_id": s['student_id']})
-    test_db.attendance.delete_many({"date": "2025-01-01"})
+    test_db.attendance.delete_many({"date": datetime(2025, 1, 1)})
     test_db.users.delete_one({"email": stud_user['email']})
     test_db.students.delete_one({"student_id": stud_profile['student_id']})
     client.close()
@@ -0,0 +1,43 @@
+import pytest
+from datetime import datetime, timezone
+import server as server_mod
+from bson_dates import convert_timestamps, converted_fields
+from utils import day_start, get_current_timestamp, parse_timestamp, generate_id
+
+
+def test_parse_timestamp_reads_naive_offset_and_z_strings_as_utc():
+    expected = datetime(2025, 6, 1, 9, 30, tzinfo=timezone.utc)
+    assert parse_timestamp("2025-06-01T09:30:00") == expected
+    assert parse_timestamp("2025-06-01T09:30:00Z") == expected
+    assert parse_timestamp("2025-06-01T15:00:00+05:30") == expected
+    assert parse_timestamp(None) is None
+    assert get_current_timestamp().tzinfo is not None
+    with pytest.raises(ValueError):
+        day_start("01/06/2025")
+
+
+def test_converted_fields_skips_dates_and_unparseable_values():
+    doc = {
+        "created_at": "2025-06-01T09:30:00",
+        "updated_at": datetime(2025, 6, 2, tzinfo=timezone.utc),
+        "last_payment_date": "not a date",
+        "payment_history": [{"date": "2025-06-01", "amount": 10.0}],
+    }
+    update = converted_fields(doc, ["created_at", "updated_at", "last_payment_date", "payment_history.date"])
+    assert update == {
+        "created_at": datetime(2025, 6, 1, 9, 30, tzinfo=timezone.utc),
+        "payment_history": [{"date": datetime(2025, 6, 1, tzinfo=timezone.utc), "amount": 10.0}],
+    }
+
+
+@pytest.mark.asyncio
+async def test_convert_timestamps_is_idempotent(fresh_db):
+    db = server_mod.db
+    student_id = generate_id('stu_')
+    await db.students.insert_one({"student_id": student_id, "created_at": "2025-06-01T09:30:00", "admission_date": "2025-04-01"})
+    await convert_timestamps(db)
+    await convert_timestamps(db)
+    student = await db.students.find_one({"student_id": student_id})
+    assert student["created_at"] == datetime(2025, 6, 1, 9, 30, tzinfo=timezone.utc)
+    assert student["admission_date"] == datetime(2025, 4, 1, tzinfo=timezone.utc)
+    await db.students.delete_one({"student_id": student_id})
@@ -0,0 +1,67 @@
+import pytest
+import server as server_mod
+from auth import get_password_hash
+from utils import generate_id, get_current_timestamp
+
+
+@pytest.mark.asyncio
+async def test_bulk_approve_and_reject_report_per_id(fresh_db, ac):
+    db = server_mod.db
+    admin_email = f"admin_{generate_id('t_')}@example.com"
+    await db.users.insert_one({
+        "user_id": generate_id('user_'),
+        "email": admin_email,
+        "name": "Admin Test",
+        "role": "ADMIN",
+        "password": get_password_hash("adminpass"),
+        "is_active": True,
+        "created_at": get_current_timestamp()
+    })
+    resp_login = await ac.post('/api/auth/login', json={"email": admin_email, "password": "adminpass"})
+    headers = {"Authorization": f"Bearer {resp_login.json()['access_token']}"}
+
+    roles = ["STUDENT", "STUDENT", "FACULTY", "PARENT", "STUDENT"]
+    pending = [{
+        "user_id": generate_id('user_'),
+        "email": f"pending_{generate_id('t_')}@example.com",
+        "name": f"Pending {i}",
+        "role": role,
+        "password": "x",
+        "is_active": False,
+        "created_at": get_current_timestamp()
+    } for i, role in enumerate(roles)]
+    await db.users.insert_many(pending)
+    ids = [u["user_id"] for u in pending]
+
+    resp = await ac.post('/api/admin/users/approve', json={"user_ids": ids[:4] + ["user_missing"]}, headers=headers)
+    assert resp.status_code == 200
+    statuses = {r["user_id"]: r["status"] for r in resp.json()["results"]}
+    assert statuses == {**{user_id: "approved" for user_id in ids[:4]}, "user_missing": "not_found"}
+    assert await db.users.count_documents({"user_id": {"$in": ids[:4]}, "is_active": True}) == 4
+    assert await db.students.count_documents({"user_id": {"$in": ids[:2]}}) == 2
+    assert await db.faculty.count_documents({"user_id": ids[2]}) == 1
+    assert await db.parents.count_documents({"user_id": ids[3]}) == 1
+
+    # Approving again is harmless and does not duplicate profiles
+    resp = await ac.post('/api/admin/users/approve', json={"user_ids": ids[:2]}, headers=headers)
+    assert {r["status"] for r in resp.json()["results"]} == {"already_active"}
+    assert await db.students.count_documents({"user_id": {"$in": ids[:2]}}) == 2
+
+    resp = await ac.post('/api/admin/users/reject', json={"user_ids": [ids[4], ids[0]]}, headers=headers)
+    assert resp.json()["results"] == [{"user_id": ids[4], "status": "rejected"}, {"user_id": ids[0], "status": "already_active"}]
+    assert await db.users.count_documents({"user_id": ids[4]}) == 0
+    # Rejecting is only for pending accounts: the approved student keeps their account and profile
+    assert await db.users.count_documents({"user_id": ids[0]}) == 1
+    assert await db.students.count_documents({"user_id": ids[0]}) == 1
+    assert (await ac.post(f'/api/admin/users/reject/{ids[1]}', headers=headers)).status_code == 409
+
+    invited = {"user_id": generate_id('user_'), "email": f"invited_{generate_id('t_')}@example.com", "name": "Invited",
+               "role": "STUDENT", "password": None, "is_active": False, "created_at": get_current_timestamp()}
+    await db.users.insert_one(invited)
+    resp = await ac.post(f'/api/admin/users/approve/{invited["user_id"]}', headers=headers)
+    assert resp.json()["status"] == "awaiting_invite"
+    assert (await db.users.find_one({"user_id": invited["user_id"]}))["is_active"] is False
+    ids.append(invited["user_id"])
+
+    await db.faculty.delete_many({"user_id": {"$in": ids}})
+    await db.parents.delete_many({"user_id": {"$in": ids}})
@@ -0,0 +1,99 @@
+import pytest
+import server as server_mod
+from auth import get_password_hash
+from utils import generate_id, get_current_timestamp
+
+
+@pytest.mark.asyncio
+async def test_bulk_student_delete_cascades_and_purges_attendance(fresh_db, ac):
+    db = server_mod.db
+    admin_email = f"admin_{generate_id('t_')}@example.com"
+    await db.users.insert_one({
+        "user_id": generate_id('user_'),
+        "email": admin_email,
+        "name": "Admin Test",
+        "role": "ADMIN",
+        "password": get_password_hash("adminpass"),
+        "is_active": True,
+        "created_at": get_current_timestamp()
+    })
+    resp_login = await ac.post('/api/auth/login', json={"email": admin_email, "password": "adminpass"})
+    headers = {"Authorization": f"Bearer {resp_login.json()['access_token']}"}
+
+    students = []
+    parent_id = generate_id('par_')
+    for i in range(3):
+        user_id = generate_id('user_')
+        student = {
+            "student_id": generate_id('stu_'),
+            "unique_student_id": f"SMS-TEST-{generate_id('u_')}",
+            "user_id": user_id,
+            "name": f"Student {i}",
+            "created_at": get_current_timestamp()
+        }
+        students.append(student)
+        await db.users.insert_one({"user_id": user_id, "email": f"{user_id}@example.com", "role": "STUDENT"})
+        await db.fee_tracking.insert_one({"tracking_id": generate_id('track_'), "student_id": student["student_id"]})
+        await db.marks.insert_one({"marks_id": generate_id('mrk_'), "student_id": student["student_id"], "subject": "Maths", "exam_name": "T1"})
+        await db.parent_mapping.insert_one({"mapping_id": generate_id('map_'), "parent_id": parent_id, "student_id": student["student_id"], "unique_student_id": student["unique_student_id"]})
+        await db.attendance.insert_many([
+            {"attendance_id": generate_id('att_'), "student_id": student["student_id"], "date": f"2025-01-{day:02d}"}
+            for day in range(1, 11)
+        ])
+    await db.students.insert_many(students)
+
+    doomed = [s["student_id"] for s in students[:2]]
+    resp = await ac.post('/api/admin/students/bulk-delete', json={"student_ids": doomed + ["stu_missing"]}, headers=headers)
+    assert resp.status_code == 200
+    body = resp.json()
+    assert [r["status"] for r in body["results"]] == ["deleted", "deleted", "not_found"]
+
+    for collection in ("students", "fee_tracking", "marks", "attendance"):
+        assert await db[collection].count_documents({"student_id": {"$in": doomed}}) == 0
+    assert await db.attendance.count_documents({"student_id": students[2]["student_id"]}) == 10
+    assert await db.parent_mapping.count_documents({"student_id": {"$in": doomed}}) == 0
+    assert await db.parent_mapping.distinct("student_id", {"parent_id": parent_id}) == [students[2]["student_id"]]
+
+    job = await ac.get(f"/api/admin/jobs/{body['purge_job_id']}", headers=headers)
+    assert job.json()["status"] == "DONE"
+    assert job.json()["result"] == {"attendance_deleted": 20}
+
+    keep = students[2]
+    await db.attendance.delete_many({"student_id": keep["student_id"]})
+    await db.fee_tracking.delete_many({"student_id": keep["student_id"]})
+    await db.parent_mapping.delete_many({"parent_id": parent_id})
+
+
+@pytest.mark.asyncio
+async def test_faculty_delete_removes_profile_account_and_notifications(fresh_db, ac):
+    db = server_mod.db
+    admin_email = f"admin_{generate_id('t_')}@example.com"
+    await db.users.insert_one({
+        "user_id": generate_id('user_'), "email": admin_email, "name": "Admin Test", "role": "ADMIN",
+        "password": get_password_hash("adminpass"), "is_active": True, "created_at": get_current_timestamp()
+    })
+    resp_login = await ac.post('/api/auth/login', json={"email": admin_email, "password": "adminpass"})
+    headers = {"Authorization": f"Bearer {resp_login.json()['access_token']}"}
+
+    faculty = []
+    for i in range(3):
+        user_id = generate_id('user_')
+        faculty.append({"faculty_id": generate_id('fac_'), "user_id": user_id, "name": f"Teacher {i}"})
+        await db.users.insert_one({"user_id": user_id, "email": f"{user_id}@example.com", "role": "FACULTY"})
+        await db.notifications.insert_one({"notification_id": generate_id('notif_'), "user_id": user_id})
+    await db.faculty.insert_many([dict(f) for f in faculty])
+
+    resp = await ac.delete(f"/api/admin/faculty/{faculty[0]['faculty_id']}", headers=headers)
+    assert resp.status_code == 200
+    resp = await ac.post('/api/admin/faculty/bulk-delete', json={"faculty_ids": [faculty[1]["faculty_id"], "fac_missing"]}, headers=headers)
+    assert resp.status_code == 200
+    assert [r["status"] for r in resp.json()["results"]] == ["deleted", "not_found"]
+
+    gone = [f["user_id"] for f in faculty[:2]]
+    assert await db.faculty.count_documents({"faculty_id": {"$in": [f["faculty_id"] for f in faculty[:2]]}}) == 0
+    assert await db.users.count_documents({"user_id": {"$in": gone}}) == 0
+    assert await db.notifications.count_documents({"user_id": {"$in": gone}}) == 0
+    assert await db.faculty.count_documents({"faculty_id": faculty[2]["faculty_id"]}) == 1
+
+    await db.faculty.delete_many({"faculty_id": faculty[2]["faculty_id"]})
+    await db.notifications.delete_many({"user_id": faculty[2]["user_id"]})
@@ -0,0 +1,29 @@
+import pytest
+import server as server_mod
+from auth import get_password_hash
+from models import ChatResponse
+from utils import generate_id, get_current_timestamp
+
+
+def test_chat_response_takes_the_current_timestamp():
+    now = get_current_timestamp()
+    assert ChatResponse(response="hi", timestamp=now).timestamp == now
+
+
+@pytest.mark.asyncio
+async def test_chat_answers_by_keyword(fresh_db, ac):
+    db = server_mod.db
+    user_id = generate_id('user_')
+    email = f"student_{generate_id('t_')}@example.com"
+    await db.users.insert_one({"user_id": user_id, "email": email, "name": "S", "role": "STUDENT", "password": get_password_hash("studentpass"),
+                               "is_active": True, "created_at": get_current_timestamp()})
+
+    login = await ac.post('/api/auth/login', json={"email": email, "password": "studentpass"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    resp = await ac.post("/api/chat", json={"message": "How are my Fees?"}, headers=headers)
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["response"].startswith("Visit the Fees section")
+    assert body["timestamp"]
+
+    await db.users.delete_many({"user_id": user_id})
@@ -0,0 +1,138 @@
+import asyncio
+import pytest
+from datetime import datetime, timezone
+import server as server_mod
+import dashboards
+from auth import get_password_hash
+from utils import generate_id, get_current_timestamp
+
+
+def test_fee_part_reads_the_embedded_summary():
+    students = [{"student_id": "stu_1", "payment_status": "PARTIAL", "total_fee_amount": 100.0, "paid_amount": 40.0, "pending_amount": 60.0, "name": "A"}]
+    assert asyncio.run(dashboards.fee_part(students)) == {
+        "stu_1": {"payment_status": "PARTIAL", "total_fee_amount": 100.0, "paid_amount": 40.0, "pending_amount": 60.0}
+    }
+    assert dashboards.today_name(datetime(2026, 10, 19, tzinfo=timezone.utc)) == "Monday"
+
+
+@pytest.mark.asyncio
+async def test_parent_dashboard_batches_children_and_marks_failed_parts(monkeypatch, fresh_db, ac):
+    db = server_mod.db
+    user_id, parent_id = generate_id('user_'), generate_id('par_')
+    email = f"parent_{generate_id('t_')}@example.com"
+    await db.users.insert_one({"user_id": user_id, "email": email, "name": "P", "role": "PARENT", "password": get_password_hash("parentpass"),
+                               "is_active": True, "created_at": get_current_timestamp()})
+    await db.parents.insert_one({"parent_id": parent_id, "user_id": user_id, "name": "P", "email": email})
+    children = [{"student_id": generate_id('stu_'), "name": name, "class_name": "5", "section": "A", "payment_status": "PENDING", "pending_amount": 10.0}
+                for name in ("Bela", "Asha")]
+    await db.students.insert_many([dict(c) for c in children])
+    await db.parent_mapping.insert_many([{"mapping_id": generate_id('map_'), "parent_id": parent_id, "student_id": c["student_id"]} for c in children])
+    await db.attendance.insert_many([
+        {"attendance_id": generate_id('att_'), "student_id": children[0]["student_id"], "date": datetime(2025, 1, day, tzinfo=timezone.utc),
+         "status": "PRESENT" if day < 4 else "ABSENT"}
+        for day in range(1, 5)
+    ])
+    await db.marks.insert_one({"marks_id": generate_id('mrk_'), "student_id": children[1]["student_id"], "subject": "Maths", "exam_name": "T1",
+                               "marks_obtained": 40, "total_marks": 50, "created_at": get_current_timestamp()})
+
+    login = await ac.post('/api/auth/login', json={"email": email, "password": "parentpass"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    body = (await ac.get("/api/parents/me/dashboard", headers=headers)).json()
+    assert [c["name"] for c in body["children"]] == ["Asha", "Bela"]
+    bela = body["children"][1]
+    assert bela["attendance"] == {"total_days": 4, "present_days": 3, "percentage": 75.0}
+    assert bela["fees"]["pending_amount"] == 10.0
+    assert body["children"][0]["recent_marks"][0]["subject"] == "Maths"
+    assert body["partial"] is False
+
+    async def broken(db, student_ids):
+        raise RuntimeError("down")
+    monkeypatch.setattr(dashboards, "attendance_part", broken)
+    body = (await ac.get("/api/parents/me/dashboard", headers=headers)).json()
+    assert body["failed"] == ["attendance"] and body["partial"] is True
+    assert body["children"][1]["attendance"] is None and body["children"][1]["fees"] is not None
+
+    ids = [c["student_id"] for c in children]
+    for collection in ("students", "parent_mapping", "attendance", "marks"):
+        await db[collection].delete_many({"student_id": {"$in": ids}})
+    await db.parents.delete_many({"parent_id": parent_id})
+    await db.users.delete_many({"user_id": user_id})
+
+
+def test_part_etags_follow_the_data():
+    assert dashboards.part_etag("fees", {"a": 1, "b": 2}) == dashboards.part_etag("fees", {"b": 2, "a": 1})
+    assert dashboards.part_etag("fees", {"a": 1}) != dashboards.part_etag("fees", {"a": 2})
+    assert dashboards.parse_if_none_match('"fees.1", W/"marks.2"') == {'"fees.1"', '"marks.2"'}
+
+
+@pytest.mark.asyncio
+async def test_student_dashboard_skips_known_parts_and_returns_304(fresh_db, ac):
+    db = server_mod.db
+    user_id = generate_id('user_')
+    email = f"student_{generate_id('t_')}@example.com"
+    await db.users.insert_one({"user_id": user_id, "email": email, "name": "S", "role": "STUDENT", "password": get_password_hash("studentpass"),
+                               "is_active": True, "created_at": get_current_timestamp()})
+    student_id = generate_id('stu_')
+    await db.students.insert_one({"student_id": student_id, "user_id": user_id, "name": "S", "class_name": "5", "section": "A", "pending_amount": 10.0})
+
+    login = await ac.post('/api/auth/login', json={"email": email, "password": "studentpass"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    first = await ac.get("/api/students/me/dashboard", headers=headers)
+    assert first.status_code == 200
+    parts = first.json()["parts"]
+    assert parts["profile"]["data"]["student_id"] == student_id and parts["fees"]["data"]["pending_amount"] == 10.0
+
+    again = await ac.get("/api/students/me/dashboard", headers={**headers, "If-None-Match": first.headers["etag"]})
+    assert again.status_code == 304
+
+    await db.marks.insert_one({"marks_id": generate_id('mrk_'), "student_id": student_id, "subject": "Maths", "exam_name": "T1", "created_at": get_current_timestamp()})
+    held = ", ".join(p["etag"] for p in parts.values())
+    changed = (await ac.get("/api/students/me/dashboard", headers={**headers, "If-None-Match": held})).json()["parts"]
+    assert changed["profile"] == {"etag": parts["profile"]["etag"], "unchanged": True}
+    assert changed["recent_marks"]["data"][0]["subject"] == "Maths"
+
+    await db.marks.delete_many({"student_id": student_id})
+    await db.students.delete_many({"student_id": student_id})
+    await db.users.delete_many({"user_id": user_id})
+
+
+def test_roster_sorts_roll_numbers_numerically():
+    roster = [{"roll_number": r} for r in ("10", "2", None, "1")]
+    assert [s["roll_number"] for s in sorted(roster, key=dashboards._roll_order)] == ["1", "2", "10", None]
+
+
+@pytest.mark.asyncio
+async def test_faculty_home_marks_today_and_pending_exams(fresh_db, ac):
+    db = server_mod.db
+    user_id = generate_id('user_')
+    email = f"teacher_{generate_id('t_')}@example.com"
+    await db.users.insert_one({"user_id": user_id, "email": email, "name": "T", "role": "FACULTY", "password": get_password_hash("teachpass"),
+                               "is_active": True, "created_at": get_current_timestamp()})
+    await db.faculty.insert_one({"faculty_id": generate_id('fac_'), "user_id": user_id, "subject": "Maths", "assigned_class": "9", "assigned_section": "C"})
+    students = [{"student_id": generate_id('stu_'), "unique_student_id": f"SMS-TEST-{generate_id('u_')}", "name": f"S{roll}",
+                 "class_name": "9", "section": "C", "roll_number": str(roll)} for roll in (10, 2, 1)]
+    await db.students.insert_many([dict(s) for s in students])
+    ids = [s["student_id"] for s in students]
+    await db.attendance.insert_one({"attendance_id": generate_id('att_'), "student_id": ids[1], "date": datetime(2025, 1, 6, tzinfo=timezone.utc), "status": "PRESENT"})
+    await db.marks.insert_many([
+        {"marks_id": generate_id('mrk_'), "student_id": sid, "subject": "Maths", "exam_name": "T1", "exam_date": "2025-01-03",
+         "academic_year": "2024-2025"} for sid in ids[:2]
+    ] + [
+        # Last year's T1 neither completes this year's sheet nor leaves an exam of its own pending
+        {"marks_id": generate_id('mrk_'), "student_id": ids[2], "subject": "Maths", "exam_name": "T1", "exam_date": "2024-01-05",
+         "academic_year": "2023-2024"}
+    ])
+
+    login = await ac.post('/api/auth/login', json={"email": email, "password": "teachpass"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    body = (await ac.get("/api/faculty/me/home?date=2025-01-06", headers=headers)).json()
+    assert [s["roll_number"] for s in body["roster"]] == ["1", "2", "10"]
+    assert [s["attendance_status"] for s in body["roster"]] == [None, "PRESENT", None]
+    assert body["attendance"] == {"marked": 1, "present": 1, "not_marked": 2}
+    assert body["pending_marks"] == [{"subject": "Maths", "exam_name": "T1", "exam_date": "2025-01-03", "missing_count": 1, "missing_student_ids": [ids[2]]}]
+    assert (await ac.get("/api/faculty/me/home?date=06-01-2025", headers=headers)).status_code == 400
+
+    for collection in ("students", "attendance", "marks"):
+        await db[collection].delete_many({"student_id": {"$in": ids}})
+    await db.faculty.delete_many({"user_id": user_id})
+    await db.users.delete_many({"user_id": user_id})
@@ -0,0 +1,59 @@
+import time
+from database import PoolMetrics, create_client, db_name_warning, mongo_settings
+
+
+def test_pool_metrics_records_checkout_waits():
+    metrics = PoolMetrics()
+    for _ in range(3):
+        metrics.connection_created(None)
+        metrics.connection_check_out_started(None)
+        time.sleep(0.002)
+        metrics.connection_checked_out(None)
+    metrics.connection_checked_in(None)
+    metrics.connection_check_out_started(None)
+    metrics.connection_check_out_failed(None)
+
+    snapshot = metrics.snapshot()
+    assert snapshot["checkouts"] == 3
+    assert snapshot["checkout_failures"] == 1
+    assert snapshot["connections_open"] == 3
+    assert snapshot["connections_in_use"] == 2
+    assert snapshot["wait_ms"]["max"] >= 2
+    assert sum(snapshot["wait_histogram"].values()) == 3
+
+
+def test_client_factory_applies_pool_settings():
+    client = create_client({
+        "uri": "mongodb://localhost:27017",
+        "db_name": "smart_school_db",
+        "max_pool_size": 25,
+        "min_pool_size": 2,
+        "max_idle_time_ms": 30000,
+        "compressors": ["zlib"],
+        "read_preference": "secondaryPreferred",
+        "server_selection_timeout_ms": 5000
+    })
+    pool_options = client.delegate.options.pool_options
+    assert pool_options.max_pool_size == 25
+    assert pool_options.min_pool_size == 2
+    assert pool_options.max_idle_time_seconds == 30
+    assert client.delegate.options.read_preference.mongos_mode == "secondaryPreferred"
+    client.close()
+
+
+def test_server_database_ignores_scripts_db_name(monkeypatch):
+    monkeypatch.setenv("MONGODB_URI", "mongodb://localhost:27017")
+    monkeypatch.setenv("DB_NAME", "sadhana_db")
+    monkeypatch.delenv("MONGO_DB_NAME", raising=False)
+    assert mongo_settings()["db_name"] == "smart_school_db"
+    monkeypatch.setenv("MONGO_DB_NAME", "other_db")
+    assert mongo_settings()["db_name"] == "other_db"
+
+
+def test_scripts_warn_when_db_name_points_elsewhere(monkeypatch):
+    monkeypatch.setenv("MONGODB_URI", "mongodb://localhost:27017")
+    monkeypatch.setenv("DB_NAME", "sadhana_db")
+    monkeypatch.delenv("MONGO_DB_NAME", raising=False)
+    assert "MONGO_DB_NAME=sadhana_db" in db_name_warning(mongo_settings())
+    monkeypatch.setenv("MONGO_DB_NAME", "sadhana_db")
+    assert db_name_warning(mongo_settings()) is None
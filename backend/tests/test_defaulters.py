@@ -0,0 +1,63 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+import server as server_mod
+from auth import get_password_hash
+from defaulters import aging_bucket, bucket_range, defaulter_pipeline, encode_cursor
+from utils import generate_id, get_current_timestamp
+
+
+def test_aging_buckets_and_keyset_cursor():
+    assert [aging_bucket(d) for d in (0, 30, 31, 60, 61, 90, 91, 400)] == ["0-30", "0-30", "31-60", "31-60", "61-90", "61-90", "90+", "90+"]
+
+    now = datetime(2026, 1, 31, tzinfo=timezone.utc)
+    window = bucket_range("31-60", now)
+    assert window["$lte"] == now - timedelta(days=31) and window["$gt"] == now - timedelta(days=61)
+    with pytest.raises(ValueError):
+        bucket_range("120+", now)
+
+    cursor = encode_cursor({"pending_amount": 1500.0, "tracking_id": "track_9"}, "amount")
+    match = defaulter_pipeline({"pending_amount": {"$gt": 0}}, "amount", cursor, 10)[0]["$match"]
+    assert match["$and"][1] == {"$or": [{"pending_amount": {"$lt": 1500.0}}, {"pending_amount": 1500.0, "tracking_id": {"$lt": "track_9"}}]}
+
+
+@pytest.mark.asyncio
+async def test_defaulters_pages_by_amount_and_streams_csv(fresh_db, ac):
+    db = server_mod.db
+    admin_email = f"admin_{generate_id('t_')}@example.com"
+    await db.users.insert_one({
+        "user_id": generate_id('user_'),
+        "email": admin_email,
+        "name": "Admin Test",
+        "role": "ADMIN",
+        "password": get_password_hash("adminpass"),
+        "is_active": True,
+        "created_at": get_current_timestamp()
+    })
+    resp_login = await ac.post('/api/auth/login', json={"email": admin_email, "password": "adminpass"})
+    headers = {"Authorization": f"Bearer {resp_login.json()['access_token']}"}
+
+    class_name = f"T{generate_id('c_')}"
+    now = datetime.now(timezone.utc)
+    rows = [
+        {"tracking_id": generate_id('track_'), "student_id": generate_id('stu_'), "class_name": class_name, "section": "A",
+         "pending_amount": amount, "paid_amount": 0.0, "total_fee_amount": amount, "overdue_since": now - timedelta(days=days)}
+        for amount, days in [(500.0, 10), (3000.0, 45), (1200.0, 100), (800.0, 75)]
+    ]
+    rows.append({"tracking_id": generate_id('track_'), "class_name": class_name, "pending_amount": 0.0, "overdue_since": now})
+    await db.fee_tracking.insert_many(rows)
+
+    resp = await ac.get('/api/admin/fees/defaulters', params={"class_name": class_name, "limit": 3}, headers=headers)
+    body = resp.json()
+    assert [r["pending_amount"] for r in body["items"]] == [3000.0, 1200.0, 800.0]
+    assert body["aging"]["90+"] == {"students": 1, "amount": 1200.0}
+    assert body["items"][0]["aging_bucket"] == "31-60"
+    resp = await ac.get('/api/admin/fees/defaulters', params={"class_name": class_name, "limit": 3, "cursor": body["next_cursor"]}, headers=headers)
+    assert [r["pending_amount"] for r in resp.json()["items"]] == [500.0]
+    assert resp.json()["next_cursor"] is None
+
+    resp = await ac.get('/api/admin/fees/defaulters', params={"class_name": class_name, "format": "csv", "sort": "age"}, headers=headers)
+    lines = resp.text.strip().splitlines()
+    assert lines[0].startswith("unique_student_id,name,class_name")
+    assert len(lines) == 5 and lines[1].endswith(",90+")
+
+    await db.fee_tracking.delete_many({"class_name": class_name})
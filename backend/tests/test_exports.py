@@ -0,0 +1,67 @@
+import pytest
+from datetime import datetime, timezone
+import server as server_mod
+from auth import get_password_hash
+from exports import export_columns, export_query, export_sort
+from utils import generate_id, get_current_timestamp
+
+
+@pytest.mark.asyncio
+async def test_export_columns_and_filters():
+    assert export_columns("payments", "amount, payment_id") == ["amount", "payment_id"]
+    assert export_columns("fees")[0] == "tracking_id"
+    with pytest.raises(ValueError):
+        export_columns("students", "name,password")
+
+    query = await export_query(None, "fees", class_name="10", academic_year="2025-2026", date_to="2025-06-30")
+    assert query == {"class_name": "10", "academic_year": "2025-2026", "updated_at": {"$lt": datetime(2025, 7, 1, tzinfo=timezone.utc)}}
+
+    # Attendance has no year field: the academic year narrows the date range instead
+    query = await export_query(None, "attendance", academic_year="2025-2026", date_from="2025-01-01")
+    assert query == {"date": {"$gte": datetime(2025, 4, 1, tzinfo=timezone.utc), "$lt": datetime(2026, 4, 1, tzinfo=timezone.utc)}}
+    with pytest.raises(ValueError):
+        await export_query(None, "attendance", date_from="01/04/2025")
+
+    # Date-range exports walk the (date, _id) index; the rest go in insertion order
+    assert export_sort("attendance", query) == [("date", 1), ("_id", 1)]
+    assert export_sort("payments", {"student_id": {"$in": []}}) == [("_id", 1)]
+
+
+@pytest.mark.asyncio
+async def test_attendance_export_streams_selected_columns(fresh_db, ac):
+    db = server_mod.db
+    admin_email = f"admin_{generate_id('t_')}@example.com"
+    await db.users.insert_one({
+        "user_id": generate_id('user_'),
+        "email": admin_email,
+        "name": "Admin Test",
+        "role": "ADMIN",
+        "password": get_password_hash("adminpass"),
+        "is_active": True,
+        "created_at": get_current_timestamp()
+    })
+    resp_login = await ac.post('/api/auth/login', json={"email": admin_email, "password": "adminpass"})
+    headers = {"Authorization": f"Bearer {resp_login.json()['access_token']}"}
+
+    class_name = f"T{generate_id('c_')}"
+    student_id, other_id = generate_id('stu_'), generate_id('stu_')
+    await db.students.insert_one({"student_id": student_id, "class_name": class_name, "section": "A"})
+    await db.attendance.insert_many([
+        {"attendance_id": generate_id('att_'), "student_id": student_id, "date": datetime(2025, 5, day, tzinfo=timezone.utc), "status": "PRESENT"}
+        for day in range(1, 21)
+    ] + [{"attendance_id": generate_id('att_'), "student_id": other_id, "date": datetime(2025, 5, 1, tzinfo=timezone.utc), "status": "ABSENT"}])
+
+    params = {"class_name": class_name, "date_to": "2025-05-10", "columns": "date,status"}
+    resp = await ac.get('/api/admin/exports/attendance', params=params, headers=headers)
+    lines = resp.text.strip().splitlines()
+    assert lines[0] == "date,status" and len(lines) == 11
+    assert 'filename="attendance_' in resp.headers["content-disposition"]
+
+    resp = await ac.get('/api/admin/exports/attendance', params={**params, "format": "ndjson"}, headers=headers)
+    assert resp.text.splitlines()[0] == '{"date": "2025-05-01T00:00:00+00:00", "status": "PRESENT"}'
+
+    resp = await ac.get('/api/admin/exports/attendance', params={"columns": "password"}, headers=headers)
+    assert resp.status_code == 400
+
+    await db.attendance.delete_many({"student_id": {"$in": [student_id, other_id]}})
+    await db.students.delete_many({"student_id": student_id})
@@ -0,0 +1,37 @@
+import pytest
+import server as server_mod
+from fee_recompute import recompute_fee_tracking
+from jobs import create_job, run_job, get_job
+from utils import generate_id
+
+
+@pytest.mark.asyncio
+async def test_fee_edit_recomputes_totals_and_keeps_payments(fresh_db):
+    db = server_mod.db
+    class_id = f"T{generate_id('c_')}"
+    await db.fee_structures.insert_many([
+        {"fee_id": generate_id('fee_'), "class_id": class_id, "section": None, "tuition_fee": 8000.0, "exam_fee": 1000.0},
+        {"fee_id": generate_id('fee_'), "class_id": class_id, "section": "B", "tuition_fee": 12000.0},
+    ])
+    rows = [
+        {"tracking_id": f"track_{i:03d}_{class_id}", "class_name": class_id, "section": section,
+         "total_fee_amount": 10000.0, "paid_amount": paid, "pending_amount": 10000.0 - paid, "payment_status": "PARTIAL" if paid else "PENDING"}
+        for i, (section, paid) in enumerate([("A", 9000.0), ("A", 0.0), ("B", 10000.0), ("C", 4000.0)])
+    ]
+    await db.fee_tracking.insert_many(rows)
+
+    job = await create_job(db, "fee_recompute", {"class_id": class_id})
+    await run_job(db, job["job_id"], recompute_fee_tracking)
+    finished = await get_job(db, job["job_id"])
+    assert finished["status"] == "DONE"
+    assert finished["progress"] == {"done": 4, "total": 4}
+    assert finished["result"]["updated"] == 4
+
+    after = {r["tracking_id"]: r for r in await db.fee_tracking.find({"class_name": class_id}).to_list(None)}
+    first, second, third, fourth = (after[r["tracking_id"]] for r in rows)
+    assert (first["total_fee_amount"], first["paid_amount"], first["pending_amount"], first["payment_status"]) == (9000.0, 9000.0, 0, "PAID")
+    assert (second["pending_amount"], second["payment_status"]) == (9000.0, "PENDING")
+    assert (third["total_fee_amount"], third["pending_amount"], third["payment_status"]) == (12000.0, 2000.0, "PARTIAL")
+    assert fourth["paid_amount"] == 4000.0 and fourth["pending_amount"] == 5000.0
+
+    await db.fee_tracking.delete_many({"class_name": class_id})
@@ -0,0 +1,84 @@
+import pytest
+from pymongo import UpdateOne
+import server as server_mod
+from fee_summary import SUMMARY_DEFAULTS, reconcile_fee_summaries, repair_update, summary_of, summary_update, sync_fee_summaries
+from auth import get_password_hash
+from jobs import create_job, get_job, run_job
+from utils import generate_id, get_current_timestamp
+
+
+def test_summary_only_replaces_older_copies():
+    assert summary_of(None) == SUMMARY_DEFAULTS
+    row = {"payment_status": "PARTIAL", "total_fee_amount": 50.0, "paid_amount": 10.0, "pending_amount": 40.0, "updated_at": "2026-01-02T00:00:00"}
+    assert summary_update("stu_1", row) == UpdateOne(
+        {"student_id": "stu_1", "$or": [{"fee_updated_at": {"$lte": "2026-01-02T00:00:00"}}, {"fee_updated_at": {"$exists": False}}]},
+        {"$set": {"payment_status": "PARTIAL", "total_fee_amount": 50.0, "paid_amount": 10.0, "pending_amount": 40.0, "fee_updated_at": "2026-01-02T00:00:00"}}
+    )
+
+
+def test_repair_is_guarded_by_the_stamp_it_read():
+    student = {"student_id": "stu_1", "payment_status": "PAID", "fee_updated_at": "2026-03-01T00:00:00"}
+    row = {"payment_status": "PARTIAL", "total_fee_amount": 50.0, "paid_amount": 10.0, "pending_amount": 40.0, "updated_at": "2026-01-02T00:00:00"}
+    assert repair_update(student, row) == UpdateOne(
+        {"student_id": "stu_1", "fee_updated_at": "2026-03-01T00:00:00"},
+        {"$set": {"payment_status": "PARTIAL", "total_fee_amount": 50.0, "paid_amount": 10.0, "pending_amount": 40.0, "fee_updated_at": "2026-01-02T00:00:00"}}
+    )
+
+@pytest.mark.asyncio
+async def test_sync_and_reconcile_copy_fee_tracking_onto_students(fresh_db):
+    db = server_mod.db
+    student_ids = [generate_id('stu_') for _ in range(3)]
+    await db.students.insert_many([{"student_id": sid, **SUMMARY_DEFAULTS} for sid in student_ids])
+    await db.fee_tracking.insert_many([
+        {"tracking_id": generate_id('track_'), "student_id": sid, "payment_status": "PARTIAL", "total_fee_amount": 1000.0,
+         "paid_amount": 400.0, "pending_amount": 600.0, "updated_at": "2026-01-01T00:00:00"}
+        for sid in student_ids[:2]
+    ])
+    await sync_fee_summaries(db, student_ids=student_ids[:1])
+    first = await db.students.find_one({"student_id": student_ids[0]})
+    assert (first["payment_status"], first["pending_amount"]) == ("PARTIAL", 600.0)
+
+    # The second student drifted (its sync never ran); reconciliation repairs it and leaves the rest alone
+    job = await create_job(db, "fee_summary_reconcile", {})
+    await run_job(db, job["job_id"], reconcile_fee_summaries)
+    assert (await get_job(db, job["job_id"]))["result"]["fixed"] >= 1
+    second = await db.students.find_one({"student_id": student_ids[1]})
+    assert (second["payment_status"], second["paid_amount"]) == ("PARTIAL", 400.0)
+    third = await db.students.find_one({"student_id": student_ids[2]})
+    assert third["payment_status"] == "PENDING"
+
+    # A wrong copy stamped newer than its row is out of reach of the sync guard; reconciliation still repairs it
+    await db.students.update_one({"student_id": student_ids[0]}, {"$set": {"payment_status": "PAID", "fee_updated_at": "2027-01-01T00:00:00"}})
+    await sync_fee_summaries(db, student_ids=student_ids[:1])
+    assert (await db.students.find_one({"student_id": student_ids[0]}))["payment_status"] == "PAID"
+    job = await create_job(db, "fee_summary_reconcile", {})
+    await run_job(db, job["job_id"], reconcile_fee_summaries)
+    assert (await get_job(db, job["job_id"]))["result"]["fixed"] == 1
+    first = await db.students.find_one({"student_id": student_ids[0]})
+    assert (first["payment_status"], first["fee_updated_at"]) == ("PARTIAL", "2026-01-01T00:00:00")
+
+    await db.fee_tracking.delete_many({"student_id": {"$in": student_ids}})
+    await db.students.delete_many({"student_id": {"$in": student_ids}})
+
+
+@pytest.mark.asyncio
+async def test_class_roster_reads_the_embedded_summary(fresh_db, ac):
+    db = server_mod.db
+    user_id = generate_id('user_')
+    email = f"teacher_{generate_id('t_')}@example.com"
+    await db.users.insert_one({"user_id": user_id, "email": email, "name": "T", "role": "FACULTY", "password": get_password_hash("teachpass"),
+                               "is_active": True, "created_at": get_current_timestamp()})
+    summary = {"payment_status": "PARTIAL", "total_fee_amount": 1000.0, "paid_amount": 400.0, "pending_amount": 600.0}
+    student_id = generate_id('stu_')
+    await db.students.insert_one({"student_id": student_id, "class_name": "7", "section": "R", **summary, "fee_updated_at": get_current_timestamp()})
+
+    login = await ac.post('/api/auth/login', json={"email": email, "password": "teachpass"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    body = (await ac.get("/api/students/class/7/section/R", headers=headers)).json()
+    assert body["count"] == 1
+    # No fee_tracking row exists: the figures come from the student document alone
+    assert {field: body["items"][0][field] for field in summary} == summary
+    assert "fee_updated_at" not in body["items"][0]
+
+    await db.students.delete_many({"student_id": student_id})
+    await db.users.delete_many({"user_id": user_id})
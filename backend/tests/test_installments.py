@@ -0,0 +1,53 @@
+import pytest
+from datetime import datetime, timezone
+import server as server_mod
+from installments import build_installments, due_dates, schedule_installments, sweep_overdue, sync_installments
+from utils import generate_id
+
+
+def test_plans_follow_frequency_and_academic_calendar():
+    created = datetime(2025, 3, 1, tzinfo=timezone.utc)
+    quarterly = due_dates("2025-2026", "quarterly", created)
+    assert [(d.year, d.month, d.day) for d in quarterly] == [(2025, 4, 10), (2025, 7, 10), (2025, 10, 10), (2026, 1, 10)]
+    assert len(due_dates("2025-2026", "monthly", created)) == 12
+
+    # A mid-year plan gives already-passed installments a grace period
+    late = due_dates("2025-2026", "quarterly", datetime(2025, 11, 1, tzinfo=timezone.utc))
+    assert [(d.month, d.day) for d in late] == [(11, 16), (11, 16), (11, 16), (1, 10)]
+
+    plan = build_installments({"tracking_id": "track_1", "academic_year": "2025-2026", "total_fee_amount": 1000.0}, "monthly", created)
+    assert round(sum(i["amount"] for i in plan), 2) == 1000.0
+    assert all(i["outstanding"] and i["status"] == "PENDING" for i in plan)
+
+
+@pytest.mark.asyncio
+async def test_sweep_flips_past_due_and_payments_clear_them(fresh_db):
+    db = server_mod.db
+    class_id = f"T{generate_id('c_')}"
+    await db.fee_structures.insert_one({"fee_id": generate_id('fee_'), "class_id": class_id, "section": None, "tuition_fee": 4000.0, "frequency": "quarterly"})
+    tracking = {
+        "tracking_id": generate_id('track_'),
+        "student_id": generate_id('stu_'),
+        "class_name": class_id,
+        "section": "A",
+        "academic_year": "2020-2021",
+        "total_fee_amount": 4000.0,
+        "paid_amount": 0.0
+    }
+    await db.fee_tracking.insert_one(dict(tracking))
+    await schedule_installments(db, [tracking])
+    assert await db.fee_installments.count_documents({"tracking_id": tracking["tracking_id"]}) == 4
+
+    later = datetime(2099, 1, 1, tzinfo=timezone.utc)
+    assert await sweep_overdue(db, now=later) == 4
+    row = await db.fee_tracking.find_one({"tracking_id": tracking["tracking_id"]})
+    assert row["overdue_since"] is not None
+
+    await db.fee_tracking.update_one({"tracking_id": tracking["tracking_id"]}, {"$set": {"paid_amount": 2500.0}})
+    await sync_installments(db, [tracking["tracking_id"]], now=later)
+    plan = await db.fee_installments.find({"tracking_id": tracking["tracking_id"]}).sort("sequence", 1).to_list(None)
+    assert [(i["status"], i["paid_amount"]) for i in plan] == [("PAID", 1000.0), ("PAID", 1000.0), ("OVERDUE", 500.0), ("OVERDUE", 0.0)]
+    assert await db.fee_installments.count_documents({"tracking_id": tracking["tracking_id"], "outstanding": True}) == 2
+
+    await db.fee_installments.delete_many({"tracking_id": tracking["tracking_id"]})
+    await db.fee_tracking.delete_many({"tracking_id": tracking["tracking_id"]})
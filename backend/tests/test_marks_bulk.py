@@ -0,0 +1,76 @@
+import pytest
+
+import server as server_mod
+from marks_bulk import build_marks_upserts, ensure_marks_indexes
+from models import MarksBulkCreate
+from utils import calculate_grade, generate_id, get_current_timestamp
+
+
+def test_exam_sheet_rows_become_graded_upserts():
+    sheet = MarksBulkCreate(subject="Maths", exam_name="Unit Test 1", total_marks=50, exam_date="2025-07-10", rows=[])
+    raw_rows = [
+        {"student_id": "stu_1", "marks_obtained": "46"},
+        {"student_id": "stu_2", "marks_obtained": 20, "grade": "B"},
+        {"student_id": "stu_3", "marks_obtained": 51},
+        {"student_id": "stu_1", "marks_obtained": 40},
+        {"student_id": "stu_4", "marks_obtained": "abc"},
+        {"student_id": "stu_5", "marks_obtained": 30, "subject": "Science"},
+    ]
+    operations, errors = build_marks_upserts(sheet, raw_rows, "user_fac")
+
+    assert [e["row"] for e in errors] == [3, 4, 5]
+    assert len(operations) == 3
+    first = operations[0]._doc
+    assert operations[0]._filter == {"student_id": "stu_1", "subject": "Maths", "exam_name": "Unit Test 1", "academic_year": "2025-2026"}
+    assert first["$set"]["grade"] == "A1"
+    assert operations[1]._doc["$set"]["grade"] == "B"
+    assert operations[2]._filter["subject"] == "Science"
+
+
+def test_rows_that_are_not_objects_or_unknown_students_are_row_errors():
+    sheet = MarksBulkCreate(subject="Maths", exam_name="Unit Test 1", total_marks=50, exam_date="2025-07-10", rows=[])
+    raw_rows = [{"student_id": "stu_1", "marks_obtained": 40}, 7, "stu_2", ["stu_3", 20], {"student_id": "stu_ghost", "marks_obtained": 10}]
+    operations, errors = build_marks_upserts(sheet, raw_rows, "u", known_student_ids={"stu_1"})
+    assert len(operations) == 1
+    assert [(e["row"], e["errors"]) for e in errors] == [
+        (2, ["row: must be an object"]), (3, ["row: must be an object"]), (4, ["row: must be an object"]),
+        (5, ["student_id: no such student"])
+    ]
+
+
+def test_grade_bands():
+    assert calculate_grade(91, 100) == "A1"
+    assert calculate_grade(33, 100) == "D"
+    assert calculate_grade(32.9, 100) == "E"
+
+
+def test_same_exam_name_in_another_academic_year_is_a_different_row():
+    rows = [{"student_id": "stu_1", "marks_obtained": 40}]
+    this_year, _ = build_marks_upserts(MarksBulkCreate(subject="Maths", exam_name="Unit Test 1", total_marks=50, exam_date="2025-07-10", rows=[]), rows, "u")
+    last_year, _ = build_marks_upserts(MarksBulkCreate(subject="Maths", exam_name="Unit Test 1", total_marks=50, exam_date="2024-07-12", rows=[]), rows, "u")
+    assert this_year[0]._filter["academic_year"] == "2025-2026"
+    assert last_year[0]._filter["academic_year"] == "2024-2025"
+
+    with pytest.raises(ValueError):
+        build_marks_upserts(MarksBulkCreate(subject="Maths", exam_name="Unit Test 1", total_marks=50, exam_date="next week", rows=[]), rows, "u")
+
+
+@pytest.mark.asyncio
+async def test_marks_migration_keeps_other_years_and_archives_true_duplicates(fresh_db):
+    db = server_mod.db
+    student_id = generate_id("stu_")
+    base = {"student_id": student_id, "subject": "Maths", "exam_name": "Unit Test 1", "total_marks": 50}
+    await db.marks.insert_many([
+        {**base, "marks_id": "m_old", "marks_obtained": 30, "exam_date": "2024-07-12", "created_at": get_current_timestamp()},
+        {**base, "marks_id": "m_dup", "marks_obtained": 35, "exam_date": "2025-07-10", "created_at": get_current_timestamp()},
+        {**base, "marks_id": "m_new", "marks_obtained": 41, "exam_date": "2025-07-10", "created_at": get_current_timestamp()},
+    ])
+    await ensure_marks_indexes(db)
+
+    kept = {m["marks_id"]: m["academic_year"] async for m in db.marks.find({"student_id": student_id})}
+    assert kept == {"m_old": "2024-2025", "m_new": "2025-2026"}
+    archived = await db.marks_duplicates.find_one({"student_id": student_id})
+    assert archived["marks_id"] == "m_dup"
+
+    await db.marks.delete_many({"student_id": student_id})
+    await db.marks_duplicates.delete_many({"student_id": student_id})
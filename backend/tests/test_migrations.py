@@ -0,0 +1,60 @@
+import pytest
+import asyncio
+import server as server_mod
+import migrations
+from migrations import MIGRATIONS, MigrationLeaseLost, run_migrations
+
+
+@pytest.mark.asyncio
+async def test_concurrent_workers_apply_each_migration_once(fresh_db):
+    db = server_mod.db
+    await db.schema_migrations.delete_many({})
+    await db.locks.delete_many({})
+
+    # Four workers booting at once: exactly one applies the steps
+    results = await asyncio.gather(*[run_migrations(db, owner=f"worker-{i}") for i in range(4)])
+    applied = [name for result in results for name in result]
+    assert sorted(applied) == sorted(name for name, _ in MIGRATIONS)
+    assert await db.schema_migrations.count_documents({}) == len(MIGRATIONS)
+    assert await db.locks.count_documents({}) == 0
+
+    # Warm restart does no schema work
+    assert await run_migrations(db, owner="worker-restart") == []
+    assert await db.fee_structures.count_documents({"class_id": "10", "section": None}) == 1
+
+
+@pytest.mark.asyncio
+async def test_step_is_aborted_when_the_lease_cannot_be_renewed(monkeypatch):
+    renewals = []
+
+    async def lost_lease(db, name, owner, ttl):
+        renewals.append(owner)
+        return False
+    monkeypatch.setattr(migrations, "acquire_lease", lost_lease)
+    monkeypatch.setattr(migrations, "HEARTBEAT_SECONDS", 0.01)
+    finished = []
+
+    async def slow_step(db):
+        await asyncio.sleep(1)
+        finished.append(True)
+
+    with pytest.raises(MigrationLeaseLost):
+        await migrations._run_step(None, "0099_slow", slow_step, "worker-1")
+    assert renewals == ["worker-1"] and finished == []
+
+
+@pytest.mark.asyncio
+async def test_step_keeps_the_lease_while_it_runs(monkeypatch):
+    renewals = []
+
+    async def renew(db, name, owner, ttl):
+        renewals.append(owner)
+        return True
+    monkeypatch.setattr(migrations, "acquire_lease", renew)
+    monkeypatch.setattr(migrations, "HEARTBEAT_SECONDS", 0.01)
+
+    async def step(db):
+        await asyncio.sleep(0.1)
+
+    await migrations._run_step(None, "0099_step", step, "worker-1")
+    assert len(renewals) >= 3
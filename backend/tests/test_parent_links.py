@@ -0,0 +1,65 @@
+import pytest
+import server as server_mod
+import parent_links
+from pymongo import UpdateOne
+from auth import get_password_hash
+from parent_links import backfill_parent_links, link_update
+from utils import generate_id, get_current_timestamp
+
+
+def test_link_update_only_fills_defaults_on_insert(monkeypatch):
+    monkeypatch.setattr(parent_links, "generate_id", lambda prefix: prefix + "1")
+    monkeypatch.setattr(parent_links, "get_current_timestamp", lambda: "now")
+    operation = link_update("par_1", {"student_id": "stu_1", "unique_student_id": "SMS-1"},
+                            details={"parent_phone": "999", "parent_name": None}, defaults={"parent_name": "Ravi", "parent_phone": "111"})
+    assert operation == UpdateOne(
+        {"parent_id": "par_1", "student_id": "stu_1"},
+        {
+            "$set": {"unique_student_id": "SMS-1", "parent_phone": "999"},
+            "$setOnInsert": {"mapping_id": "map_1", "created_at": "now", "relationship": None, "parent_name": "Ravi"}
+        },
+        upsert=True
+    )
+
+
+@pytest.mark.asyncio
+async def test_backfill_and_parent_endpoints_read_one_mapping(fresh_db, ac):
+    db = server_mod.db
+    user_id, parent_id = generate_id('user_'), generate_id('par_')
+    email = f"parent_{generate_id('t_')}@example.com"
+    await db.users.insert_one({"user_id": user_id, "email": email, "name": "Ravi", "role": "PARENT", "password": get_password_hash("parentpass"),
+                               "is_active": True, "created_at": get_current_timestamp()})
+    students = [{"student_id": generate_id('stu_'), "unique_student_id": f"SMS-TEST-{generate_id('u_')}", "name": f"Child {i}"} for i in range(3)]
+    # The same link recorded three ways, plus one student linked only from its own side
+    await db.parents.insert_one({"parent_id": parent_id, "user_id": user_id, "name": "Ravi", "email": email, "children_ids": [students[0]["student_id"]]})
+    students[0]["parent_ids"] = [parent_id]
+    students[1]["parent_id"] = parent_id
+    await db.students.insert_many(students)
+    await db.fee_tracking.insert_one({"tracking_id": generate_id('track_'), "student_id": students[1]["student_id"], "pending_amount": 10.0})
+    await db.parent_mapping.insert_many([
+        {"mapping_id": generate_id('map_'), "parent_id": parent_id, "unique_student_id": students[0]["unique_student_id"], "parent_name": "Ravi Kumar"}
+        for _ in range(2)
+    ])
+
+    await backfill_parent_links(db)
+    await backfill_parent_links(db)
+    mappings = await db.parent_mapping.find({"parent_id": parent_id}).to_list(10)
+    assert sorted(m["student_id"] for m in mappings) == sorted(s["student_id"] for s in students[:2])
+    assert {m["student_id"]: m["parent_name"] for m in mappings}[students[0]["student_id"]] == "Ravi Kumar"
+    assert await db.students.count_documents({"student_id": {"$in": [s["student_id"] for s in students]}, "parent_ids": {"$exists": True}}) == 0
+
+    login = await ac.post('/api/auth/login', json={"email": email, "password": "parentpass"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    assert (await ac.get(f"/api/parents/student/{students[2]['student_id']}/fees", headers=headers)).status_code == 403
+    assert (await ac.post(f"/api/parents/link-child/{students[2]['student_id']}", headers=headers)).status_code == 200
+    children = (await ac.get("/api/parents/me/children", headers=headers)).json()
+    assert sorted(c["student_id"] for c in children) == sorted(s["student_id"] for s in students)
+    assert (await ac.get(f"/api/parents/student/{students[1]['student_id']}/fees", headers=headers)).status_code == 200
+    by_student = (await ac.get(f"/api/parents/by-student/{students[2]['student_id']}", headers=headers)).json()
+    assert [p["parent_id"] for p in by_student["parents"]] == [parent_id]
+
+    await db.parent_mapping.delete_many({"parent_id": parent_id})
+    await db.students.delete_many({"student_id": {"$in": [s["student_id"] for s in students]}})
+    await db.fee_tracking.delete_many({"student_id": students[1]["student_id"]})
+    await db.parents.delete_many({"parent_id": parent_id})
+    await db.users.delete_many({"user_id": user_id})
@@ -0,0 +1,71 @@
+import pytest
+from datetime import datetime, timezone
+import server as server_mod
+from auth import get_password_hash
+from fee_payments import RECENT_PAYMENTS, payment_history_page, payment_update_pipeline, trim_payment_history
+from utils import generate_id, get_current_timestamp
+
+
+def test_payment_update_keeps_only_recent_entries():
+    stage = payment_update_pipeline(500.0, {"amount": 500.0}, datetime(2026, 1, 1, tzinfo=timezone.utc))[0]["$set"]
+    assert stage["payment_history"]["$slice"][1] == -RECENT_PAYMENTS
+
+
+@pytest.mark.asyncio
+async def test_history_is_paged_from_payments_and_trimmed_on_tracking(fresh_db):
+    db = server_mod.db
+    student_id = generate_id('stu_')
+    tracking_id = generate_id('track_')
+    history = [{"date": datetime(2025, month, 10, tzinfo=timezone.utc), "amount": 100.0, "method": "online", "razorpay_payment_id": f"pay_{tracking_id}_{month}"}
+               for month in range(1, 13)]
+    await db.fee_tracking.insert_one({"tracking_id": tracking_id, "student_id": student_id, "payment_history": history})
+    # Only the first three were ever recorded in payments
+    await db.payments.insert_many([
+        {"payment_id": generate_id('pay_'), "student_id": student_id, "amount": 100.0, "status": "SUCCESS",
+         "razorpay_payment_id": entry["razorpay_payment_id"], "payment_date": entry["date"]}
+        for entry in history[:3]
+    ])
+
+    await trim_payment_history(db)
+    row = await db.fee_tracking.find_one({"tracking_id": tracking_id})
+    assert [e["date"].month for e in row["payment_history"]] == [8, 9, 10, 11, 12]
+    assert await db.payments.count_documents({"student_id": student_id}) == 12
+
+    # Undated payments come last and are still reached; claims that never succeeded are not payments
+    await db.payments.insert_many(
+        [{"payment_id": generate_id('pay_'), "student_id": student_id, "amount": 50.0, "status": "SUCCESS", "payment_date": None} for _ in range(3)]
+        + [{"payment_id": generate_id('pay_'), "student_id": student_id, "amount": 70.0, "status": "PROCESSING",
+            "payment_date": datetime(2025, 12, 20, tzinfo=timezone.utc)}]
+    )
+    page, cursor = await payment_history_page(db, student_id, limit=5)
+    assert [p["payment_date"].month for p in page] == [12, 11, 10, 9, 8]
+    seen = list(page)
+    while cursor:
+        page, cursor = await payment_history_page(db, student_id, limit=5, cursor=cursor)
+        seen += page
+    assert len(seen) == 15 and len({p["payment_id"] for p in seen}) == 15
+    assert all(p["status"] == "SUCCESS" for p in seen) and [p["payment_date"] for p in seen[-3:]] == [None] * 3
+
+    await db.payments.delete_many({"student_id": student_id})
+    await db.fee_tracking.delete_many({"tracking_id": tracking_id})
+
+
+@pytest.mark.asyncio
+async def test_history_endpoint_is_limited_to_linked_children(fresh_db, ac):
+    db = server_mod.db
+    user_id, parent_id = generate_id('user_'), generate_id('par_')
+    email = f"parent_{generate_id('t_')}@example.com"
+    await db.users.insert_one({"user_id": user_id, "email": email, "name": "Ravi", "role": "PARENT", "password": get_password_hash("parentpass"),
+                               "is_active": True, "created_at": get_current_timestamp()})
+    await db.parents.insert_one({"parent_id": parent_id, "user_id": user_id, "name": "Ravi", "email": email})
+    child, other = generate_id('stu_'), generate_id('stu_')
+    await db.parent_mapping.insert_one({"mapping_id": generate_id('map_'), "parent_id": parent_id, "student_id": child})
+
+    login = await ac.post('/api/auth/login', json={"email": email, "password": "parentpass"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    assert (await ac.get(f"/api/payments/student/{child}/history", headers=headers)).status_code == 200
+    assert (await ac.get(f"/api/payments/student/{other}/history", headers=headers)).status_code == 403
+
+    await db.parent_mapping.delete_many({"parent_id": parent_id})
+    await db.parents.delete_many({"parent_id": parent_id})
+    await db.users.delete_many({"user_id": user_id})
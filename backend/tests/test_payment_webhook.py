@@ -0,0 +1,108 @@
+import pytest
+import json
+import hmac
+import hashlib
+import server as server_mod
+from utils import generate_id, get_current_timestamp
+from fee_payments import ensure_payment_indexes
+from payment_events import ensure_payment_event_indexes, process_payment_events
+
+WEBHOOK_SECRET = "test_webhook_secret"
+
+
+@pytest.mark.asyncio
+async def test_webhook_events_are_queued_and_applied_once(monkeypatch, fresh_db, ac):
+    monkeypatch.setattr(server_mod, "razorpay_webhook_secret", WEBHOOK_SECRET)
+    db = server_mod.db
+    await ensure_payment_indexes(db)
+    await ensure_payment_event_indexes(db)
+
+    tracking_id = generate_id("track_")
+    await db.fee_tracking.insert_one({
+        "tracking_id": tracking_id,
+        "student_id": generate_id("stu_"),
+        "unique_student_id": f"SMS-TEST-{generate_id('u_')}",
+        "total_fee_amount": 1000.0,
+        "paid_amount": 0.0,
+        "pending_amount": 1000.0,
+        "payment_status": "PENDING",
+        "payment_history": [],
+        "created_at": get_current_timestamp(),
+        "updated_at": get_current_timestamp()
+    })
+
+    payment_id = f"pay_hook_{generate_id()}"
+    body = json.dumps({
+        "event": "payment.captured",
+        "payload": {"payment": {"entity": {
+            "id": payment_id,
+            "order_id": f"order_{payment_id}",
+            "amount": 40000,
+            "notes": {"tracking_id": tracking_id}
+        }}}
+    }).encode()
+    headers = {
+        "X-Razorpay-Signature": hmac.new(WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest(),
+        "X-Razorpay-Event-Id": f"evt_{payment_id}",
+        "Content-Type": "application/json"
+    }
+
+    # Bad signature is rejected without queueing anything
+    resp_bad = await ac.post('/api/payments/webhook', content=body, headers={**headers, "X-Razorpay-Signature": "bad"})
+    assert resp_bad.status_code == 400
+
+    # Razorpay redelivers the same event id; it is only queued once
+    for _ in range(2):
+        resp = await ac.post('/api/payments/webhook', content=body, headers=headers)
+        assert resp.status_code == 200
+    assert await db.payment_events.count_documents({"event_id": f"evt_{payment_id}"}) == 1
+
+    await process_payment_events(db)
+    fee_tracking = await db.fee_tracking.find_one({"tracking_id": tracking_id}, {"_id": 0})
+    assert fee_tracking["paid_amount"] == 400.0
+    assert fee_tracking["payment_status"] == "PARTIAL"
+    event = await db.payment_events.find_one({"event_id": f"evt_{payment_id}"})
+    assert event["status"] == "DONE"
+
+    await db.payment_events.delete_many({"event_id": f"evt_{payment_id}"})
+    await db.payments.delete_many({"razorpay_payment_id": payment_id})
+    await db.fee_tracking.delete_one({"tracking_id": tracking_id})
+
+
+def _signed(body: bytes) -> dict:
+    return {"X-Razorpay-Signature": hmac.new(WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest(), "Content-Type": "application/json"}
+
+
+@pytest.mark.asyncio
+async def test_webhook_rejects_signed_non_object_body(monkeypatch, ac):
+    monkeypatch.setattr(server_mod, "razorpay_webhook_secret", WEBHOOK_SECRET)
+    for body in (b"[1, 2]", b'"payment.captured"', b"null"):
+        resp = await ac.post('/api/payments/webhook', content=body, headers=_signed(body))
+        assert resp.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_event_from_a_dead_batch_is_still_credited_once(monkeypatch, fresh_db):
+    db = server_mod.db
+    await ensure_payment_indexes(db)
+    await ensure_payment_event_indexes(db)
+    tracking_id = generate_id("track_")
+    await db.fee_tracking.insert_one({"tracking_id": tracking_id, "student_id": generate_id("stu_"), "total_fee_amount": 1000.0, "paid_amount": 0.0})
+    payment_id = f"pay_hook_{generate_id()}"
+    # The earlier batch claimed the payment and died before crediting fee_tracking
+    await db.payments.insert_one({"payment_id": generate_id("pay_"), "razorpay_payment_id": payment_id, "amount": 400.0, "status": "PROCESSING",
+                                  "tracking_filter": {"tracking_id": tracking_id}, "created_at": get_current_timestamp()})
+    await db.payment_events.insert_one({
+        "event_id": f"evt_{payment_id}", "event": "payment.captured", "status": "PENDING", "attempts": 1, "received_at": get_current_timestamp(),
+        "payload": {"payment": {"entity": {"id": payment_id, "amount": 40000, "notes": {"tracking_id": tracking_id}}}}
+    })
+
+    await process_payment_events(db)
+    await db.payment_events.update_one({"event_id": f"evt_{payment_id}"}, {"$set": {"status": "PENDING"}})
+    await process_payment_events(db)
+    assert (await db.fee_tracking.find_one({"tracking_id": tracking_id}))["paid_amount"] == 400.0
+    assert (await db.payments.find_one({"razorpay_payment_id": payment_id}))["status"] == "SUCCESS"
+
+    await db.payment_events.delete_many({"event_id": f"evt_{payment_id}"})
+    await db.payments.delete_many({"razorpay_payment_id": payment_id})
+    await db.fee_tracking.delete_one({"tracking_id": tracking_id})
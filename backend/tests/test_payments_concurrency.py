@@ -0,0 +1,148 @@
+import pytest
+import asyncio
+import hmac
+import hashlib
+import server as server_mod
+from auth import get_password_hash
+from utils import generate_id, get_current_timestamp
+from datetime import datetime, timedelta, timezone
+from fee_payments import apply_verified_payment, credit_filter, credit_pipeline, ensure_payment_indexes, reconcile_processing_payments
+
+TEST_SECRET = "test_razorpay_secret"
+
+
+def _sign(order_id, payment_id):
+    return hmac.new(TEST_SECRET.encode(), f"{order_id}|{payment_id}".encode(), hashlib.sha256).hexdigest()
+
+
+@pytest.mark.asyncio
+async def test_parallel_verifications_are_atomic_and_idempotent(monkeypatch, fresh_db, ac):
+    monkeypatch.setattr(server_mod, "razorpay_key_secret", TEST_SECRET)
+    db = server_mod.db
+    await ensure_payment_indexes(db)
+
+    password = "parentpass"
+    parent_doc = {
+        "user_id": generate_id('user_'),
+        "email": f"parent_{generate_id('t_')}@example.com",
+        "name": "Parent Test",
+        "role": "PARENT",
+        "phone": None,
+        "password": get_password_hash(password),
+        "avatar": None,
+        "is_active": True,
+        "created_at": get_current_timestamp()
+    }
+    await db.users.insert_one(parent_doc)
+
+    unique_student_id = f"SMS-TEST-{generate_id('u_')}"
+    tracking_id = generate_id("track_")
+    await db.fee_tracking.insert_one({
+        "tracking_id": tracking_id,
+        "student_id": generate_id("stu_"),
+        "unique_student_id": unique_student_id,
+        "class_name": "5",
+        "section": "A",
+        "academic_year": "2025-2026",
+        "total_fee_amount": 10000.0,
+        "paid_amount": 0.0,
+        "pending_amount": 10000.0,
+        "payment_status": "PENDING",
+        "payment_history": [],
+        "created_at": get_current_timestamp(),
+        "updated_at": get_current_timestamp()
+    })
+
+    resp_login = await ac.post('/api/auth/login', json={"email": parent_doc["email"], "password": password})
+    assert resp_login.status_code == 200
+    headers = {"Authorization": f"Bearer {resp_login.json()['access_token']}"}
+
+    async def verify(payment_id):
+        order_id = f"order_{payment_id}"
+        return await ac.post('/api/fees/verify-payment-by-student-id', params={
+            "unique_student_id": unique_student_id,
+            "razorpay_order_id": order_id,
+            "razorpay_payment_id": payment_id,
+            "razorpay_signature": _sign(order_id, payment_id),
+            "amount": 50.0
+        }, headers=headers)
+
+    # 100 distinct payments plus a retry of each of the first 10, all in flight at once
+    payment_ids = [f"pay_stress_{generate_id()}" for _ in range(100)]
+    responses = await asyncio.gather(*[verify(pid) for pid in payment_ids + payment_ids[:10]])
+    assert all(r.status_code == 200 for r in responses)
+
+    fee_tracking = await db.fee_tracking.find_one({"tracking_id": tracking_id}, {"_id": 0})
+    assert fee_tracking["paid_amount"] == 5000.0
+    assert fee_tracking["pending_amount"] == 5000.0
+    assert fee_tracking["payment_status"] == "PARTIAL"
+    assert await db.payments.count_documents({"unique_student_id": unique_student_id, "status": "SUCCESS"}) == 100
+    # Keys are only kept while their claim is in flight, so the row does not grow with every payment
+    assert fee_tracking.get("applied_payment_ids") == []
+
+    await db.payments.delete_many({"unique_student_id": unique_student_id})
+    await db.fee_tracking.delete_one({"tracking_id": tracking_id})
+    await db.users.delete_one({"user_id": parent_doc["user_id"]})
+
+
+def test_credit_is_guarded_by_applied_payment_ids():
+    claim = {"payment_id": "pay_1", "razorpay_payment_id": "rzp_1", "amount": 100.0, "tracking_filter": {"unique_student_id": "SMS-1"}}
+    assert credit_filter(claim) == {"unique_student_id": "SMS-1", "applied_payment_ids": {"$ne": "rzp_1"}}
+    stage = credit_pipeline(claim, get_current_timestamp())[0]["$set"]
+    assert stage["applied_payment_ids"]["$concatArrays"][1] == [{"$literal": "rzp_1"}]
+
+
+@pytest.mark.asyncio
+async def test_claim_left_processing_is_credited_once_on_retry_and_by_reconcile(fresh_db):
+    db = server_mod.db
+    await ensure_payment_indexes(db)
+    tracking_id = generate_id("track_")
+    await db.fee_tracking.insert_one({"tracking_id": tracking_id, "student_id": generate_id("stu_"), "total_fee_amount": 1000.0, "paid_amount": 0.0})
+
+    # A verify call that died after claiming, before crediting
+    stale = {"payment_id": generate_id("pay_"), "razorpay_payment_id": f"rzp_{generate_id()}", "amount": 100.0,
+             "created_at": datetime.now(timezone.utc) - timedelta(hours=1)}
+    await db.payments.insert_one({**stale, "status": "PROCESSING", "tracking_filter": {"tracking_id": tracking_id}})
+    retry = {**stale, "payment_id": generate_id("pay_"), "created_at": get_current_timestamp()}
+    fee_tracking, applied = await apply_verified_payment(db, {"tracking_id": tracking_id}, retry)
+    assert applied and fee_tracking["paid_amount"] == 100.0
+    assert (await apply_verified_payment(db, {"tracking_id": tracking_id}, retry))[1] is False
+    assert (await db.payments.find_one({"payment_id": stale["payment_id"]}))["status"] == "SUCCESS"
+
+    # A claim leased by a live caller is left to that caller
+    leased = {"payment_id": generate_id("pay_"), "razorpay_payment_id": f"rzp_{generate_id()}", "amount": 25.0,
+              "created_at": datetime.now(timezone.utc) - timedelta(hours=1)}
+    await db.payments.insert_one({**leased, "status": "PROCESSING", "tracking_filter": {"tracking_id": tracking_id},
+                                  "credit_lease": "lease_other", "credit_lease_until": datetime.now(timezone.utc) + timedelta(minutes=1)})
+    assert await reconcile_processing_payments(db) == 0
+    await db.payments.delete_one({"payment_id": leased["payment_id"]})
+
+    orphan = {"payment_id": generate_id("pay_"), "razorpay_payment_id": f"rzp_{generate_id()}", "amount": 50.0,
+              "created_at": datetime.now(timezone.utc) - timedelta(hours=1)}
+    await db.payments.insert_one({**orphan, "status": "PROCESSING", "tracking_filter": {"tracking_id": tracking_id}})
+    assert await reconcile_processing_payments(db) == 1
+    assert await reconcile_processing_payments(db) == 0
+    row = await db.fee_tracking.find_one({"tracking_id": tracking_id})
+    assert (row["paid_amount"], row["applied_payment_ids"]) == (150.0, [])
+
+    await db.payments.delete_many({"tracking_filter.tracking_id": tracking_id})
+    await db.fee_tracking.delete_one({"tracking_id": tracking_id})
+
+
+@pytest.mark.asyncio
+async def test_payment_index_migration_archives_legacy_duplicates(fresh_db):
+    db = server_mod.db
+    await db.payments.drop_indexes()
+    razorpay_id = f"rzp_{generate_id()}"
+    await db.payments.insert_many([
+        {"payment_id": generate_id("pay_"), "razorpay_payment_id": razorpay_id, "status": status, "created_at": get_current_timestamp()}
+        for status in ("PENDING", "SUCCESS", "SUCCESS")
+    ])
+    await ensure_payment_indexes(db)
+    kept = await db.payments.find({"razorpay_payment_id": razorpay_id}).to_list(None)
+    assert [p["status"] for p in kept] == ["SUCCESS"]
+    archived = await db.payment_duplicates.find({"razorpay_payment_id": razorpay_id}).to_list(None)
+    assert len(archived) == 2 and all(a["duplicate_of"] == kept[0]["_id"] for a in archived)
+
+    await db.payments.delete_many({"razorpay_payment_id": razorpay_id})
+    await db.payment_duplicates.delete_many({"razorpay_payment_id": razorpay_id})
@@ -0,0 +1,58 @@
+import pytest
+import server as server_mod
+from auth import get_password_hash
+from fee_summary import sync_fee_summaries
+from query_filters import STUDENT_FILTERS, build_filter, parse_sort
+from utils import generate_id, get_current_timestamp
+
+
+def test_filter_grammar():
+    query = build_filter(STUDENT_FILTERS, {"class_name": "7", "payment_status": "partial,PENDING", "min_pending": "100", "max_pending": 900})
+    assert query == {"class_name": "7", "payment_status": {"$in": ["PARTIAL", "PENDING"]}, "pending_amount": {"$gte": 100.0, "$lte": 900.0}}
+    with pytest.raises(ValueError):
+        build_filter(STUDENT_FILTERS, {"payment_status": "LATE"})
+    assert parse_sort({"name": "name"}, "-name", "student_id") == [("name", -1), ("student_id", -1)]
+    with pytest.raises(ValueError):
+        parse_sort({"name": "name"}, "password", "student_id")
+
+
+@pytest.mark.asyncio
+async def test_students_filtered_by_payment_and_sorted_by_pending(fresh_db, ac):
+    db = server_mod.db
+    admin_email = f"admin_{generate_id('t_')}@example.com"
+    await db.users.insert_one({
+        "user_id": generate_id('user_'),
+        "email": admin_email,
+        "name": "Admin Test",
+        "role": "ADMIN",
+        "password": get_password_hash("adminpass"),
+        "is_active": True,
+        "created_at": get_current_timestamp()
+    })
+    resp_login = await ac.post('/api/auth/login', json={"email": admin_email, "password": "adminpass"})
+    headers = {"Authorization": f"Bearer {resp_login.json()['access_token']}"}
+
+    class_name = f"T{generate_id('c_')}"
+    rows = [("Asha", "PARTIAL", 400.0), ("Bala", "PARTIAL", 900.0), ("Chitra", "PAID", 0.0), ("Dev", "PENDING", 1000.0)]
+    students, trackings = [], []
+    for name, status, pending in rows:
+        student_id = generate_id('stu_')
+        students.append({"student_id": student_id, "name": name, "class_name": class_name, "section": "B"})
+        trackings.append({"tracking_id": generate_id('track_'), "student_id": student_id, "class_name": class_name, "section": "B",
+                          "payment_status": status, "pending_amount": pending, "paid_amount": 1000.0 - pending, "total_fee_amount": 1000.0})
+    await db.students.insert_many(students)
+    await db.fee_tracking.insert_many(trackings)
+    await sync_fee_summaries(db, student_ids=[s["student_id"] for s in students])
+
+    params = {"class_name": class_name, "section": "B", "payment_status": "PARTIAL", "sort": "-pending_amount"}
+    resp = await ac.get('/api/students', params=params, headers=headers)
+    assert [(s["name"], s["pending_amount"]) for s in resp.json()["items"]] == [("Bala", 900.0), ("Asha", 400.0)]
+
+    resp = await ac.get('/api/students', params={"class_name": class_name, "sort": "-name", "limit": 2}, headers=headers)
+    assert [(s["name"], s["payment_status"]) for s in resp.json()["items"]] == [("Dev", "PENDING"), ("Chitra", "PAID")]
+
+    resp = await ac.get('/api/students', params={"sort": "password"}, headers=headers)
+    assert resp.status_code == 400
+
+    await db.students.delete_many({"class_name": class_name})
+    await db.fee_tracking.delete_many({"class_name": class_name})
@@ -0,0 +1,53 @@
+import pytest
+import asyncio
+import server as server_mod
+from utils import generate_id
+from counters import SectionFullError, release_roll_numbers, reserve_roll_numbers, reserve_available_roll_numbers, seed_roll_counters
+
+
+@pytest.mark.asyncio
+async def test_concurrent_reservations_get_distinct_numbers_up_to_capacity(fresh_db):
+    db = server_mod.db
+    year = f"test-{generate_id('y_')}"
+
+    async def take_one():
+        try:
+            return (await reserve_roll_numbers(db, year, "4", "A"))[0]
+        except SectionFullError:
+            return None
+
+    results = await asyncio.gather(*[take_one() for _ in range(30)])
+    assigned = [r for r in results if r is not None]
+    assert sorted(assigned) == list(range(1, 21))
+    assert results.count(None) == 10
+
+    other_year = f"test-{generate_id('y_')}"
+    assert list(await reserve_roll_numbers(db, other_year, "4", "A", count=15)) == list(range(1, 16))
+    assert list(await reserve_available_roll_numbers(db, other_year, "4", "A", count=10)) == list(range(16, 21))
+    assert list(await reserve_available_roll_numbers(db, other_year, "4", "A", count=3)) == []
+
+    await db.counters.delete_many({"academic_year": {"$in": [year, other_year]}})
+
+
+@pytest.mark.asyncio
+async def test_released_numbers_are_reused_and_capacity_follows_the_roster(fresh_db):
+    db = server_mod.db
+    year = f"test-{generate_id('y_')}"
+    assert await reserve_roll_numbers(db, year, "6", "B", count=20) == list(range(1, 21))
+    with pytest.raises(SectionFullError):
+        await reserve_roll_numbers(db, year, "6", "B")
+
+    # A deleted student and a failed insert free their numbers; the lowest free ones come back first
+    await release_roll_numbers(db, year, "6", "B", ["7", 12])
+    assert await reserve_available_roll_numbers(db, year, "6", "B", count=5) == [7, 12]
+
+    # Rebuilding from the roster drops numbers nobody holds any more
+    await db.students.insert_many([
+        {"student_id": generate_id("stu_"), "unique_student_id": f"U-{n}", "academic_year": year, "class_name": "6", "section": "B", "roll_number": str(n)}
+        for n in (2, 5)
+    ])
+    await seed_roll_counters(db)
+    assert await reserve_roll_numbers(db, year, "6", "B", count=2) == [1, 3]
+
+    await db.students.delete_many({"academic_year": year})
+    await db.counters.delete_many({"academic_year": year})
@@ -0,0 +1,107 @@
+import pytest
+from datetime import datetime, timezone
+import server as server_mod
+from jobs import create_job, run_job, get_job
+from rollover import estimate_rollover, run_rollover
+from utils import current_academic_year, next_academic_year, generate_id, get_current_timestamp
+
+
+def test_academic_year_starts_in_april():
+    assert current_academic_year(datetime(2026, 3, 31, tzinfo=timezone.utc)) == "2025-2026"
+    assert current_academic_year(datetime(2026, 4, 1, tzinfo=timezone.utc)) == "2026-2027"
+    assert next_academic_year("2025-2026") == "2026-2027"
+
+
+@pytest.mark.asyncio
+async def test_rollover_promotes_graduates_and_is_safe_to_rerun(fresh_db):
+    db = server_mod.db
+    from_year, to_year = "2091-2092", "2092-2093"
+    students = []
+    for class_name, names in (("9", ["Zoya", "Arjun"]), ("10", ["Meera"])):
+        for roll, name in enumerate(names, start=1):
+            students.append({
+                "student_id": generate_id('stu_'),
+                "unique_student_id": f"SMS-TEST-{generate_id('u_')}",
+                "name": name,
+                "class_name": class_name,
+                "section": "C",
+                "roll_number": str(roll),
+                "academic_year": from_year,
+                "created_at": get_current_timestamp()
+            })
+    await db.students.insert_many(students)
+    await db.fee_tracking.insert_many([{
+        "tracking_id": generate_id('track_'),
+        "student_id": s["student_id"],
+        "academic_year": from_year,
+        "total_fee_amount": 1000.0,
+        "paid_amount": 400.0,
+        "pending_amount": 600.0
+    } for s in students])
+    await db.fee_structures.insert_one({"fee_id": generate_id('fee_'), "class_id": "10", "section": "C", "tuition_fee": 9000.0})
+
+    estimate = await estimate_rollover(db, from_year, to_year)
+    assert (estimate["students_promoted"], estimate["students_graduating"]) == (2, 1)
+    assert estimate["fee_tracking_to_archive"] == 3
+    assert estimate["fee_tracking_to_create"] == 2
+
+    job = await create_job(db, "academic_rollover", {"from_year": from_year, "to_year": to_year})
+    await run_job(db, job["job_id"], run_rollover)
+    finished = await get_job(db, job["job_id"])
+    assert finished["status"] == "DONE"
+    assert finished["result"]["promoted"] == 2 and finished["result"]["graduated"] == 1
+
+    promoted = await db.students.find({"academic_year": to_year, "class_name": "10", "section": "C"}).sort("roll_number", 1).to_list(None)
+    assert [(s["name"], s["roll_number"]) for s in promoted] == [("Arjun", "1"), ("Zoya", "2")]
+    graduate = await db.students.find_one({"student_id": students[2]["student_id"]})
+    assert graduate["status"] == "GRADUATED" and "class_name" not in graduate
+    ids = [s["student_id"] for s in students]
+    assert await db.fee_tracking_archive.count_documents({"student_id": {"$in": ids}}) == 3
+    new_rows = await db.fee_tracking.find({"student_id": {"$in": ids}}).to_list(None)
+    assert len(new_rows) == 2 and all(r["total_fee_amount"] == 9000.0 and r["academic_year"] == to_year for r in new_rows)
+
+    # A second run finds nothing left to move
+    job = await create_job(db, "academic_rollover", {"from_year": from_year, "to_year": to_year})
+    await run_job(db, job["job_id"], run_rollover)
+    assert (await get_job(db, job["job_id"]))["result"]["promoted"] == 0
+    assert await db.fee_tracking.count_documents({"student_id": {"$in": ids}}) == 2
+
+    await db.fee_tracking.delete_many({"student_id": {"$in": ids}})
+    await db.fee_tracking_archive.delete_many({"student_id": {"$in": ids}})
+    await db.counters.delete_many({"academic_year": to_year})
+
+
+@pytest.mark.asyncio
+async def test_rollover_finishes_fees_of_students_moved_by_an_interrupted_run(fresh_db):
+    db = server_mod.db
+    from_year, to_year = "2093-2094", "2094-2095"
+    student = {
+        "student_id": generate_id('stu_'),
+        "unique_student_id": f"SMS-TEST-{generate_id('u_')}",
+        "name": "Kabir",
+        "class_name": "5",
+        "section": "A",
+        "roll_number": "1",
+        "academic_year": to_year,
+        "promotion": {"from_year": from_year, "class_name": "4", "section": "A", "roll_number": "3", "fees_pending": True},
+        "created_at": get_current_timestamp()
+    }
+    await db.students.insert_one(student)
+    await db.fee_tracking.insert_one({
+        "tracking_id": generate_id('track_'), "student_id": student["student_id"], "academic_year": from_year,
+        "total_fee_amount": 1000.0, "paid_amount": 1000.0, "pending_amount": 0.0
+    })
+    await db.fee_structures.insert_one({"fee_id": generate_id('fee_'), "class_id": "5", "section": "A", "tuition_fee": 5000.0})
+
+    job = await create_job(db, "academic_rollover", {"from_year": from_year, "to_year": to_year})
+    await run_job(db, job["job_id"], run_rollover)
+    assert (await get_job(db, job["job_id"]))["status"] == "DONE"
+
+    rows = await db.fee_tracking.find({"student_id": student["student_id"]}).to_list(None)
+    assert [(r["academic_year"], r["total_fee_amount"]) for r in rows] == [(to_year, 5000.0)]
+    assert await db.fee_tracking_archive.count_documents({"student_id": student["student_id"]}) == 1
+    assert "fees_pending" not in (await db.students.find_one({"student_id": student["student_id"]}))["promotion"]
+
+    await db.students.delete_many({"student_id": student["student_id"]})
+    await db.fee_tracking.delete_many({"student_id": student["student_id"]})
+    await db.fee_tracking_archive.delete_many({"student_id": student["student_id"]})
@@ -0,0 +1,112 @@
+import pytest
+import io
+import server as server_mod
+from auth import get_password_hash
+from utils import generate_id, get_current_timestamp
+from student_import import iter_student_rows
+
+
+def test_csv_and_xlsx_rows_are_normalized():
+    csv_bytes = b"\xef\xbb\xbfName,Email,Class,Section,DOB\nAsha,ASHA@example.com,5,a,2015-04-01\n"
+    rows = list(iter_student_rows(io.BytesIO(csv_bytes), "students.csv"))
+    assert rows == [{"name": "Asha", "email": "ASHA@example.com", "class_name": "5", "section": "a", "date_of_birth": "2015-04-01"}]
+
+    openpyxl = pytest.importorskip("openpyxl")
+    workbook = openpyxl.Workbook()
+    workbook.active.append(["Name", "Email", "Class", "Section"])
+    workbook.active.append(["Ravi", "ravi@example.com", 7.0, "B"])
+    workbook.active.append([None, None, None, None])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    buffer.seek(0)
+    assert list(iter_student_rows(buffer, "students.xlsx")) == [{"name": "Ravi", "email": "ravi@example.com", "class_name": "7", "section": "B"}]
+
+
+@pytest.mark.asyncio
+async def test_bulk_import_creates_accounts_and_reports_bad_rows(fresh_db, ac):
+    db = server_mod.db
+    admin_email = f"admin_{generate_id('t_')}@example.com"
+    await db.users.insert_one({
+        "user_id": generate_id('user_'),
+        "email": admin_email,
+        "name": "Admin Test",
+        "role": "ADMIN",
+        "password": get_password_hash("adminpass"),
+        "is_active": True,
+        "created_at": get_current_timestamp()
+    })
+    resp_login = await ac.post('/api/auth/login', json={"email": admin_email, "password": "adminpass"})
+    headers = {"Authorization": f"Bearer {resp_login.json()['access_token']}"}
+
+    tag = generate_id('imp_')
+    lines = ["name,email,class_name,section,admission_number"]
+    lines += [f"Student {i},{tag}_{i}@example.com,3,B,ADM-{tag}-{i}" for i in range(5)]
+    lines.append(f"Dup,{tag}_0@example.com,3,B,ADM-dup")
+    lines.append(f"Bad class,{tag}_bad@example.com,11,B,ADM-bad")
+    files = {"file": ("students.csv", "\n".join(lines).encode(), "text/csv")}
+
+    resp = await ac.post('/api/admin/students/import', files=files, headers=headers)
+    assert resp.status_code == 200
+    report = resp.json()
+    assert report["total_rows"] == 7
+    assert report["imported"] == 5
+    assert sorted(e["row"] for e in report["errors"]) == [7, 8]
+    assert len({c["unique_student_id"] for c in report["created"]}) == 5
+
+    emails = [f"{tag}_{i}@example.com" for i in range(5)]
+    assert await db.users.count_documents({"email": {"$in": emails}, "role": "STUDENT"}) == 5
+    assert await db.students.count_documents({"email": {"$in": emails}, "class_name": "3", "section": "B"}) == 5
+
+    student_ids = [c["student_id"] for c in report["created"]]
+    await db.fee_tracking.delete_many({"student_id": {"$in": student_ids}})
+    await db.students.delete_many({"student_id": {"$in": student_ids}})
+    await db.users.delete_many({"email": {"$in": emails + [admin_email]}})
+
+
+@pytest.mark.asyncio
+async def test_imported_account_without_password_is_activated_only_by_its_invite(fresh_db, ac):
+    db = server_mod.db
+    admin_email = f"admin_{generate_id('t_')}@example.com"
+    await db.users.insert_one({
+        "user_id": generate_id('user_'),
+        "email": admin_email,
+        "name": "Admin Test",
+        "role": "ADMIN",
+        "password": get_password_hash("adminpass"),
+        "is_active": True,
+        "created_at": get_current_timestamp()
+    })
+    resp_login = await ac.post('/api/auth/login', json={"email": admin_email, "password": "adminpass"})
+    headers = {"Authorization": f"Bearer {resp_login.json()['access_token']}"}
+
+    tag = generate_id('inv_')
+    csv = f"name,email,class_name,section,password\nInvited,{tag}_a@example.com,4,C,\nWith Password,{tag}_b@example.com,4,C,secret123\n"
+    resp = await ac.post('/api/admin/students/import', files={"file": ("students.csv", csv.encode(), "text/csv")}, headers=headers)
+    assert resp.status_code == 200
+    created = {c["email"]: c for c in resp.json()["created"]}
+    token = created[f"{tag}_a@example.com"]["invite_token"]
+    assert "invite_token" not in created[f"{tag}_b@example.com"]
+    assert (await ac.post('/api/auth/login', json={"email": f"{tag}_b@example.com", "password": "secret123"})).status_code == 200
+
+    invited = await db.users.find_one({"email": f"{tag}_a@example.com"})
+    assert invited["password"] is None and invited["invite_token_hash"] != token
+
+    # Knowing the email is not enough, and the account is neither listed nor approvable as pending
+    resp = await ac.post('/api/auth/register', json={"email": f"{tag}_a@example.com", "password": "hijack", "name": "X", "role": "STUDENT"})
+    assert resp.status_code == 400
+    pending = (await ac.get('/api/admin/users/pending', headers=headers)).json()
+    assert invited["user_id"] not in {u["user_id"] for u in pending}
+    resp = await ac.post('/api/admin/users/approve', json={"user_ids": [invited["user_id"]]}, headers=headers)
+    assert resp.json()["results"] == [{"user_id": invited["user_id"], "status": "awaiting_invite"}]
+    assert (await db.users.find_one({"user_id": invited["user_id"]}))["is_active"] is False
+
+    resp = await ac.post('/api/auth/accept-invite', json={"token": token, "password": "mine123"})
+    assert resp.status_code == 200
+    assert resp.json()["user"]["email"] == f"{tag}_a@example.com"
+    assert (await ac.post('/api/auth/accept-invite', json={"token": token, "password": "again"})).status_code == 400
+    assert (await ac.post('/api/auth/login', json={"email": f"{tag}_a@example.com", "password": "mine123"})).status_code == 200
+
+    student_ids = [c["student_id"] for c in created.values()]
+    await db.fee_tracking.delete_many({"student_id": {"$in": student_ids}})
+    await db.students.delete_many({"student_id": {"$in": student_ids}})
+    await db.users.delete_many({"email": {"$in": list(created) + [admin_email]}})
@@ -0,0 +1,59 @@
+import pytest
+import server as server_mod
+import student_search
+from student_search import exact_query_keys, query_terms, rank, search_students, search_terms
+from utils import generate_id
+
+
+def test_terms_cover_name_id_admission_and_email_prefixes():
+    terms = set(search_terms({
+        "name": "José Ramírez", "unique_student_id": "SMS-2026-10A-001",
+        "admission_number": "ADM/2026/77", "email": "jose.r@example.com"
+    }))
+    assert {"j", "jos", "jose", "ramirez", "sms202610a", "10a", "adm2026", "jose.r@ex", "r"} <= terms
+    assert "example" not in terms  # email domains would match every student
+    assert query_terms("SMS-2026-10A  José") == ["sms202610a", "jose"]
+
+    assert {"=sms202610a001", "=adm202677", "=jose.r@example.com"} <= terms
+    assert exact_query_keys("ADM/2026/77") == ["=adm202677"]
+    assert exact_query_keys("Jose.R@example.com") == ["=joserexamplecom", "=jose.r@example.com"]
+
+    exact = {"name": "Zara", "unique_student_id": "SMS-2026-10A-001"}
+    by_name = {"name": "Sms Kumar", "unique_student_id": "SMS-2026-10A-002"}
+    assert rank(exact, "sms-2026-10a-001") < rank(by_name, "sms-2026-10a-001")
+
+
+@pytest.mark.asyncio
+async def test_search_matches_prefixes_and_ranks(fresh_db):
+    db = server_mod.db
+    tag = generate_id('q')
+    students = [
+        {"student_id": generate_id('stu_'), "name": f"Aarav {tag}", "unique_student_id": f"SMS-{tag}-01", "email": "aarav@example.com"},
+        {"student_id": generate_id('stu_'), "name": f"{tag} Sharma", "unique_student_id": f"SMS-{tag}-02", "email": "sharma@example.com"},
+        {"student_id": generate_id('stu_'), "name": "Other Person", "unique_student_id": "SMS-0000-01", "email": "other@example.com"},
+    ]
+    await db.students.insert_many([{**s, "search_terms": search_terms(s)} for s in students])
+
+    results = await search_students(db, tag[:6])
+    assert [r["name"] for r in results] == [f"{tag} Sharma", f"Aarav {tag}"]
+    assert [r["student_id"] for r in await search_students(db, f"aar {tag}")] == [students[0]["student_id"]]
+    assert (await search_students(db, f"SMS-{tag}-02"))[0]["student_id"] == students[1]["student_id"]
+
+    await db.students.delete_many({"student_id": {"$in": [s["student_id"] for s in students]}})
+
+
+@pytest.mark.asyncio
+async def test_exact_match_survives_the_candidate_limit_and_parents_see_only_their_children(fresh_db, monkeypatch):
+    db = server_mod.db
+    monkeypatch.setattr(student_search, "CANDIDATE_LIMIT", 3)
+    tag = generate_id('x')
+    students = [{"student_id": generate_id('stu_'), "name": f"{tag} Pupil {i}", "admission_number": f"ADM-{i}"} for i in range(6)]
+    # Every name starts with the tag, but only the last student has it as admission number
+    students[5]["admission_number"] = tag
+    await db.students.insert_many([{**s, "search_terms": search_terms(s)} for s in students])
+
+    results = await search_students(db, tag)
+    assert results[0]["student_id"] == students[5]["student_id"]
+    assert [r["student_id"] for r in await search_students(db, tag, student_ids=[students[1]["student_id"]])] == [students[1]["student_id"]]
+
+    await db.students.delete_many({"student_id": {"$in": [s["student_id"] for s in students]}})
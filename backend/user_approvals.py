@@ -0,0 +1,159 @@
+"""Approve or reject many pending accounts with a fixed number of queries.
+
+Users are read with one $in query, activated or removed with update_many /
+delete_many (only accounts still pending are ever removed), and missing role profiles are created with one insert_many per
+role. Emails are not sent here; callers get back the addresses to notify.
+
+Imported accounts without a password are never approved here: they become
+active only through their invite (invites.py), and are reported as
+"awaiting_invite".
+"""
+from pymongo.errors import BulkWriteError
+
+from admin_search import contact_search_terms
+from fee_summary import SUMMARY_DEFAULTS
+from student_search import search_terms
+from utils import current_academic_year, generate_id, get_current_timestamp
+
+PROFILE_COLLECTIONS = {"STUDENT": "students", "FACULTY": "faculty", "PARENT": "parents"}
+
+
+def _student_profile(user, timestamp):
+    profile = {
+        "student_id": generate_id("stu_"),
+        "unique_student_id": "PENDING",
+        "user_id": user["user_id"],
+        "name": user.get("name"),
+        "email": user.get("email"),
+        "class_name": None,
+        "section": None,
+        "roll_number": None,
+        "admission_number": None,
+        "admission_date": timestamp,
+        "date_of_birth": None,
+        "gender": None,
+        "blood_group": None,
+        "aadhaar_id": None,
+        "student_photo_url": None,
+        "address": None,
+        "academic_year": current_academic_year(),
+        "previous_school": None,
+        "previous_class": None,
+        "is_active": True,
+        **SUMMARY_DEFAULTS,
+        "created_at": timestamp
+    }
+    profile["search_terms"] = search_terms(profile)
+    return profile
+
+
+def _faculty_profile(user, timestamp):
+    profile = {
+        "faculty_id": generate_id("fac_"),
+        "user_id": user["user_id"],
+        "name": user.get("name"),
+        "email": user.get("email"),
+        "subject": "General",
+        "qualification": None,
+        "joining_date": timestamp,
+        "phone": user.get("phone"),
+        "is_active": True,
+        "created_at": timestamp
+    }
+    profile["search_terms"] = contact_search_terms("faculty", profile)
+    return profile
+
+
+def _parent_profile(user, timestamp):
+    profile = {
+        "parent_id": generate_id("par_"),
+        "user_id": user["user_id"],
+        "name": user.get("name"),
+        "email": user.get("email"),
+        "phone": user.get("phone"),
+        "is_active": True,
+        "created_at": timestamp
+    }
+    profile["search_terms"] = contact_search_terms("parents", profile)
+    return profile
+
+
+PROFILE_BUILDERS = {"STUDENT": _student_profile, "FACULTY": _faculty_profile, "PARENT": _parent_profile}
+
+
+async def _load_users(db, user_ids):
+    users = await db.users.find(
+        {"user_id": {"$in": list(user_ids)}}, {"_id": 0, "user_id": 1, "email": 1, "name": 1, "role": 1, "phone": 1, "is_active": 1, "password": 1}
+    ).to_list(len(user_ids))
+    return {user["user_id"]: user for user in users}
+
+
+async def _create_missing_profiles(db, users):
+    """One lookup and one insert_many per role for users without a profile yet"""
+    timestamp = get_current_timestamp()
+    for role, collection_name in PROFILE_COLLECTIONS.items():
+        role_users = [user for user in users if user.get("role") == role]
+        if not role_users:
+            continue
+        collection = db[collection_name]
+        existing = await collection.find(
+            {"user_id": {"$in": [user["user_id"] for user in role_users]}}, {"_id": 0, "user_id": 1}
+        ).to_list(len(role_users))
+        have_profile = {profile["user_id"] for profile in existing}
+        docs = [PROFILE_BUILDERS[role](user, timestamp) for user in role_users if user["user_id"] not in have_profile]
+        if not docs:
+            continue
+        try:
+            await collection.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            # A concurrent approval created the profile first
+            if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                raise
+
+
+async def approve_users(db, user_ids):
+    """Returns (results, emails): one {user_id, status} per requested ID and the addresses to notify"""
+    user_ids = list(dict.fromkeys(user_ids))
+    users = await _load_users(db, user_ids)
+    approvable = {user_id: user for user_id, user in users.items() if user.get("password")}
+    if approvable:
+        await db.users.update_many({"user_id": {"$in": list(approvable)}, "password": {"$ne": None}}, {"$set": {"is_active": True}})
+        await _create_missing_profiles(db, approvable.values())
+
+    results = []
+    for user_id in user_ids:
+        user = users.get(user_id)
+        if not user:
+            results.append({"user_id": user_id, "status": "not_found"})
+        elif user_id not in approvable:
+            results.append({"user_id": user_id, "status": "awaiting_invite"})
+        else:
+            results.append({"user_id": user_id, "status": "already_active" if user.get("is_active") else "approved"})
+    emails = [users[r["user_id"]]["email"] for r in results if r["status"] == "approved" and users[r["user_id"]].get("email")]
+    return results, emails
+
+
+async def reject_users(db, user_ids):
+    """
+    Delete pending accounts (is_active False, including those awaiting their
+    invite) and their role profiles; active accounts are left alone and
+    reported as "already_active". Returns (results, emails) like approve_users.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    users = await _load_users(db, user_ids)
+    pending = {user_id: user for user_id, user in users.items() if user.get("is_active") is False}
+    if pending:
+        await db.users.delete_many({"user_id": {"$in": list(pending)}, "is_active": False})
+        for role, collection_name in PROFILE_COLLECTIONS.items():
+            role_ids = [user_id for user_id, user in pending.items() if user.get("role") == role]
+            if role_ids:
+                await db[collection_name].delete_many({"user_id": {"$in": role_ids}})
+
+    results = []
+    for user_id in user_ids:
+        if user_id not in users:
+            results.append({"user_id": user_id, "status": "not_found"})
+        else:
+            results.append({"user_id": user_id, "status": "rejected" if user_id in pending else "already_active"})
+    emails = [user["email"] for user in pending.values() if user.get("email")]
+    return results, emails
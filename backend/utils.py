@@ -4,13 +4,63 @@ from datetime import datetime, timezone
 def generate_id(prefix: str = "") -> str:
     return f"{prefix}{uuid.uuid4().hex[:12]}"
 
-def get_current_timestamp() -> str:
-    return datetime.now(timezone.utc).isoformat()
+def get_current_timestamp() -> datetime:
+    """Current UTC time as stored in Mongo (BSON dates keep milliseconds, so the rest is dropped up front)"""
+    now = datetime.now(timezone.utc)
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+def parse_timestamp(value):
+    """ISO string (or naive/aware datetime) -> aware UTC datetime; None stays None"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+def day_start(day: str) -> datetime:
+    """"YYYY-MM-DD" -> midnight UTC of that day; ValueError for anything else"""
+    return datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+
+def current_academic_year(today: datetime = None) -> str:
+    """Academic years run April to March, e.g. "2025-2026" from April 2025"""
+    today = today or datetime.now(timezone.utc)
+    start = today.year if today.month >= 4 else today.year - 1
+    return f"{start}-{start + 1}"
+
+def academic_year_of(day) -> str:
+    """Academic year a date falls in; takes a datetime or a "YYYY-MM-DD..." string (ValueError otherwise)"""
+    if isinstance(day, datetime):
+        return current_academic_year(day)
+    return current_academic_year(datetime.strptime(str(day)[:10], "%Y-%m-%d"))
+
+def next_academic_year(academic_year: str) -> str:
+    start = int(academic_year.split("-")[0])
+    return f"{start + 1}-{start + 2}"
+
+def fee_structure_total(fee_structure: dict) -> float:
+    return (
+        fee_structure.get("tuition_fee", 0) +
+        fee_structure.get("exam_fee", 0) +
+        fee_structure.get("lab_fee", 0) +
+        fee_structure.get("transport", 0) -
+        fee_structure.get("scholarship", 0)
+    )
 
 def calculate_percentage(obtained: float, total: float) -> float:
     if total == 0:
         return 0.0
     return round((obtained / total) * 100, 2)
+
+# CBSE-style grade bands: (minimum percentage, grade)
+GRADE_BANDS = [(91, "A1"), (81, "A2"), (71, "B1"), (61, "B2"), (51, "C1"), (41, "C2"), (33, "D")]
+
+def calculate_grade(obtained: float, total: float) -> str:
+    percentage = calculate_percentage(obtained, total)
+    for minimum, grade in GRADE_BANDS:
+        if percentage >= minimum:
+            return grade
+    return "E"
+
 def generate_student_id(class_name: str, section: str, roll_number: int) -> str:
     """
     Generate unique student ID in format: SMS-YYYY-CLASS+SECTION-ROLL